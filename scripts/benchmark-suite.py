@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+提取與渲染效能基準測試：以 PyMuPDF 在本機產生合成 PDF（頁數、中英文比例、表格密度）
+與不同規模的合成分析 JSON，量測 extract-text.py 與 render-report.py 各階段的
+耗時、每秒頁數與峰值記憶體，輸出機器可讀的結果；compare 對照基準結果標出退步。
+
+用法：
+  python benchmark-suite.py run                               # 預設矩陣，結果寫入 bench-results.json
+  python benchmark-suite.py run --quick                       # 只跑 20 頁與小型 JSON（約一分鐘）
+  python benchmark-suite.py run --pages 50,200 --mix cjk,mixed --tables 0,0.5 --profiles fast
+  python benchmark-suite.py run --only render --sizes small,large --repeat 20
+  python benchmark-suite.py run -o after.json --baseline before.json   # 跑完直接對照基準
+  python benchmark-suite.py compare after.json before.json --threshold 0.15
+
+每個案例（合成檔 × 階段 × profile）在獨立的子行程執行，峰值記憶體（peak RSS）互不影響；
+耗時取 --repeat 次的中位數。合成檔依規格快取於 --work-dir，規格不變時不重新產生。
+extract 與分塊一律停用提取快取、不經 gateway，只量測本機轉換。
+
+比對規則：中位耗時增加超過 --threshold（預設 0.2，即 20%）且差距超過 --min-seconds，
+或峰值記憶體增加超過 --rss-threshold 時視為退步；有退步時結束碼為 1。
+
+輸出：JSON 至 stdout（run 另寫入 --output）
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+RESULTS_VERSION = 1
+FIXTURE_VERSION = 1  # 合成檔產生規則改變時遞增，舊快取自動失效
+DEFAULT_WORK_DIR = Path(tempfile.gettempdir()) / "crisp-reading-bench"
+
+PDF_STAGES = ("get_pdf_info", "get_toc", "extract_via_pymupdf", "chunk_extract")
+PROFILE_STAGES = ("extract_via_pymupdf", "chunk_extract")  # 依 --profiles 各跑一次
+ANALYSIS_SIZES = {"small": 1, "medium": 4, "large": 16}
+MIXES = ("latin", "cjk", "mixed")
+QUICK = {"pages": [20], "sizes": ["small"], "profiles": ["faithful", "fast"]}
+
+LATIN_WORDS = (
+    "reading attention argument evidence concept model theory practice habit system "
+    "knowledge memory author chapter example method question answer network signal "
+    "structure culture history economy science design learning decision value change"
+).split()
+CJK_TEXT = (
+    "閱讀是一種主動的思考過程讀者必須持續提問並檢驗作者的論點與證據"
+    "知識的價值在於連結概念之間的關係往往比單一概念本身更重要"
+    "好的書會改變我們看世界的方式而批判的閱讀讓這種改變有所依據"
+    "實踐需要情境與行動兩者缺一不可否則理解只停留在紙上"
+)
+
+
+def _load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, SCRIPTS_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _package_version(name):
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+# ── 合成檔 ─────────────────────────────────────────────
+
+def _latin_line(rng, width=82):
+    words = []
+    while sum(len(w) + 1 for w in words) < width:
+        words.append(rng.choice(LATIN_WORDS))
+    return " ".join(words).capitalize() + "."
+
+
+def _cjk_line(rng, width=40):
+    start = rng.randrange(len(CJK_TEXT) - width)
+    return CJK_TEXT[start:start + width]
+
+
+def _draw_table(page, rng, top, rows=5, cols=4, latin=True):
+    """畫一個有框線的表格（每條格線一個 drawing，足以讓 balanced 判定走完整版面分析）"""
+    left, width, row_height = 72, 451, 18
+    col_width = width / cols
+    for r in range(rows + 1):
+        y = top + r * row_height
+        page.draw_line((left, y), (left + width, y), width=0.5)
+    for c in range(cols + 1):
+        x = left + c * col_width
+        page.draw_line((x, top), (x, top + rows * row_height), width=0.5)
+    for r in range(rows):
+        for c in range(cols):
+            text = rng.choice(LATIN_WORDS) if latin else _cjk_line(rng, 4)
+            if r and c:
+                text = f"{rng.randint(1, 999)}"
+            page.insert_text(
+                (left + c * col_width + 4, top + r * row_height + 13), text,
+                fontsize=9, fontname="helv" if latin else "china-t",
+            )
+    return top + rows * row_height + 18
+
+
+def generate_pdf(path, pages, mix="latin", tables=0.0, seed=0):
+    """產生合成 PDF：每 10 頁一章（附目錄），每頁書眉、頁碼與約 40 行內文；
+    mix 為 latin / cjk / mixed（逐行交錯），tables 為含表格頁面的比例。
+    """
+    import pymupdf
+
+    rng = random.Random(f"{seed}-{pages}-{mix}-{tables}")
+    doc = pymupdf.open()
+    toc = []
+    for n in range(pages):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 40), "Synthetic Benchmark Book", fontsize=8)
+        y = 80
+        if n % 10 == 0:
+            chapter = n // 10 + 1
+            title = f"第{chapter}章 閱讀與思考" if mix == "cjk" else f"Chapter {chapter}: Reading"
+            page.insert_text((72, y), title, fontsize=20, fontname="china-t")
+            toc.append([1, title, n + 1])
+            y += 40
+        if tables and rng.random() < tables:
+            y = _draw_table(page, rng, y, latin=mix != "cjk")
+        line = 0
+        while y < 780:
+            latin = mix == "latin" or (mix == "mixed" and line % 2 == 0)
+            if latin:
+                page.insert_text((72, y), _latin_line(rng), fontsize=10, fontname="helv")
+            else:
+                page.insert_text((72, y), _cjk_line(rng), fontsize=11, fontname="china-t")
+            y += 16
+            line += 1
+        page.insert_text((290, 815), str(n + 1), fontsize=9)
+    doc.set_toc(toc)
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close()
+
+
+def generate_analysis(scale, seed=0):
+    """產生合成分析 JSON（欄位同 references/json-schema.md），各清單長度依 scale 放大"""
+    rng = random.Random(f"{seed}-{scale}")
+
+    def sentence(n=2):
+        return "。".join(_cjk_line(rng, 30) for _ in range(n)) + "。"
+
+    nodes = 6 * scale
+    svg = ['<svg viewBox="0 0 800 600" xmlns="http://www.w3.org/2000/svg">']
+    for i in range(nodes):
+        x, y = rng.uniform(40, 760), rng.uniform(40, 560)
+        svg.append(
+            f'<circle cx="{x:.6f}" cy="{y:.6f}" r="28.500000" fill="#f4efe6" stroke="#8a6d3b"/>'
+            f'<text x="{x:.6f}" y="{y:.6f}" text-anchor="middle" font-size="12">概念{i + 1}</text>'
+        )
+    svg.append("</svg>")
+    return {
+        "book_title": "合成基準測試之書",
+        "book_author": "Benchmark Author",
+        "book_author_zh": "基準作者",
+        "slug": f"bench-{scale}",
+        "one_line_review": sentence(1),
+        "book_type_tag": "基準測試",
+        "book_introduction": "\n\n".join(sentence(3) for _ in range(2 * scale)),
+        "tips_scores": {"T": 2, "I": 3, "P": 2, "S": 2, "total": 9, "verdict": "好書"},
+        "core_arguments": [
+            {"title": f"論點 {i + 1}", "body": "\n".join(sentence(2) for _ in range(3))}
+            for i in range(3 * scale)
+        ],
+        "key_concepts": [
+            {"name": f"概念 {i + 1}", "definition": sentence(1), "boundary": sentence(1)}
+            for i in range(5 * scale)
+        ],
+        "quotes": [{"text": sentence(1), "source": f"p.{rng.randint(1, 300)}"} for _ in range(5 * scale)],
+        "actions": [
+            {"title": f"行動 {i + 1}", "description": sentence(1), "when": sentence(1),
+             "context": sentence(1), "action": sentence(1)}
+            for i in range(3 * scale)
+        ],
+        "concept_relations_svg": "".join(svg),
+        "critical_perspectives": [
+            {"title": f"批判 {i + 1}", "content": "\n".join(sentence(2) for _ in range(2))}
+            for i in range(2 * scale)
+        ],
+        "zettelkasten": [
+            {"type": "permanent", "concept": f"概念 {i + 1}", "reason": sentence(1),
+             "links_to": f"概念 {i + 2}"}
+            for i in range(5 * scale)
+        ],
+        "meta_knowledge": [
+            {"lens": f"模型 {i + 1}", "description": sentence(1), "delta": sentence(1)}
+            for i in range(2 * scale)
+        ],
+        "further_reading": [{"title": f"延伸閱讀 {i + 1}", "reason": sentence(1)} for i in range(3 * scale)],
+        "generation_date": "2000-01-01",
+    }
+
+
+def pdf_fixture_id(pages, mix, tables):
+    return f"{mix}-{pages}p-t{round(tables * 100)}"
+
+
+def ensure_fixtures(work_dir, pdf_specs, sizes):
+    """產生（或沿用快取的）合成檔，回傳 {fixture_id: 路徑}"""
+    fixtures_dir = Path(work_dir) / f"fixtures-v{FIXTURE_VERSION}"
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for pages, mix, tables in pdf_specs:
+        fixture_id = pdf_fixture_id(pages, mix, tables)
+        path = fixtures_dir / f"{fixture_id}.pdf"
+        if not path.is_file():
+            tmp = path.with_suffix(".tmp")
+            generate_pdf(tmp, pages, mix, tables)
+            os.replace(tmp, path)
+        paths[fixture_id] = path
+    for size in sizes:
+        path = fixtures_dir / f"analysis-{size}.json"
+        if not path.is_file():
+            path.write_text(
+                json.dumps(generate_analysis(ANALYSIS_SIZES[size]), ensure_ascii=False),
+                encoding="utf-8",
+            )
+        paths[f"analysis-{size}"] = path
+    return paths
+
+
+# ── 單一案例（子行程） ──────────────────────────────────
+
+def _peak_rss_mb():
+    # 與 extract-text.py / render-report.py 的 --timings 同一實作
+    return _load_script("timings", "timings.py").peak_rss_mb()
+
+
+def _stage_call(case, work_dir):
+    """回傳 (可重複呼叫的函式, 每次處理的頁數或份數)"""
+    stage, path = case["stage"], Path(case["fixture_path"])
+    if stage == "render":
+        render_report = _load_script("render_report", "render-report.py")
+        template = render_report.load_template()
+        data = json.loads(path.read_text(encoding="utf-8"))
+
+        def render():
+            render_report._svg_cache.clear()  # 每次都量測 SVG 最佳化，不只量到快取命中
+            return render_report.render(data, template)
+
+        return render, 1
+
+    extract_text = _load_script("extract_text", "extract-text.py")
+    # 提取函式延後載入 pymupdf / pymupdf4llm（約 1 秒），先載入以免計入第一次的耗時；
+    # 資訊與目錄不需要 pymupdf4llm，不載入以免墊高其峰值記憶體
+    import pymupdf  # noqa: F401
+    if stage in PROFILE_STAGES:
+        import pymupdf4llm  # noqa: F401
+    pages = case["pages"]
+    profile = case.get("profile", "faithful")
+    if stage == "get_pdf_info":
+        return (lambda: extract_text.get_pdf_info(path)), pages
+    if stage == "get_toc":
+        return (lambda: extract_text.get_toc(path)), pages
+    if stage == "extract_via_pymupdf":
+        return (lambda: extract_text.extract_via_pymupdf(path, profile=profile)), pages
+    if stage == "chunk_extract":
+        output_dir = Path(work_dir) / "chunks" / case["id"].replace("/", "_")
+
+        def call():
+            return extract_text.chunk_extract(
+                path, max(10, pages // 5), output_dir, profile=profile, use_cache=False
+            )
+        return call, pages
+    raise ValueError(f"未知的階段：{stage}")
+
+
+def run_case(case, work_dir):
+    """在目前行程執行單一案例（由父行程以子行程呼叫，peak RSS 才不互相干擾）"""
+    start = time.perf_counter()
+    call, units = _stage_call(case, work_dir)
+    setup_seconds = time.perf_counter() - start
+    setup_rss_mb = _peak_rss_mb()
+
+    runs = []
+    output_bytes = None
+    for _ in range(case["repeat"]):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = call()
+        runs.append((time.perf_counter() - wall, time.process_time() - cpu))
+        if isinstance(result, dict) and result.get("success") is False:
+            return {"success": False, "error": result.get("error", "unknown error")}
+        if isinstance(result, str):
+            output_bytes = len(result.encode("utf-8"))
+    seconds = statistics.median(wall for wall, _ in runs)
+    measurement = {
+        "success": True,
+        "seconds": round(seconds, 6),
+        "min_seconds": round(min(wall for wall, _ in runs), 6),
+        "cpu_seconds": round(statistics.median(cpu for _, cpu in runs), 6),
+        "setup_seconds": round(setup_seconds, 3),
+        "runs": len(runs),
+        "setup_rss_mb": setup_rss_mb,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    if case["stage"] == "render":
+        measurement["reports_per_sec"] = round(1 / seconds, 1) if seconds else None
+        measurement["output_bytes"] = output_bytes
+    else:
+        measurement["pages_per_sec"] = round(units / seconds, 2) if seconds else None
+    return measurement
+
+
+def _run_case_subprocess(case, work_dir):
+    proc = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "_case", json.dumps(case), str(work_dir)],
+        capture_output=True, text=True,
+    )
+    try:
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError):
+        error = proc.stderr.strip().splitlines()[-1:] or [f"exit {proc.returncode}"]
+        return {"success": False, "error": error[0]}
+
+
+# ── 執行與比對 ──────────────────────────────────────────
+
+def build_cases(fixtures, pdf_specs, sizes, profiles, only, repeat):
+    cases = []
+    if "extract" in only:
+        for pages, mix, tables in pdf_specs:
+            fixture_id = pdf_fixture_id(pages, mix, tables)
+            for stage in PDF_STAGES:
+                for profile in profiles if stage in PROFILE_STAGES else [None]:
+                    case = {
+                        "id": f"{stage}/{fixture_id}" + (f"/{profile}" if profile else ""),
+                        "stage": stage,
+                        "fixture": fixture_id,
+                        "fixture_path": str(fixtures[fixture_id]),
+                        "pages": pages,
+                        "mix": mix,
+                        "tables": tables,
+                        "repeat": repeat,
+                    }
+                    if profile:
+                        case["profile"] = profile
+                    cases.append(case)
+    if "render" in only:
+        for size in sizes:
+            cases.append({
+                "id": f"render/{size}",
+                "stage": "render",
+                "fixture": f"analysis-{size}",
+                "fixture_path": str(fixtures[f"analysis-{size}"]),
+                "size": size,
+                "repeat": max(repeat, 20),  # 單次渲染僅數毫秒，多跑幾次中位數才穩定
+            })
+    return cases
+
+
+def environment():
+    template = SCRIPTS_DIR.parent / "assets" / "reading-report-template.html"
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pymupdf": _package_version("pymupdf"),
+        "pymupdf4llm": _package_version("pymupdf4llm"),
+        "template_hash": hashlib.sha256(template.read_bytes()).hexdigest()[:16]
+        if template.is_file() else None,
+        "fixture_version": FIXTURE_VERSION,
+    }
+
+
+def run_benchmarks(pdf_specs, sizes, profiles, only, repeat, work_dir):
+    start_time = time.perf_counter()
+    fixtures = ensure_fixtures(work_dir, pdf_specs if "extract" in only else [], sizes if "render" in only else [])
+    results = []
+    for case in build_cases(fixtures, pdf_specs, sizes, profiles, only, repeat):
+        measurement = _run_case_subprocess(case, work_dir)
+        entry = {k: v for k, v in case.items() if k not in ("fixture_path", "repeat")}
+        results.append({**entry, **measurement})
+    failed = [r["id"] for r in results if not r["success"]]
+    return {
+        "success": not failed,
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "cases": results,
+        "failed_cases": failed,
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def compare_results(current, baseline, threshold=0.2, rss_threshold=0.2, min_seconds=0.005):
+    """逐案例比對中位耗時與峰值記憶體，回傳退步、進步與缺少的案例"""
+    base_cases = {c["id"]: c for c in baseline.get("cases", []) if c.get("success")}
+    regressions, improvements, unmatched = [], [], []
+    for case in current.get("cases", []):
+        base = base_cases.pop(case["id"], None)
+        if base is None or not case.get("success"):
+            unmatched.append(case["id"])
+            continue
+        delta = case["seconds"] - base["seconds"]
+        change = delta / base["seconds"] if base["seconds"] else 0.0
+        entry = {
+            "id": case["id"],
+            "metric": "seconds",
+            "baseline": base["seconds"],
+            "current": case["seconds"],
+            "change": round(change, 3),
+        }
+        if change > threshold and delta > min_seconds:
+            regressions.append(entry)
+        elif change < -threshold and -delta > min_seconds:
+            improvements.append(entry)
+        if case.get("peak_rss_mb") and base.get("peak_rss_mb"):
+            rss_change = case["peak_rss_mb"] / base["peak_rss_mb"] - 1
+            if rss_change > rss_threshold:
+                regressions.append({
+                    "id": case["id"],
+                    "metric": "peak_rss_mb",
+                    "baseline": base["peak_rss_mb"],
+                    "current": case["peak_rss_mb"],
+                    "change": round(rss_change, 3),
+                })
+    base_env, env = baseline.get("environment", {}), current.get("environment", {})
+    return {
+        "success": not regressions,
+        "threshold": threshold,
+        "rss_threshold": rss_threshold,
+        "regressions": regressions,
+        "improvements": improvements,
+        "unmatched_cases": unmatched,
+        "missing_cases": sorted(base_cases),
+        "environment_changes": {
+            k: {"baseline": base_env.get(k), "current": env.get(k)}
+            for k in sorted(set(base_env) | set(env)) if base_env.get(k) != env.get(k)
+        },
+    }
+
+
+def _fail(message):
+    print(json.dumps({"success": False, "error": message}, ensure_ascii=False), file=sys.stderr)
+    sys.exit(1)
+
+
+def _read_results(path):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        _fail(f"無法讀取結果檔 {path}：{e}")
+
+
+def _csv(value, cast=str):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "_case":  # 內部：子行程執行單一案例
+        print(json.dumps(run_case(json.loads(sys.argv[2]), sys.argv[3]), ensure_ascii=False))
+        return
+
+    parser = argparse.ArgumentParser(description="CRISP 閱讀助手：提取與渲染效能基準測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_compare_options(p):
+        p.add_argument(
+            "--threshold", type=float, default=0.2, help="中位耗時增加超過此比例視為退步（預設 0.2）"
+        )
+        p.add_argument(
+            "--rss-threshold", type=float, default=0.2, help="峰值記憶體增加超過此比例視為退步（預設 0.2）"
+        )
+        p.add_argument(
+            "--min-seconds", type=float, default=0.005,
+            help="耗時差距小於此秒數時不計（避免毫秒級雜訊，預設 0.005）",
+        )
+
+    p_run = sub.add_parser("run", help="產生合成檔並執行基準測試")
+    p_run.add_argument("--pages", default="20,100", help="合成 PDF 頁數，逗號分隔（預設 20,100）")
+    p_run.add_argument("--mix", default="latin,cjk", help="文字組成：latin、cjk、mixed（預設 latin,cjk）")
+    p_run.add_argument("--tables", default="0,0.3", help="含表格頁面比例，逗號分隔（預設 0,0.3）")
+    p_run.add_argument(
+        "--profiles", default="faithful,balanced,fast",
+        help="extract / 分塊使用的 profile（預設 faithful,balanced,fast）",
+    )
+    p_run.add_argument(
+        "--sizes", default="small,medium,large", help="合成分析 JSON 規模（預設 small,medium,large）"
+    )
+    p_run.add_argument("--only", default="extract,render", help="只跑 extract 或 render（預設兩者）")
+    p_run.add_argument("--repeat", type=int, default=1, help="每個案例重複次數，取中位數（預設 1）")
+    p_run.add_argument("--quick", action="store_true", help="快速檢查：只跑 20 頁 PDF 與小型 JSON")
+    p_run.add_argument("--work-dir", default=str(DEFAULT_WORK_DIR), help="合成檔快取與暫存輸出目錄")
+    p_run.add_argument("--output", "-o", default="bench-results.json", help="結果檔（預設 bench-results.json）")
+    p_run.add_argument("--baseline", help="跑完後與此基準結果比對")
+    add_compare_options(p_run)
+
+    p_compare = sub.add_parser("compare", help="比對兩份結果，標出退步")
+    p_compare.add_argument("current", help="本次結果 JSON")
+    p_compare.add_argument("baseline", help="基準結果 JSON")
+    add_compare_options(p_compare)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        result = compare_results(
+            _read_results(args.current), _read_results(args.baseline),
+            args.threshold, args.rss_threshold, args.min_seconds,
+        )
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if not result["success"]:
+            sys.exit(1)
+        return
+
+    try:
+        pages = QUICK["pages"] if args.quick else _csv(args.pages, int)
+        sizes = QUICK["sizes"] if args.quick else _csv(args.sizes)
+        profiles = QUICK["profiles"] if args.quick else _csv(args.profiles)
+        mixes, tables = _csv(args.mix), _csv(args.tables, float)
+    except ValueError as e:
+        parser.error(f"參數格式錯誤：{e}")
+    only = _csv(args.only)
+    for name, values, allowed in (
+        ("--mix", mixes, MIXES), ("--sizes", sizes, ANALYSIS_SIZES),
+        ("--only", only, ("extract", "render")), ("--profiles", profiles, ("faithful", "balanced", "fast")),
+    ):
+        unknown = [v for v in values if v not in allowed]
+        if unknown:
+            parser.error(f"{name} 不支援：{', '.join(unknown)}（可用：{', '.join(allowed)}）")
+    baseline = _read_results(args.baseline) if args.baseline else None
+
+    pdf_specs = [(p, m, t) for p in pages for m in mixes for t in tables]
+    result = run_benchmarks(pdf_specs, sizes, profiles, only, args.repeat, args.work_dir)
+    Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    summary = {
+        "success": result["success"],
+        "output_path": args.output,
+        "cases": [
+            {k: case.get(k) for k in ("id", "seconds", "pages_per_sec", "reports_per_sec", "peak_rss_mb", "error")
+             if case.get(k) is not None}
+            for case in result["cases"]
+        ],
+        "failed_cases": result["failed_cases"],
+        "seconds": result["seconds"],
+    }
+    if baseline:
+        summary["comparison"] = compare_results(
+            result, baseline, args.threshold, args.rss_threshold, args.min_seconds
+        )
+        summary["success"] = summary["success"] and summary["comparison"]["success"]
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if not summary["success"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
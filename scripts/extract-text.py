@@ -1,28 +1,75 @@
 #!/usr/bin/env python3
 """
 從 PDF/EPUB 提取文字。
-優先使用 document-to-markdown (gateway.py)，不可用時 fallback 到 pymupdf4llm。
+PDF 優先使用 document-to-markdown (gateway.py)，不可用時 fallback 到 pymupdf4llm。
+EPUB 以內建讀取器處理（zip + OPF spine，逐章轉為 markdown），不需要 gateway；
+「頁」為 spine 項目（通常一章一檔），--pages、分塊與目錄頁碼皆以此計。
+TXT 串流讀取並自動偵測編碼，Project Gutenberg 檔案會略過授權說明；
+「頁」為約 2000 字的文字區塊，目錄由偵測到的章節標題（第N章/回、CHAPTER N）合成。
 
 用法：
   python extract-text.py input.pdf                    # 全書提取
   python extract-text.py input.pdf --pages 1-10       # 指定頁碼
   python extract-text.py input.pdf --toc              # 僅提取目錄結構
+  python extract-text.py input.pdf --stream           # 逐頁串流 markdown（邊轉換邊輸出）
+  python extract-text.py input.pdf --stream ndjson    # 逐頁 NDJSON：{page, markdown, chars}
   python extract-text.py input.pdf --info             # 書籍基本資訊（頁數、大小）
+  python extract-text.py input.pdf --plan --chunk-by toc --max-tokens-per-chunk 60000
+                                                      # 單次開檔：資訊 + 目錄 + 分塊計畫
   python extract-text.py input.pdf --chunk-size 30    # 每 30 頁一塊，輸出到目錄
+  python extract-text.py input.pdf --chunk-size 30 --workers 4   # 4 個行程平行分塊
+  python extract-text.py input.pdf --chunk-size 30 --resume       # 中斷後續跑，只重做未完成的分塊
+  python extract-text.py input.pdf --max-tokens-per-chunk 60000  # 依 token 預算分塊
+  python extract-text.py input.pdf --chunk-by toc:1 --max-tokens-per-chunk 60000  # 依章節分塊
+  python extract-text.py input.pdf --chunk-size 30 --strip-boilerplate  # 去除書眉、頁碼後分塊
+  python extract-text.py input.pdf --profile fast     # 純文字快速提取（小說、散文）
+  python extract-text.py input.pdf --chunk-size 30 --pack  # 分塊並寫入書籍封裝檔 input.pdf.crispbook
+  python extract-text.py input.pdf --pages 120-125    # 封裝檔存在且未過期時直接隨機讀取
+  python extract-text.py input.pdf --chunk-size 30 --timings --trace trace.json
+                                                      # 各階段耗時、峰值記憶體與 Chrome trace
+  python extract-text.py input.pdf --no-cache         # 不使用提取快取
+  python extract-text.py --cache-stats                # 快取使用狀況
+  python extract-text.py pg1342.txt --info            # TXT（含 Gutenberg）：資訊與合成目錄
+  python extract-text.py book.txt --encoding big5 --max-tokens-per-chunk 60000
+
+快取：提取結果逐頁存於 ~/.cache/crisp-reading（可用 CRISP_READING_CACHE 變更位置、
+CRISP_READING_CACHE_MAX_MB 設定容量上限，預設 1024 MB，超過時依 LRU 淘汰）。
+封裝檔：--pack 時把逐頁 markdown 壓縮存成單一檔案（附頁碼位移索引、目錄與來源雜湊），
+之後的一般提取（含 --pages）只解壓所需頁面；來源檔或提取設定改變時自動改回直接提取。
 
 輸出：Markdown 文字至 stdout（或 --output 指定檔案）
 """
 
 import argparse
+import atexit
+import bisect
+import codecs
+import hashlib
+import importlib.util
+import itertools
 import json
+import mmap
 import os
+import posixpath
+import re
+import struct
 import subprocess
 import sys
+import tempfile
+import time
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
 from pathlib import Path
+from urllib.parse import unquote
 
 
 def find_gateway():
     """尋找 document-to-markdown 的 gateway.py"""
+    override = os.environ.get("CRISP_READING_GATEWAY")
+    if override:
+        return override if Path(override).is_file() else None
     candidates = [
         # 同層 skill
         Path(__file__).resolve().parent.parent.parent
@@ -38,42 +85,563 @@ def find_gateway():
     return None
 
 
-def extract_via_gateway(gateway_path, input_path, pages=None, output_path=None):
+# ── 效能量測（--timings） ───────────────────────────────
+# 各階段以 TIMINGS.stage(名稱) 包住（實作見 timings.py，與 render-report.py 共用）。
+# 階段名稱以冒號分類：convert:*、cache:read、store:read（計入處理頁數）、
+# write:*（計入寫出位元組）、scan:*、open、toc、import。
+# 啟用時累計各階段的 wall / CPU 時間、處理頁數與寫出位元組，並記錄 Chrome trace 事件
+# （chrome://tracing 或 Perfetto 可開啟）。分塊在 worker 行程內另起一份，完成後併回主行程。
+
+
+_timings_spec = importlib.util.spec_from_file_location(
+    "timings", Path(__file__).resolve().parent / "timings.py"
+)
+timings = importlib.util.module_from_spec(_timings_spec)
+_timings_spec.loader.exec_module(timings)
+
+
+class Timings(timings.Timings):
+    """提取的逐階段量測；stage() 產生的 dict 可由呼叫端填入 pages / bytes"""
+
+    def totals(self, stages):
+        return {
+            "pages": sum(
+                stage["pages"] for name, stage in stages.items()
+                if name.startswith("convert") or name.endswith(":read")
+            ),
+        }
+
+
+TIMINGS = Timings()
+
+
+# ── 提取快取 ────────────────────────────────────────────
+# 以「檔案內容雜湊 + 頁碼 + 後端」為 key，逐頁存放 markdown，
+# 讓 --pages 切片、重跑分塊時可重用已提取的頁面。
+# 目錄結構：<root>/<hash[:2]>/<hash>/<backend>/p00001.md
+# LRU 以檔案 mtime 近似（命中時 touch），超過上限時淘汰最舊的項目；
+# 淘汰需掃描整個快取目錄，由每次執行（main、watch-folder 的每本書）結束時呼叫一次。
+
+CACHE_DIR = Path(
+    os.environ.get("CRISP_READING_CACHE")
+    or Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "crisp-reading"
+)
+CACHE_MAX_MB = int(os.environ.get("CRISP_READING_CACHE_MAX_MB", "1024"))
+
+
+# 本行程已算過的檔案雜湊：(絕對路徑, 大小, mtime_ns) → SHA-256；檔案變更後 key 隨之改變
+_file_hashes = {}
+
+
+def _file_hash_key(input_path):
+    st = os.stat(input_path)
+    return os.path.abspath(input_path), st.st_size, st.st_mtime_ns
+
+
+def cache_file_hash(input_path):
+    """計算檔案內容的 SHA-256（以 1 MB 區塊讀取，不一次載入記憶體）。
+    同一行程內檔案未變更時沿用上次結果，各分塊不必重讀整本書與 gateway 腳本。
+    """
+    key = _file_hash_key(input_path)
+    if key not in _file_hashes:
+        h = hashlib.sha256()
+        with open(input_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _file_hashes[key] = h.hexdigest()
+    return _file_hashes[key]
+
+
+def _cache_entry_dir(file_hash, backend, cache_dir=None):
+    root = Path(cache_dir) if cache_dir else CACHE_DIR
+    return root / file_hash[:2] / file_hash / backend
+
+
+def cache_get(file_hash, backend, names, cache_dir=None):
+    """讀取快取項目，回傳 {項目名稱: markdown}（僅含命中者）。
+    逐頁項目名稱為 p00001 形式（見 _page_entry）。
+    """
+    entry_dir = _cache_entry_dir(file_hash, backend, cache_dir)
+    hits = {}
+    if not entry_dir.is_dir():
+        return hits
+    with TIMINGS.stage("cache:read") as counters:
+        for name in names:
+            path = entry_dir / f"{name}.md"
+            try:
+                hits[name] = path.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            os.utime(path)  # 更新 mtime 作為 LRU 存取時間
+        counters["pages"] = len(hits)
+    return hits
+
+
+def cache_put(file_hash, backend, entries, cache_dir=None, max_mb=None, evict=False):
+    """寫入快取（{項目名稱: markdown}）。
+    預設不淘汰：淘汰需掃描整個快取目錄，由執行結束時呼叫一次 cache_evict；evict=True 時寫完即淘汰。
+    """
+    entry_dir = _cache_entry_dir(file_hash, backend, cache_dir)
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    with TIMINGS.stage("write:cache") as counters:
+        for name, text in entries.items():
+            path = entry_dir / f"{name}.md"
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            counters["bytes"] += tmp.write_bytes(text.encode("utf-8"))
+            os.replace(tmp, path)  # 原子寫入，平行 worker 不會讀到半個檔案
+    if evict:
+        cache_evict(cache_dir, max_mb)
+
+
+def _cache_files(cache_dir=None):
+    root = Path(cache_dir) if cache_dir else CACHE_DIR
+    if not root.is_dir():
+        return []
+    files = []
+    for path in root.glob("*/*/*/*.md"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:  # 其他行程剛淘汰
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+    return files
+
+
+def cache_evict(cache_dir=None, max_mb=None):
+    """超過容量上限時，依最近存取時間（mtime）由舊到新淘汰"""
+    limit = (CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    files = _cache_files(cache_dir)
+    total = sum(size for _, size, _ in files)
+    if total <= limit:
+        return 0
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= limit:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def cache_stats(cache_dir=None, max_mb=None):
+    """快取使用狀況（項目數、總大小、書籍數）"""
+    root = Path(cache_dir) if cache_dir else CACHE_DIR
+    files = _cache_files(cache_dir)
+    books = {path.parent.parent.name for _, _, path in files}
+    total = sum(size for _, size, _ in files)
+    return {
+        "success": True,
+        "cache_dir": str(root),
+        "entries": len(files),
+        "books": len(books),
+        "size_mb": round(total / 1024 / 1024, 2),
+        "max_mb": CACHE_MAX_MB if max_mb is None else max_mb,
+    }
+
+
+GATEWAY_TIMEOUT = 300  # 秒
+
+
+def _parse_gateway_output(content):
+    """gateway 可能輸出 JSON 或直接輸出 markdown；回傳 (content, error)"""
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return content, None  # 直接是 markdown，使用 content as-is
+    if not isinstance(data, dict):
+        return content, None
+    if data.get("success"):
+        return data.get("content", ""), None
+    return None, data.get("error", "gateway returned failure")
+
+
+def extract_via_gateway(
+    gateway_path, input_path, pages=None, output_path=None, use_cache=False, worker=None,
+    timeout=GATEWAY_TIMEOUT, boilerplate=None,
+):
     """透過 document-to-markdown gateway.py 提取。
     一律用 stdout 模式取得內容，再由本腳本決定是否寫入檔案，
     避免 --output + --json 混用導致輸出檔只有 metadata。
+    gateway 無法逐頁輸出，快取以整個頁碼範圍為單位。
+    傳入 worker（GatewayWorker）時交由常駐 worker 處理，不另起 subprocess。
+    boilerplate 為頁首頁尾雜湊集合時，因頁界未知而逐行比對，只去除不含數字的相同行。
     """
+    extra = {}
+    content = None
+    if use_cache:
+        file_hash = cache_file_hash(input_path)
+        backend = "gateway-" + cache_file_hash(gateway_path)[:12]
+        range_key = _range_cache_key(pages)
+        cached = cache_get(file_hash, backend, [range_key])
+        if range_key in cached:
+            content = cached[range_key]
+            extra["cache"] = {"hits": 1, "misses": 0}
+
+    if content is None:
+        content, error = _run_gateway(gateway_path, input_path, pages, worker, timeout)
+        if error is not None:
+            return {"success": False, "error": error}
+        if use_cache:
+            cache_put(file_hash, backend, {range_key: content})
+
+    if boilerplate:
+        content, extra["boilerplate"] = strip_boilerplate(content, boilerplate, paged=False)
+
+    if output_path:
+        Path(output_path).write_text(content, encoding="utf-8")
+        return {"success": True, "output_path": output_path, **extra}
+    return {"success": True, "content": content, **extra}
+
+
+def _run_gateway(gateway_path, input_path, pages=None, worker=None, timeout=GATEWAY_TIMEOUT):
+    """執行 gateway（常駐 worker 或單次 subprocess），回傳 (content, error)"""
+    with TIMINGS.stage("convert:gateway", len(parse_page_range(pages)) if pages else 0):
+        return _run_gateway_request(gateway_path, input_path, pages, worker, timeout)
+
+
+def _run_gateway_request(gateway_path, input_path, pages, worker, timeout):
+    if worker is not None:
+        response = worker.request(input_path, pages)
+        if not response["success"]:
+            return None, response.get("error", "gateway worker failed")
+        return response["content"], None
+
     cmd = [sys.executable, gateway_path, "--input", str(input_path)]
     if pages:
         cmd.extend(["--pages", pages])
     # 一律讓 gateway 輸出到 stdout，由本腳本處理寫入
     cmd.extend(["--output", "-"])
 
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
     if result.returncode != 0:
-        return {"success": False, "error": result.stderr or "gateway failed"}
+        return None, result.stderr or "gateway failed"
+    return _parse_gateway_output(result.stdout)
 
-    content = result.stdout
-    # gateway 可能輸出 JSON 或直接輸出 markdown
-    try:
-        data = json.loads(content)
-        if data.get("success"):
-            content = data.get("content", "")
+
+# ── 常駐 gateway worker ─────────────────────────────────
+# 以 `extract-text.py --gateway-worker <gateway.py>` 啟動，透過 stdin/stdout
+# 交換逐行 JSON：
+#   請求 {"id": 1, "input": "/path/book.epub", "pages": "1-30"}
+#   回應 {"id": 1, "success": true, "content": "..."} 或 {"id": 1, "success": false, "error": "..."}
+# worker 在同一個直譯器內以 runpy 執行 gateway.py，省去每塊重啟直譯器與重新 import。
+
+
+def gateway_worker_loop(gateway_path, stdin=None):
+    """--gateway-worker：常駐 worker（server 端），逐行讀取請求直到 stdin 關閉"""
+    import contextlib
+    import io
+    import runpy
+
+    stdin = stdin or sys.stdin
+    # 保留原 stdout 作為協定通道；gateway 直接寫 fd 1 的輸出改導向 stderr，避免污染協定
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        argv = [gateway_path, "--input", request["input"]]
+        if request.get("pages"):
+            argv.extend(["--pages", request["pages"]])
+        argv.extend(["--output", "-"])
+
+        buffer = io.StringIO()
+        exit_code = 0
+        saved_argv = sys.argv
+        sys.argv = argv
+        try:
+            with contextlib.redirect_stdout(buffer):
+                runpy.run_path(gateway_path, run_name="__main__")
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception as e:
+            exit_code = f"{type(e).__name__}: {e}"
+        finally:
+            sys.argv = saved_argv
+
+        response = {"id": request.get("id")}
+        if exit_code != 0:
+            response.update(success=False, error=str(exit_code) if isinstance(exit_code, str)
+                            else f"gateway exited with status {exit_code}")
         else:
-            return {"success": False, "error": data.get("error", "gateway returned failure")}
-    except json.JSONDecodeError:
-        pass  # 直接是 markdown，使用 content as-is
+            content, error = _parse_gateway_output(buffer.getvalue())
+            if error is not None:
+                response.update(success=False, error=error)
+            else:
+                response.update(success=True, content=content)
+        protocol.write(json.dumps(response, ensure_ascii=False) + "\n")
+        protocol.flush()
 
-    if output_path:
-        Path(output_path).write_text(content, encoding="utf-8")
-        return {"success": True, "output_path": output_path}
-    return {"success": True, "content": content}
 
+class GatewayWorker:
+    """常駐 gateway worker（client 端）。
+    每個請求有獨立逾時；逾時則終止 worker（下個請求自動重啟），
+    worker 崩潰時自動重啟並重送一次。
+    """
+
+    def __init__(self, gateway_path, timeout=GATEWAY_TIMEOUT):
+        self.gateway_path = str(gateway_path)
+        self.timeout = timeout
+        self.restarts = 0
+        self._proc = None
+        self._responses = None
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self):
+        import queue
+        import threading
+
+        self._proc = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "--gateway-worker", self.gateway_path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding="utf-8",
+        )
+        self._responses = queue.Queue()
+        threading.Thread(
+            target=self._read_responses, args=(self._proc, self._responses), daemon=True
+        ).start()
+
+    @staticmethod
+    def _read_responses(proc, responses):
+        for line in proc.stdout:
+            responses.put(line)
+        responses.put(None)  # EOF：worker 已結束
+
+    def request(self, input_path, pages=None):
+        import queue
+
+        for _ in range(2):
+            if self._proc is None or self._proc.poll() is not None:
+                if self._proc is not None:
+                    self.restarts += 1
+                self._start()
+            self._next_id += 1
+            request = {"id": self._next_id, "input": str(input_path), "pages": pages}
+            try:
+                self._proc.stdin.write(json.dumps(request, ensure_ascii=False) + "\n")
+                self._proc.stdin.flush()
+                line = self._responses.get(timeout=self.timeout)
+            except queue.Empty:
+                self.kill()
+                return {"success": False, "error": f"gateway worker 逾時（{self.timeout} 秒）"}
+            except OSError:  # worker 已崩潰，管線斷開
+                line = None
+            if line is None:
+                self.kill()
+                continue
+            return json.loads(line)
+        return {"success": False, "error": "gateway worker 異常終止"}
+
+    def kill(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+    def close(self):
+        """關閉 stdin 讓 worker 正常結束；逾時則強制終止"""
+        if self._proc is None or self._proc.poll() is not None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+# 每個行程各自持有的 worker（process pool 的子行程也各有一個）
+_gateway_workers = {}
+
+
+def _get_gateway_worker(gateway_path, timeout=GATEWAY_TIMEOUT):
+    key = (str(gateway_path), timeout)
+    if key not in _gateway_workers:
+        _gateway_workers[key] = GatewayWorker(gateway_path, timeout)
+    return _gateway_workers[key]
+
+
+def _close_gateway_workers():
+    while _gateway_workers:
+        _, worker = _gateway_workers.popitem()
+        worker.close()
+
+
+def _init_chunk_worker(file_hashes, gateway_worker=False):
+    """分塊 process pool 子行程的 initializer：沿用主行程已算好的檔案雜湊；
+    gateway_worker 時於行程結束時關閉本行程的常駐 gateway worker
+    （fork 出的子行程以 os._exit 結束、不執行 atexit，因此另向 multiprocessing 登記 finalizer）。
+    """
+    _file_hashes.update(file_hashes)
+    if gateway_worker:
+        import multiprocessing.util
+
+        atexit.register(_close_gateway_workers)
+        multiprocessing.util.Finalize(None, _close_gateway_workers, exitpriority=0)
 
-def extract_via_pymupdf(input_path, pages=None):
-    """Fallback：直接用 pymupdf4llm"""
+
+# ── 提取速度設定（--profile）────────────────────────────
+# faithful：每頁都走 pymupdf4llm 的版面與表格分析（預設，與既有行為相同）。
+# fast：直接讀 PyMuPDF 文字區塊，依字級推斷標題，適合純文字的小說與散文。
+# balanced：先以文字區塊位置與向量線條數量便宜地分類每頁，只有疑似表格或多欄的頁面
+#           才交給 pymupdf4llm，其餘走 fast。
+
+PROFILES = ("fast", "balanced", "faithful")
+FAST_RULES_VERSION = 1  # fast 轉換規則變更時遞增，讓快取失效
+TABLE_MIN_DRAWINGS = 8  # 向量線條 / 矩形達此數量的頁面視為可能含表格
+
+
+def body_font_size(doc, sample=40):
+    """抽樣至多 sample 頁，以字數加權取最常見字級作為正文字級"""
+    sizes = {}
+    step = max(1, len(doc) // sample)
+    for i in range(0, len(doc), step):
+        for block in doc[i].get_text("dict")["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    size = round(span["size"] * 2) / 2
+                    sizes[size] = sizes.get(size, 0) + len(span["text"].strip())
+    return max(sizes, key=sizes.get) if sizes else 10.0
+
+
+def _join_block_lines(lines):
+    """合併區塊內的行：英文斷字接回、中日韓文字之間不加空白"""
+    text = lines[0]
+    for line in lines[1:]:
+        if text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        elif _CJK_RE.match(text[-1]) and _CJK_RE.match(line[0]):
+            text += line
+        else:
+            text += " " + line
+    return text
+
+
+def fast_page_markdown(blocks, body_size):
+    """文字區塊 → markdown：字級明顯大於正文的短區塊視為標題（# / ## / ###）"""
+    parts = []
+    for block in blocks:
+        if block.get("type") != 0:
+            continue
+        lines = []
+        size = 0.0
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append(text)
+                size = max(size, max(span["size"] for span in line["spans"]))
+        if not lines:
+            continue
+        text = _join_block_lines(lines)
+        ratio = size / body_size if body_size else 1.0
+        if ratio >= 1.15 and len(text) <= 120:
+            level = 1 if ratio >= 1.8 else 2 if ratio >= 1.4 else 3
+            text = "#" * level + " " + text
+        parts.append(text)
+    return "\n\n".join(parts) + "\n\n" if parts else ""
+
+
+def needs_layout(page, blocks):
+    """便宜的版面分類：向量線條多（可能是表格）或左右兩欄文字並排時回傳 True"""
     try:
+        drawings = len(page.get_cdrawings())
+    except AttributeError:  # 舊版 PyMuPDF
+        drawings = len(page.get_drawings())
+    if drawings >= TABLE_MIN_DRAWINGS:
+        return True
+    # 同一基線的左右兩欄常被合併成一個區塊，因此以「行」為單位比較
+    width = page.rect.width
+    lines = [line["bbox"] for b in blocks if b.get("type") == 0 for line in b["lines"]]
+    left = [b for b in lines if b[2] < width * 0.55]
+    right = [b for b in lines if b[0] > width * 0.45]
+    if len(left) < 3 or len(right) < 3:
+        return False
+    # 左右兩行垂直重疊三組以上才算多欄（排除左右各一的書眉與頁碼）
+    left.sort(key=lambda b: b[1])
+    side_by_side = 0
+    for r in right:
+        for l in left:
+            if l[1] >= r[3]:
+                break
+            if r[1] < l[3]:
+                side_by_side += 1
+                break
+        if side_by_side >= 3:
+            return True
+    return False
+
+
+def _import_pymupdf4llm():
+    """載入 pymupdf4llm；首次載入約需 1 秒，--timings 記為 import 階段"""
+    if "pymupdf4llm" not in sys.modules:
+        with TIMINGS.stage("import"):
+            import pymupdf4llm  # noqa: F401
+    return sys.modules["pymupdf4llm"]
+
+
+def convert_pages(doc, page_list, profile="faithful", body_size=None):
+    """依 profile 轉換指定頁面，回傳 ({頁索引: markdown}, {"fast": n, "full": m})"""
+    pymupdf4llm = _import_pymupdf4llm()
+
+    texts = {}
+    full_pages = []
+    if profile == "faithful":
+        full_pages = list(page_list)
+    else:
+        with TIMINGS.stage("convert:fast") as counters:
+            if body_size is None:
+                body_size = body_font_size(doc)
+            for index in page_list:
+                page = doc[index]
+                blocks = page.get_text("dict")["blocks"]
+                if profile == "balanced" and needs_layout(page, blocks):
+                    full_pages.append(index)
+                else:
+                    texts[index] = fast_page_markdown(blocks, body_size)
+            counters["pages"] = len(texts)
+    if full_pages:
+        with TIMINGS.stage("convert:full", len(full_pages)):
+            for chunk in pymupdf4llm.to_markdown(doc, pages=full_pages, page_chunks=True):
+                texts[chunk["metadata"]["page_number"] - 1] = chunk["text"]
+    return texts, {"fast": len(page_list) - len(full_pages), "full": len(full_pages)}
+
+
+def _profile_backend(profile):
+    """快取後端名稱：faithful 沿用 pymupdf4llm 版本；其餘另加 profile 與 fast 規則版本。
+    版本優先讀套件 metadata，避免只為了比對快取或封裝檔就載入 pymupdf4llm（約 1 秒）。
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        backend = f"pymupdf4llm-{version('pymupdf4llm')}"
+    except PackageNotFoundError:
         import pymupdf4llm
+
+        backend = f"pymupdf4llm-{pymupdf4llm.version}"
+    return backend if profile == "faithful" else f"{backend}-{profile}-v{FAST_RULES_VERSION}"
+
+
+def extract_via_pymupdf(
+    input_path, pages=None, use_cache=False, doc=None, boilerplate=None, profile="faithful",
+    return_pages=False,
+):
+    """Fallback：直接用 pymupdf4llm。
+    use_cache 時逐頁（page_chunks）提取，只轉換快取中缺少的頁面。
+    doc 為已開啟的 document（DocumentSession）時直接沿用，不重新開檔。
+    boilerplate 為頁首頁尾雜湊集合（find_boilerplate）時逐頁轉換並去除，結果附去除量。
+    profile 為 fast / balanced 時依 convert_pages 分流，結果的 paths 記錄各路徑處理的頁數。
+    return_pages 時結果另附逐頁 markdown（page_texts），供寫入書籍封裝檔。
+    """
+    try:
+        pymupdf4llm = _import_pymupdf4llm()
     except ImportError:
         return {
             "success": False,
@@ -83,16 +651,211 @@ def extract_via_pymupdf(input_path, pages=None):
             ),
         }
 
-    kwargs = {}
-    if pages:
-        page_list = parse_page_range(pages)
-        kwargs["pages"] = page_list
+    if not use_cache and not boilerplate and profile == "faithful" and not return_pages:
+        kwargs = {}
+        if pages:
+            page_list = parse_page_range(pages)
+            kwargs["pages"] = page_list
 
+        try:
+            with TIMINGS.stage("convert:full") as counters:
+                text = pymupdf4llm.to_markdown(doc if doc is not None else str(input_path), **kwargs)
+                if TIMINGS.enabled:
+                    counters["pages"] = (
+                        len(kwargs["pages"]) if pages
+                        else len(doc) if doc is not None else get_pdf_page_count(input_path)
+                    )
+            return {"success": True, "content": text}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    own_doc = doc is None
     try:
-        text = pymupdf4llm.to_markdown(str(input_path), **kwargs)
-        return {"success": True, "content": text}
+        if own_doc:
+            doc = _import_pymupdf().open(str(input_path))
+        page_list = parse_page_range(pages) if pages else list(range(len(doc)))
+
+        page_texts = {}
+        if use_cache:
+            file_hash = cache_file_hash(input_path)
+            backend = _profile_backend(profile)
+            page_texts = cache_get(file_hash, backend, [_page_entry(p) for p in page_list])
+        missing = [p for p in page_list if _page_entry(p) not in page_texts]
+        paths = {"fast": 0, "full": 0}
+        if missing:
+            converted, paths = convert_pages(doc, missing, profile)
+            fresh = {_page_entry(p): text for p, text in converted.items()}
+            if use_cache:
+                cache_put(file_hash, backend, fresh)
+            page_texts.update(fresh)
+        # 逐頁串接結果與整段 to_markdown 相同
+        texts = [page_texts.get(_page_entry(p), "") for p in page_list]
+        result = {"success": True}
+        if boilerplate:
+            saved = dict(NO_BOILERPLATE)
+            for i, text in enumerate(texts):
+                texts[i], page_saved = strip_boilerplate(text, boilerplate)
+                add_boilerplate_saved(saved, page_saved)
+            result["boilerplate"] = saved
+        result["content"] = "".join(texts)
+        if return_pages:
+            result["page_texts"] = texts
+        if profile != "faithful":
+            result["paths"] = {**paths, "cached": len(page_list) - len(missing)}
+        if use_cache:
+            result["cache"] = {"hits": len(page_list) - len(missing), "misses": len(missing)}
+        return result
     except Exception as e:
         return {"success": False, "error": str(e)}
+    finally:
+        if own_doc and doc is not None:
+            doc.close()
+
+
+def iter_pages_pymupdf(
+    input_path, pages=None, use_cache=False, doc=None, profile="faithful", paths=None
+):
+    """逐頁產生 (頁碼索引, markdown)，一次只轉換並持有一頁。
+    逐頁呼叫 pymupdf4llm 的結果與整段轉換相同；use_cache 時命中的頁面直接讀快取。
+    傳入 paths dict 時累計各路徑（fast / full / cached）處理的頁數。
+    """
+    own_doc = doc is None
+    if own_doc:
+        pymupdf = _import_pymupdf()
+        if pymupdf is None:
+            raise ImportError(PYMUPDF_MISSING["error"])
+        doc = pymupdf.open(str(input_path))
+    if paths is None:
+        paths = {}
+    try:
+        page_list = parse_page_range(pages) if pages else range(len(doc))
+        body_size = body_font_size(doc) if profile != "faithful" else None
+        if use_cache:
+            file_hash = cache_file_hash(input_path)
+            backend = _profile_backend(profile)
+        for page in page_list:
+            if use_cache:
+                hit = cache_get(file_hash, backend, [_page_entry(page)])
+                if hit:
+                    paths["cached"] = paths.get("cached", 0) + 1
+                    yield page, hit[_page_entry(page)]
+                    continue
+            converted, counts = convert_pages(doc, [page], profile, body_size)
+            for path, n in counts.items():
+                paths[path] = paths.get(path, 0) + n
+            text = converted[page]
+            if use_cache:
+                cache_put(file_hash, backend, {_page_entry(page): text})
+            yield page, text
+    finally:
+        if own_doc:
+            doc.close()
+
+
+def stream_extract(
+    input_path, out, fmt="markdown", pages=None, use_cache=False, workers=1, boilerplate=None,
+    profile="faithful", encoding=None,
+):
+    """--stream：逐頁寫出至 out（文字檔案物件），每頁寫完即 flush。
+    fmt 為 markdown（直接串接）或 ndjson（每頁一筆 {page, markdown, chars}）。
+    EPUB 以內建讀取器逐一轉換 spine 項目（workers > 1 時平行轉換、依序輸出）；
+    TXT（encoding 未指定時自動偵測編碼）掃描一次建立頁邊界後再串流讀出。boilerplate（PDF）時逐頁去除頁首頁尾；
+    profile（PDF）見 convert_pages。
+    """
+    paths = {}
+    if is_epub_path(input_path):
+        iter_pages = iter_pages_epub(input_path, pages, use_cache, workers)
+        separator = "\n"
+    elif is_text_path(input_path):
+        iter_pages = iter_pages_text(input_path, pages, encoding)
+        separator = ""
+    else:
+        try:
+            _import_pymupdf4llm()
+        except ImportError:
+            return {"success": False, "error": "需要安裝 pymupdf4llm：pip install pymupdf4llm"}
+        iter_pages = iter_pages_pymupdf(input_path, pages, use_cache, profile=profile, paths=paths)
+        separator = ""
+
+    page_count = 0
+    total_chars = 0
+    saved = dict(NO_BOILERPLATE)
+    try:
+        for page, text in iter_pages:
+            if boilerplate:
+                text, page_saved = strip_boilerplate(text, boilerplate)
+                add_boilerplate_saved(saved, page_saved)
+            if fmt == "ndjson":
+                record = {"page": page + 1, "markdown": text, "chars": len(text)}
+                data = json.dumps(record, ensure_ascii=False) + "\n"
+            else:
+                data = separator + text if page_count else text
+            with TIMINGS.stage("write:output") as counters:
+                out.write(data)
+                out.flush()
+                if TIMINGS.enabled:
+                    counters["bytes"] = len(data.encode("utf-8"))
+            page_count += 1
+            total_chars += len(text)
+    except Exception as e:
+        return {"success": False, "error": str(e), "pages": page_count}
+    result = {"success": True, "format": fmt, "pages": page_count, "chars": total_chars}
+    if boilerplate:
+        result["boilerplate_removed"] = saved
+    if profile != "faithful" and paths:
+        result["profile"] = profile
+        result["paths"] = paths
+    return result
+
+
+def stream_via_gateway(gateway_path, input_path, out, pages=None):
+    """--stream（gateway 後端）：gateway 無逐頁輸出，直接轉送其 stdout，不整段保留於記憶體。
+    若 gateway 回傳 JSON 包裝則無法串流，解析後一次寫出。
+    """
+    cmd = [sys.executable, gateway_path, "--input", str(input_path)]
+    if pages:
+        cmd.extend(["--pages", pages])
+    cmd.extend(["--output", "-"])
+
+    total_chars = 0
+    # stderr 導向暫存檔，避免 stderr 管線塞滿時與 stdout 讀取互相阻塞
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as err, subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=err, text=True, encoding="utf-8"
+    ) as proc:
+        first = proc.stdout.read(65536)
+        if first.lstrip().startswith("{"):
+            content = first + proc.stdout.read()
+            try:
+                data = json.loads(content)
+                if not data.get("success"):
+                    return {"success": False, "error": data.get("error", "gateway returned failure")}
+                content = data.get("content", "")
+            except json.JSONDecodeError:
+                pass  # 以 { 開頭的 markdown
+            out.write(content)
+            total_chars = len(content)
+        else:
+            block = first
+            while block:
+                out.write(block)
+                out.flush()
+                total_chars += len(block)
+                block = proc.stdout.read(65536)
+        if proc.wait() != 0:
+            err.seek(0)
+            return {"success": False, "error": err.read() or "gateway failed"}
+    return {"success": True, "format": "markdown", "chars": total_chars}
+
+
+def _page_entry(page):
+    """逐頁快取項目名稱（page 為 0-based 索引）"""
+    return f"p{page + 1:05d}"
+
+
+def _range_cache_key(pages):
+    """gateway 整段快取的項目名稱：正規化後頁碼集合的雜湊"""
+    normalized = ",".join(map(str, parse_page_range(pages))) if pages else "all"
+    return "r" + hashlib.sha256(normalized.encode()).hexdigest()[:16]
 
 
 def parse_page_range(pages_str):
@@ -108,120 +871,2057 @@ def parse_page_range(pages_str):
     return sorted(set(result))
 
 
-def get_pdf_info(input_path):
-    """取得 PDF 基本資訊"""
+PYMUPDF_MISSING = {"success": False, "error": "需要安裝 pymupdf：pip install pymupdf4llm"}
+
+# ── token 估算 ─────────────────────────────────────────
+# 依文字系統分類計數，各自套用字元/token 比例（空白併入相鄰 token，不計）。
+# 比例取常見 BPE tokenizer 的經驗值；信心值反映比例本身的不確定性。
+SCRIPT_CHARS_PER_TOKEN = {
+    "cjk": 1.5,          # 中日韓文字：約 1.5 字/token
+    "latin": 3.3,        # 拉丁字母（不含空白）：英文約 4 字元/token 含空白
+    "digit_punct": 2.0,  # 數字與標點：常自成 token
+    "other": 3.0,        # 其他文字系統
+}
+SCRIPT_CONFIDENCE = {"cjk": 0.85, "latin": 0.9, "digit_punct": 0.8, "other": 0.6}
+
+_CJK_RE = re.compile(
+    "[\u2e80-\u2fdf\u3000-\u303f\u3040-\u30ff\u3100-\u31ff\u3400-\u4dbf"
+    "\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef]"
+)
+_LATIN_RE = re.compile("[A-Za-z\u00c0-\u024f]")
+_DIGIT_PUNCT_RE = re.compile("[0-9!-/:-@\\[-`{-~\u00a1-\u00bf\u2000-\u206f]")
+_SPACE_RE = re.compile(r"\s")
+
+
+def count_scripts(text):
+    """依文字系統分類計數：{cjk, latin, digit_punct, other}（不含空白）"""
+    cjk = len(_CJK_RE.findall(text))
+    latin = len(_LATIN_RE.findall(text))
+    digit_punct = len(_DIGIT_PUNCT_RE.findall(text))
+    other = len(text) - len(_SPACE_RE.findall(text)) - cjk - latin - digit_punct
+    return {"cjk": cjk, "latin": latin, "digit_punct": digit_punct, "other": max(other, 0)}
+
+
+def tokens_from_scripts(counts):
+    """文字系統計數 → 預估 token 數"""
+    return int(sum(counts[k] / SCRIPT_CHARS_PER_TOKEN[k] for k in SCRIPT_CHARS_PER_TOKEN))
+
+
+def estimate_text_tokens(text, tokenizer=None):
+    """文字 → 預估 token 數；有 tokenizer 時直接計數"""
+    if tokenizer is not None:
+        return tokenizer(text)
+    return tokens_from_scripts(count_scripts(text))
+
+
+def load_tokenizer(spec):
+    """載入可插拔 tokenizer，回傳 text → token 數的函式。
+    spec 格式：
+      tiktoken[:編碼名稱]     需安裝 tiktoken（預設 cl100k_base）
+      模組:函式               自訂函式，接受文字、回傳 token 數或 token 序列
+    """
+    name, _, arg = spec.partition(":")
+    if name == "tiktoken":
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError("--tokenizer tiktoken 需要安裝 tiktoken：pip install tiktoken")
+        encoding = tiktoken.get_encoding(arg or "cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    if not arg:
+        raise ValueError(f"無法解析 tokenizer：{spec}（格式為 tiktoken[:編碼] 或 模組:函式）")
+    import importlib
+
+    func = getattr(importlib.import_module(name), arg)
+
+    def count(text):
+        result = func(text)
+        return result if isinstance(result, int) else len(result)
+
+    return count
+
+
+# 每個行程各自載入的 tokenizer（process pool 的子行程也各有一份），避免每個分塊重新載入
+_tokenizers = {}
+
+
+def _get_tokenizer(spec):
+    """依 spec 取得本行程已載入的 tokenizer；spec 為 None 時回傳 None（改用文字系統估算）"""
+    if spec is None:
+        return None
+    if spec not in _tokenizers:
+        _tokenizers[spec] = load_tokenizer(spec)
+    return _tokenizers[spec]
+
+
+def _scan_pages(input_path, page_indices, tokenizer_spec=None):
+    """逐頁取純文字統計（供 process pool 平行掃描；每個 worker 自行開檔）"""
+    pymupdf = _import_pymupdf()
+    tokenizer = load_tokenizer(tokenizer_spec) if tokenizer_spec else None
+    stats = []
+    with pymupdf.open(str(input_path)) as doc:
+        for i in page_indices:
+            stats.append(_page_stats(doc[i].get_text(), tokenizer))
+    return stats
+
+
+def _page_stats(text, tokenizer=None):
+    counts = count_scripts(text)
+    tokens = tokenizer(text) if tokenizer is not None else tokens_from_scripts(counts)
+    return {"chars": len(text), **counts, "tokens": tokens}
+
+
+def _import_pymupdf():
+    """匯入 pymupdf（舊版名稱為 fitz）；皆不可用時回傳 None"""
     try:
         import pymupdf
     except ImportError:
         try:
             import fitz as pymupdf
         except ImportError:
-            return {"success": False, "error": "需要安裝 pymupdf：pip install pymupdf4llm"}
+            return None
+    return pymupdf
+
+
+# ── 頁首頁尾去除 ────────────────────────────────────────
+# 書眉、頁碼、版權頁尾與重複的章名會出現在每一頁，全部送進分析只是浪費 token。
+# 一次掃描全書純文字：每頁頂端與底端各 BOILERPLATE_ZONE_LINES 行，依
+# (位置區, 正規化文字) 的雜湊計數出現頁數，達 BOILERPLATE_MIN_PAGES 頁即視為頁首頁尾。
+# 正規化時數字一律替換為 #，讓「第 12 頁」「第 13 頁」視為同一行。時間與頁數成線性。
+
+BOILERPLATE_ZONE_LINES = 2
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_MAX_CHARS = 80  # 超過此長度的行視為正文，不列入
+NO_BOILERPLATE = {"lines": 0, "chars": 0, "estimated_tokens": 0}
+_MARKUP_RE = re.compile(r"[#*_`>|\[\]]")
+_DIGITS_RE = re.compile(r"\d+")
+_ROMAN_RE = re.compile(r"[ivxlcdm]+")
+
+
+def _boilerplate_key(zone, line, exact=False):
+    """(位置區, 正規化文字) 的 64-bit 雜湊；不適合比對的行回傳 None。
+    exact 時只接受不需數字正規化的行（不含數字、也不是羅馬數字），
+    避免頁界未知時把正文裡的「第 3 章」「1984」之類誤認為頁碼。
+    """
+    text = " ".join(_MARKUP_RE.sub("", line).split()).lower()
+    folded = _DIGITS_RE.sub("#", text)
+    if not folded or len(folded) > BOILERPLATE_MAX_CHARS:
+        return None
+    if _ROMAN_RE.fullmatch(folded):  # 前言的羅馬數字頁碼
+        folded = "#"
+    if exact and folded != text:
+        return None
+    text = folded
+    digest = hashlib.blake2b(f"{zone}\0{text}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _zone_lines(lines, zone_lines):
+    """回傳 [(行索引, 位置區)]：前 zone_lines 個非空行為 top，後 zone_lines 個為 bottom"""
+    nonempty = [i for i, line in enumerate(lines) if line.strip()]
+    return [(i, "top") for i in nonempty[:zone_lines]] + [
+        (i, "bottom") for i in nonempty[-zone_lines:]
+    ]
+
+
+def find_boilerplate(page_texts, min_pages=BOILERPLATE_MIN_PAGES):
+    """單次掃描逐頁文字，回傳頁首頁尾的雜湊集合（frozenset，可傳給平行 worker）"""
+    counts = {}
+    for text in page_texts:
+        lines = text.splitlines()
+        keys = {
+            _boilerplate_key(zone, lines[i]) for i, zone in _zone_lines(lines, BOILERPLATE_ZONE_LINES)
+        }
+        keys.discard(None)
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    return frozenset(key for key, n in counts.items() if n >= min_pages)
 
-    doc = pymupdf.open(str(input_path))
-    info = doc.metadata or {}
-    page_count = len(doc)
-    file_size = os.path.getsize(input_path)
 
-    # 估算文字量（前中後分散取樣，避免封面/空白頁偏差）
-    if page_count <= 10:
-        sample_indices = list(range(page_count))
+def strip_boilerplate(text, keys, paged=True):
+    """自 markdown 去除頁首頁尾，回傳 (文字, {lines, chars, estimated_tokens})。
+    paged 為單頁內容時只檢查頂端與底端幾行；否則（gateway 整段輸出，頁界未知）逐行比對，
+    但只去除與頁首頁尾原文相同的行：含數字的行（頁碼、帶頁碼的書眉）一律保留，以免誤刪正文。
+    markdown 標題行一律保留，避免誤刪章節開頭的真正標題。
+    """
+    if not keys:
+        return text, dict(NO_BOILERPLATE)
+    lines = text.split("\n")
+    if paged:
+        # markdown 的首尾可能多出圖片或分隔行，檢查範圍比偵測時寬一行
+        candidates = _zone_lines(lines, BOILERPLATE_ZONE_LINES + 1)
     else:
-        # 跳過前 3 頁（封面/版權），從前段、中段、後段各取樣
-        front = list(range(3, min(8, page_count)))
-        mid_start = page_count // 2 - 2
-        middle = list(range(max(mid_start, 0), min(mid_start + 5, page_count)))
-        back_start = max(page_count - 8, 0)
-        back = list(range(back_start, page_count - 1))  # 跳過最後一頁（常為空白）
-        sample_indices = sorted(set(front + middle + back))
-    sample_count = len(sample_indices)
-    total_chars = sum(len(doc[i].get_text()) for i in sample_indices)
-    avg_chars_per_page = total_chars / sample_count if sample_count > 0 else 0
-    estimated_chars = int(avg_chars_per_page * page_count)
-    # 粗估 token（中文約 1.5 字/token，英文約 4 字/token，取平均 2.5）
-    estimated_tokens = int(estimated_chars / 2.5)
-
-    doc.close()
+        candidates = [(i, zone) for i in range(len(lines)) for zone in ("top", "bottom")]
+    removed = set()
+    for i, zone in candidates:
+        if i not in removed and not lines[i].lstrip().startswith("#"):
+            if _boilerplate_key(zone, lines[i], exact=not paged) in keys:
+                removed.add(i)
+    if not removed:
+        return text, dict(NO_BOILERPLATE)
+    removed_text = "\n".join(lines[i] for i in sorted(removed))
+    kept = "\n".join(line for i, line in enumerate(lines) if i not in removed)
+    return re.sub(r"\n{3,}", "\n\n", kept), {
+        "lines": len(removed),
+        "chars": len(removed_text) - len(removed) + 1,
+        "estimated_tokens": estimate_text_tokens(removed_text),
+    }
+
+
+def add_boilerplate_saved(total, saved):
+    """累加去除量（lines / chars / estimated_tokens）"""
+    for key in NO_BOILERPLATE:
+        total[key] += saved[key]
+    return total
+
+
+class BookSession:
+    """單次開檔的書籍工作階段（PDF / EPUB / TXT 共用的 info、目錄與分塊計畫邏輯）。
+    子類別提供 page_count、page_stats()、extract()、_metadata()、_read_toc()。
+    """
+
+    toc_note = "此書無內嵌目錄"
+    unit = "page"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def boilerplate(self):
+        """頁首頁尾雜湊集合（見 find_boilerplate）；僅 PDF 有固定版面的書眉與頁碼"""
+        return frozenset()
+
+    def page_labels(self):
+        """逐頁的書上頁碼（如 xii、212）；僅 PDF 可能定義，沒有時回傳 None"""
+        return None
+
+    def page_chars(self):
+        """逐頁純文字長度"""
+        return [stat["chars"] for stat in self.page_stats()]
+
+    def page_tokens(self):
+        """逐頁預估 token 數"""
+        return [stat["tokens"] for stat in self.page_stats()]
+
+    def info(self, per_page=False):
+        """書籍基本資訊：全書逐頁掃描純文字，依文字系統比例（或 tokenizer）估算 token。
+        confidence 綜合比例的不確定性與有文字層的頁面比例（掃描檔無文字層時偏低）。
+        """
+        title, author = self._metadata()
+        page_count = self.page_count
+        file_size = os.path.getsize(self.input_path)
+        stats = self.page_stats()
+
+        totals = {k: sum(stat[k] for stat in stats) for k in SCRIPT_CHARS_PER_TOKEN}
+        estimated_chars = sum(stat["chars"] for stat in stats)
+        estimated_tokens = sum(stat["tokens"] for stat in stats)
+        script_chars = sum(totals.values())
+
+        if self.tokenizer:
+            ratio_confidence = 1.0
+        elif script_chars:
+            ratio_confidence = sum(
+                SCRIPT_CONFIDENCE[k] * n / script_chars for k, n in totals.items()
+            )
+        else:
+            ratio_confidence = 0.0
+        # 容許約兩成空白/圖片頁，超過才降低信心
+        text_pages = sum(1 for stat in stats if stat["chars"] >= 20)
+        coverage = min(1.0, text_pages / page_count / 0.8) if page_count else 0.0
+
+        info = {
+            "success": True,
+            "title": title,
+            "author": author,
+            "page_count": page_count,
+            "file_size_mb": round(file_size / 1024 / 1024, 1),
+            "estimated_chars": estimated_chars,
+            "estimated_tokens": estimated_tokens,
+            "needs_chunking": estimated_tokens > 80000,
+            "suggested_chunks": max(1, -(-estimated_tokens // 60000)),  # 無條件進位
+            "script_mix": {
+                k: round(n / script_chars, 3) if script_chars else 0.0 for k, n in totals.items()
+            },
+            "estimation_method": f"tokenizer:{self.tokenizer}" if self.tokenizer else "script-ratio",
+            "confidence": round(ratio_confidence * coverage, 2),
+            "text_pages": text_pages,
+        }
+        if self.unit != "page":
+            info["unit"] = self.unit
+        if per_page:
+            info["page_chars"] = self.page_chars()
+            info["page_tokens"] = self.page_tokens()
+        return info
+
+    def toc(self):
+        """目錄結構"""
+        if self._toc is None:
+            with TIMINGS.stage("toc"):
+                self._toc = self._read_toc()
+        if not self._toc:
+            return {"success": True, "toc": [], "note": self.toc_note}
+        return {"success": True, "toc": self._toc}
+
+    def plan(self, chunk_size=None, max_tokens=None, toc_level=None):
+        """分塊計畫：[(起始頁, 結束頁, 預估 token, [章節標題] 或 None)]（1-based），
+        以及實際採用的切分方式（pages / tokens / toc:N）"""
+        page_tokens = self.page_tokens() if max_tokens else None
+        toc_entries = self.toc()["toc"] if toc_level else []
+
+        if toc_entries:
+            ranges = plan_toc_chunks(
+                toc_entries, self.page_count, toc_level, page_tokens, chunk_size, max_tokens
+            )
+            return ranges, f"toc:{toc_level}"
+        if max_tokens:
+            ranges = [(a, b, t, None) for a, b, t in plan_token_chunks(page_tokens, max_tokens)]
+            return ranges, "tokens"
+        # 無內嵌目錄的 --chunk-by toc 未指定預算時，退回 30 頁一塊
+        size = chunk_size or 30
+        ranges = [
+            (start, min(start + size - 1, self.page_count), None, None)
+            for start in range(1, self.page_count + 1, size)
+        ]
+        return ranges, "pages"
+
+
+class DocumentSession(BookSession):
+    """單次開檔的 PDF 工作階段。
+    info / toc / 逐頁統計 / 分塊計畫共用同一個已開啟的 document，
+    逐頁統計（純文字，不做 markdown 轉換）只掃描一次。
+
+    用法：
+      with DocumentSession("book.pdf") as session:
+          plan = session.plan(max_tokens=60000, toc_level=1)
+    """
+
+    toc_note = "此 PDF 無內嵌目錄"
+
+    def __init__(self, input_path, tokenizer=None, workers=1):
+        pymupdf = _import_pymupdf()
+        if pymupdf is None:
+            raise ImportError(PYMUPDF_MISSING["error"])
+        self.input_path = Path(input_path)
+        self.doc = pymupdf.open(str(input_path))
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self._page_stats = None
+        self._toc = None
+        self._boilerplate = None
+
+    def close(self):
+        self.doc.close()
+
+    @property
+    def page_count(self):
+        return len(self.doc)
+
+    def page_stats(self):
+        """逐頁統計：[{chars, cjk, latin, digit_punct, other, tokens}]，結果快取於 session。
+        workers > 1 且頁數夠多時，以 process pool 分段平行掃描。
+        """
+        if self._page_stats is None:
+            page_count = self.page_count
+            if self.workers > 1 and page_count >= 200:
+                from concurrent.futures import ProcessPoolExecutor
+
+                step = -(-page_count // self.workers)
+                parts = [range(i, min(i + step, page_count)) for i in range(0, page_count, step)]
+                with TIMINGS.stage("scan:stats", page_count), ProcessPoolExecutor(
+                    max_workers=len(parts)
+                ) as pool:
+                    results = pool.map(
+                        _scan_pages, [self.input_path] * len(parts), parts,
+                        [self.tokenizer] * len(parts),
+                    )
+                    self._page_stats = [stat for part in results for stat in part]
+            else:
+                tokenizer = load_tokenizer(self.tokenizer) if self.tokenizer else None
+                with TIMINGS.stage("scan:stats", page_count):
+                    self._page_stats = [_page_stats(page.get_text(), tokenizer) for page in self.doc]
+        return self._page_stats
+
+    def boilerplate(self):
+        """單次掃描全書純文字，找出頁首頁尾（結果快取於 session）"""
+        if self._boilerplate is None:
+            with TIMINGS.stage("scan:boilerplate", self.page_count):
+                self._boilerplate = find_boilerplate(page.get_text() for page in self.doc)
+        return self._boilerplate
+
+    def extract(
+        self, pages=None, use_cache=False, boilerplate=None, profile="faithful", return_pages=False
+    ):
+        return extract_via_pymupdf(
+            self.input_path, pages, use_cache, doc=self.doc, boilerplate=boilerplate,
+            profile=profile, return_pages=return_pages,
+        )
+
+    def _metadata(self):
+        metadata = self.doc.metadata or {}
+        return metadata.get("title", ""), metadata.get("author", "")
+
+    def page_labels(self):
+        # 多數 PDF 未定義頁碼標籤：先查規則，沒有時不逐頁呼叫 get_label()
+        if not self.doc.get_page_labels():
+            return None
+        labels = [page.get_label() for page in self.doc]
+        return labels if any(labels) else None
+
+    def _read_toc(self):
+        return [
+            {"level": level, "title": title, "page": page}
+            for level, title, page in self.doc.get_toc()
+        ]
+
+
+# ── EPUB ───────────────────────────────────────────────
+# 內建 EPUB 讀取：直接從 zip 讀 OPF spine 與 nav/NCX 目錄，逐一將 spine 項目
+# （XHTML）轉為 markdown。EPUB 沒有固定頁碼，以 spine 項目（通常一章一檔）
+# 作為「頁」：--pages、--chunk-size、目錄頁碼皆指 spine 項目的序號（1-based）。
+
+_OPF_NS = "{http://www.idpf.org/2007/opf}"
+_DC_NS = "{http://purl.org/dc/elements/1.1/}"
+_NCX_NS = "{http://www.daisy.org/z3986/2005/ncx/}"
+_XHTML_NS = "{http://www.w3.org/1999/xhtml}"
+_OPS_NS = "{http://www.idpf.org/2007/ops}"
+_CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+EPUB_BACKEND = "epub-native-2"  # 轉換規則變更時遞增，讓快取失效
+
+
+class _HtmlToMarkdown(HTMLParser):
+    """XHTML → markdown 的輕量轉換（標題、段落、清單、強調、引言、程式碼、表格）"""
+
+    _BLOCKS = {
+        "p", "div", "section", "article", "header", "footer", "aside", "figure",
+        "figcaption", "table", "dl", "dt", "dd", "body", "nav", "main",
+    }
+    _SKIP = {"head", "script", "style", "title", "svg", "math"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self._skip = 0
+        self._lists = []
+        self._quote = 0
+        self._pre = 0
+        self._tables = []  # 每層表格：[已完成列數, 目前列的儲存格數]
+        self._line_start = True
+
+    def _write(self, text):
+        if not text:
+            return
+        if self._line_start and self._quote and not self._pre:
+            self.out.append("> " * self._quote)
+        self.out.append(text)
+        self._line_start = text.endswith("\n")
+
+    def _block(self):
+        """結束目前區塊：確保後面接一個空行"""
+        if not self.out:
+            return
+        tail = "".join(self.out[-2:])
+        blank = ("> " * self._quote).rstrip() + "\n"  # 引言內的空行保留 > 前綴
+        if not tail.endswith("\n" + blank) and not tail.endswith("\n\n"):
+            self.out.append(blank if tail.endswith("\n") else "\n" + blank)
+        self._line_start = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip += 1
+            return
+        if self._skip:
+            return
+        if len(tag) == 2 and tag[0] == "h" and tag[1] in "123456":
+            self._block()
+            self._write("#" * int(tag[1]) + " ")
+        elif tag in self._BLOCKS:
+            self._block()
+            if tag == "table":
+                self._tables.append([0, 0])
+        elif tag == "br":
+            self._write("\n")
+        elif tag in ("ul", "ol"):
+            if not self._lists:
+                self._block()
+            self._lists.append([tag, 0])
+        elif tag == "li":
+            if not self._line_start:
+                self._write("\n")
+            depth = max(len(self._lists) - 1, 0)
+            marker = "- "
+            if self._lists and self._lists[-1][0] == "ol":
+                self._lists[-1][1] += 1
+                marker = f"{self._lists[-1][1]}. "
+            self._write("  " * depth + marker)
+        elif tag in ("em", "i"):
+            self._write("*")
+        elif tag in ("strong", "b"):
+            self._write("**")
+        elif tag == "blockquote":
+            self._block()
+            self._quote += 1
+        elif tag == "pre":
+            self._block()
+            self._write("```\n")
+            self._pre += 1
+        elif tag == "code" and not self._pre:
+            self._write("`")
+        elif tag == "tr":
+            if not self._line_start:
+                self._write("\n")
+            self._write("|")
+            if self._tables:
+                self._tables[-1][1] = 0
+        elif tag in ("td", "th"):
+            self._write(" ")
+            if self._tables:
+                self._tables[-1][1] += 1
+        elif tag == "hr":
+            self._block()
+            self._write("---")
+            self._block()
+        elif tag == "img":
+            alt = dict(attrs).get("alt")
+            if alt:
+                self._write(f"[{alt}]")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP:
+            self._skip = max(self._skip - 1, 0)
+            return
+        if self._skip:
+            return
+        if (len(tag) == 2 and tag[0] == "h" and tag[1] in "123456") or tag in self._BLOCKS:
+            self._block()
+            if tag == "table" and self._tables:
+                self._tables.pop()
+        elif tag in ("ul", "ol"):
+            if self._lists:
+                self._lists.pop()
+            if not self._lists:
+                self._block()
+        elif tag in ("em", "i"):
+            self._write("*")
+        elif tag in ("strong", "b"):
+            self._write("**")
+        elif tag == "blockquote":
+            # 去掉引言結尾多出的空引言行（">"），再於引言外補空行
+            blank = ("> " * self._quote).rstrip() + "\n"
+            if self.out and "".join(self.out[-2:]).endswith("\n" + blank):
+                self.out[-1] = self.out[-1][: -len(blank)]
+            self._quote = max(self._quote - 1, 0)
+            self._block()
+        elif tag == "pre":
+            self._pre = max(self._pre - 1, 0)
+            if not self._line_start:
+                self._write("\n")
+            self._write("```")
+            self._block()
+        elif tag == "code" and not self._pre:
+            self._write("`")
+        elif tag in ("td", "th"):
+            self._write(" |")
+        elif tag == "tr" and self._tables:
+            # GFM 表格：第一列為表頭，其後須接分隔列
+            rows, cells = self._tables[-1]
+            if rows == 0 and cells:
+                self._write("\n|" + " --- |" * cells)
+            self._tables[-1][0] += 1
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._pre:
+            self._write(data)
+            return
+        text = re.sub(r"\s+", " ", data)
+        if self._line_start:
+            text = text.lstrip()
+        self._write(text)
+
+    def markdown(self):
+        text = "".join(self.out)
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        text = re.sub(r"\n{3,}", "\n\n", text)
+        return text.strip() + "\n"
+
+
+def html_to_markdown(html_text):
+    """XHTML 文件 → markdown"""
+    parser = _HtmlToMarkdown()
+    parser.feed(html_text)
+    parser.close()
+    return parser.markdown()
+
+
+def _epub_resolve(base_path, href):
+    """將 OPF / 目錄中的相對 href 轉為 zip 內路徑（去除 #錨點）"""
+    href = unquote(href.split("#", 1)[0])
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_path), href))
 
+
+class EpubSession(BookSession):
+    """內建 EPUB 工作階段：開一次 zip，讀取 OPF（metadata、manifest、spine）與 nav/NCX 目錄。
+    「頁」為 spine 項目；逐頁統計以實際轉換後的 markdown 計算。
+    """
+
+    toc_note = "此 EPUB 無目錄"
+    unit = "spine_item"
+
+    def __init__(self, input_path, tokenizer=None, workers=1):
+        self.input_path = Path(input_path)
+        self.zip = zipfile.ZipFile(str(input_path))
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self._page_stats = None
+        self._toc = None
+        try:
+            self._read_package()
+        except Exception:
+            self.zip.close()
+            raise
+
+    def close(self):
+        self.zip.close()
+
+    def _read_package(self):
+        container = ET.fromstring(self.zip.read("META-INF/container.xml"))
+        rootfile = container.find(f".//{_CONTAINER_NS}rootfile")
+        if rootfile is None:
+            raise ValueError("EPUB 缺少 META-INF/container.xml 的 rootfile")
+        self.opf_path = rootfile.get("full-path")
+        opf = ET.fromstring(self.zip.read(self.opf_path))
+
+        metadata = opf.find(f"{_OPF_NS}metadata")
+        title = metadata.findtext(f"{_DC_NS}title", "") if metadata is not None else ""
+        author = metadata.findtext(f"{_DC_NS}creator", "") if metadata is not None else ""
+        self._title, self._author = title.strip(), author.strip()
+
+        self.manifest = {}
+        for item in opf.iterfind(f"{_OPF_NS}manifest/{_OPF_NS}item"):
+            self.manifest[item.get("id")] = {
+                "path": _epub_resolve(self.opf_path, item.get("href", "")),
+                "media_type": item.get("media-type", ""),
+                "properties": (item.get("properties") or "").split(),
+            }
+        spine = opf.find(f"{_OPF_NS}spine")
+        self.spine = []
+        self._ncx_id = None
+        if spine is not None:
+            self._ncx_id = spine.get("toc")
+            for ref in spine.iterfind(f"{_OPF_NS}itemref"):
+                item = self.manifest.get(ref.get("idref"))
+                if item and "html" in item["media_type"]:
+                    self.spine.append(item["path"])
+        self._spine_index = {path: i for i, path in enumerate(self.spine)}
+
+    @property
+    def page_count(self):
+        return len(self.spine)
+
+    def _metadata(self):
+        return self._title, self._author
+
+    def item_markdown(self, index):
+        """將第 index 個 spine 項目（0-based）轉為 markdown"""
+        with TIMINGS.stage("convert:epub", 1):
+            raw = self.zip.read(self.spine[index])
+            return html_to_markdown(raw.decode("utf-8", errors="replace"))
+
+    def iter_items(self, indices=None, workers=None):
+        """依序產生 (索引, markdown)；workers > 1 時以 process pool 平行轉換各章，仍依序輸出"""
+        indices = list(range(self.page_count)) if indices is None else list(indices)
+        workers = self.workers if workers is None else workers
+        if workers > 1 and len(indices) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(indices))) as pool:
+                results = pool.map(
+                    _convert_epub_item, [str(self.input_path)] * len(indices), indices,
+                    chunksize=max(1, len(indices) // (workers * 4)),
+                )
+                yield from zip(indices, results)
+        else:
+            for i in indices:
+                yield i, self.item_markdown(i)
+
+    def page_stats(self):
+        if self._page_stats is None:
+            tokenizer = load_tokenizer(self.tokenizer) if self.tokenizer else None
+            self._page_stats = [_page_stats(text, tokenizer) for _, text in self.iter_items()]
+        return self._page_stats
+
+    def extract(
+        self, pages=None, use_cache=False, boilerplate=None, profile="faithful", return_pages=False
+    ):
+        return extract_via_epub(
+            self.input_path, pages, use_cache, session=self, return_pages=return_pages
+        )
+
+    def _read_toc(self):
+        nav = next(
+            (item for item in self.manifest.values() if "nav" in item["properties"]), None
+        )
+        if nav is not None:
+            try:
+                entries = self._read_nav(nav["path"])
+                if entries:
+                    return entries
+            except ET.ParseError:
+                pass  # nav 非合法 XML 時改讀 NCX
+        ncx = self.manifest.get(self._ncx_id) if self._ncx_id else None
+        if ncx is None:
+            ncx = next(
+                (item for item in self.manifest.values()
+                 if item["media_type"] == "application/x-dtbncx+xml"), None
+            )
+        if ncx is not None:
+            return self._read_ncx(ncx["path"])
+        return []
+
+    def _toc_entry(self, level, title, base_path, href):
+        index = self._spine_index.get(_epub_resolve(base_path, href))
+        if index is None or not title:
+            return None
+        return {"level": level, "title": " ".join(title.split()), "page": index + 1}
+
+    def _read_nav(self, nav_path):
+        root = ET.fromstring(self.zip.read(nav_path))
+        toc_nav = None
+        for nav in root.iter(f"{_XHTML_NS}nav"):
+            if nav.get(f"{_OPS_NS}type") == "toc":
+                toc_nav = nav
+                break
+        if toc_nav is None:
+            return []
+        entries = []
+
+        def walk(ol, level):
+            for li in ol.findall(f"{_XHTML_NS}li"):
+                link = li.find(f"{_XHTML_NS}a")
+                if link is not None:
+                    entry = self._toc_entry(
+                        level, "".join(link.itertext()), nav_path, link.get("href", "")
+                    )
+                    if entry:
+                        entries.append(entry)
+                child = li.find(f"{_XHTML_NS}ol")
+                if child is not None:
+                    walk(child, level + 1)
+
+        top = toc_nav.find(f"{_XHTML_NS}ol")
+        if top is not None:
+            walk(top, 1)
+        return entries
+
+    def _read_ncx(self, ncx_path):
+        root = ET.fromstring(self.zip.read(ncx_path))
+        entries = []
+
+        def walk(parent, level):
+            for point in parent.findall(f"{_NCX_NS}navPoint"):
+                title = point.findtext(f"{_NCX_NS}navLabel/{_NCX_NS}text", "")
+                content = point.find(f"{_NCX_NS}content")
+                if content is not None:
+                    entry = self._toc_entry(level, title, ncx_path, content.get("src", ""))
+                    if entry:
+                        entries.append(entry)
+                walk(point, level + 1)
+
+        nav_map = root.find(f"{_NCX_NS}navMap")
+        if nav_map is not None:
+            walk(nav_map, 1)
+        return entries
+
+
+_epub_sessions = {}
+
+
+def _convert_epub_item(input_path, index):
+    """process pool worker：轉換單一 spine 項目（每個行程各自保留開啟的 EPUB）"""
+    session = _epub_sessions.get(input_path)
+    if session is None:
+        session = _epub_sessions[input_path] = EpubSession(input_path)
+    return session.item_markdown(index)
+
+
+# ── 純文字（TXT / Project Gutenberg）────────────────────
+# 串流讀取：不整份載入記憶體，一次掃描即得逐頁統計與章節標題。
+# 「頁」為約 TXT_PAGE_CHARS 字的文字區塊（於空行處切開），章節標題處另起新頁，
+# 讓依目錄分塊時章節邊界與頁邊界對齊。
+
+TXT_PAGE_CHARS = 2000
+TXT_HEADER_LINES = 600  # Gutenberg 檔頭（授權說明）出現在檔案開頭的最大行數
+TXT_MIN_SECTION_CHARS = 100  # 標題後正文少於此字數視為目錄列表（見 TextSession._scan）
+TEXT_ENCODINGS = ("utf-8", "gb18030", "big5", "cp1252")
+
+_GUTENBERG_START_RE = re.compile(
+    r"^\s*(?:\*{3}\s*START OF (?:THE|THIS) PROJECT GUTENBERG|\*END\*THE SMALL PRINT)", re.I
+)
+_GUTENBERG_END_RE = re.compile(
+    r"^\s*(?:\*{3}\s*END OF (?:THE|THIS) PROJECT GUTENBERG|End of (?:the )?Project Gutenberg)",
+    re.I,
+)
+_GUTENBERG_FIELD_RE = re.compile(r"^(Title|Author|Language):\s*(.+)")
+_DECLARED_CHARSET_RE = re.compile(rb"Character set encoding:\s*([\w-]+)", re.I)
+_CJK_HEADING_RE = re.compile(r"^第[一二三四五六七八九十百千零〇两兩\d０-９]+([部篇卷章回節节])")
+_LATIN_HEADING_RE = re.compile(
+    r"^(PART|Part|BOOK|Book|CHAPTER|Chapter)\s+([IVXLCDM]+|\d+|[A-Z][A-Za-z-]+)\b"
+)
+# 標題種類由大到小；實際層級依書中出現的種類排序決定
+HEADING_KINDS = ("部", "篇", "卷", "章", "回", "節", "part", "book", "chapter")
+_CJK_PUNCT = "，。、「」：；？！"
+
+
+def is_text_path(input_path):
+    return Path(input_path).suffix.lower() in (".txt", ".text")
+
+
+def detect_text_encoding(input_path, sample_size=65536):
+    """偵測純文字檔編碼：BOM → Gutenberg 檔頭宣告 → 依序試解 utf-8 / gb18030 / big5 / cp1252。
+    gb18030 與 big5 都能解開時，取中文標點較多者（big5 位元組必可被 gb18030 解成亂碼）。
+    """
+    with open(input_path, "rb") as f:
+        sample = f.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    final = len(sample) < sample_size
+
+    def decodes(encoding):
+        try:
+            return codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+        except (UnicodeDecodeError, LookupError):
+            return None
+
+    declared = _DECLARED_CHARSET_RE.search(sample)
+    if declared:
+        name = declared.group(1).decode("ascii").lower()
+        name = "utf-8" if name in ("ascii", "us-ascii") else name
+        if decodes(name) is not None:
+            return name
+    if decodes("utf-8") is not None:
+        return "utf-8"
+    cjk = [(enc, text) for enc in ("gb18030", "big5") if (text := decodes(enc)) is not None]
+    if cjk:
+        return max(cjk, key=lambda item: sum(item[1].count(c) for c in _CJK_PUNCT))[0]
+    return "cp1252" if decodes("cp1252") is not None else "latin-1"
+
+
+def _heading_kind(line, prev_blank):
+    """判斷一行是否為章節標題，回傳種類（見 HEADING_KINDS）或 None。
+    英文標題需前有空行，以免誤判內文中的 "Chapter 3 shows..."。
+    """
+    if not line or len(line) > 60:
+        return None
+    match = _CJK_HEADING_RE.match(line)
+    if match:
+        return "節" if match.group(1) == "节" else match.group(1)
+    if prev_blank:
+        match = _LATIN_HEADING_RE.match(line)
+        if match:
+            return match.group(1).lower()
+    return None
+
+
+class TextSession(BookSession):
+    """純文字工作階段：串流掃描一次，建立頁邊界、逐頁統計與合成目錄（偵測到的章節標題）。
+    Project Gutenberg 檔案會略過檔頭與檔尾的授權說明，並自檔頭取得書名與作者。
+    """
+
+    toc_note = "未偵測到章節標題"
+    unit = "text_block"
+
+    def __init__(self, input_path, tokenizer=None, workers=1, encoding=None):
+        self.input_path = Path(input_path)
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self.encoding = encoding or detect_text_encoding(input_path)
+        self.header = {}
+        self.gutenberg = False
+        self._page_starts = None
+        self._page_stats = None
+        self._headings = None
+        self._toc = None
+
+    def _body_lines(self):
+        """逐行產生 (行號, 內容)，行號自正文起算；略過 Gutenberg 檔頭與檔尾"""
+        with open(self.input_path, encoding=self.encoding, errors="replace") as f:
+            head = list(itertools.islice(f, TXT_HEADER_LINES))
+            start = next(
+                (i for i, line in enumerate(head) if _GUTENBERG_START_RE.match(line)), None
+            )
+            if start is not None:
+                self.gutenberg = True
+                for line in head[:start]:
+                    match = _GUTENBERG_FIELD_RE.match(line.strip())
+                    if match:
+                        self.header.setdefault(match.group(1).lower(), match.group(2).strip())
+                head = head[start + 1:]
+            for n, line in enumerate(itertools.chain(head, f)):
+                if self.gutenberg and _GUTENBERG_END_RE.match(line):
+                    return
+                yield n, line
+
+    def _scan(self):
+        if self._page_starts is not None:
+            return
+        with TIMINGS.stage("scan:text") as counters:
+            self._scan_lines()
+            counters["pages"] = len(self._page_starts)
+
+    def _scan_lines(self):
+        tokenizer = load_tokenizer(self.tokenizer) if self.tokenizer else None
+        starts, stats, headings = [], [], []
+        lines, chars, body_chars = [], 0, 0
+        prev_blank = True
+
+        def flush():
+            stats.append(_page_stats("".join(lines), tokenizer))
+
+        for n, line in self._body_lines():
+            stripped = line.strip()
+            kind = _heading_kind(stripped, prev_blank)
+            # 前一章已有正文才另起新頁；連續的標題（書前目錄列表）留在同一頁
+            if kind and lines and body_chars >= TXT_MIN_SECTION_CHARS:
+                flush()
+                lines, chars, body_chars = [], 0, 0
+            if not lines:
+                starts.append(n)
+            lines.append(line)
+            chars += len(stripped)
+            if kind:
+                headings.append({"line": n, "kind": kind, "title": stripped,
+                                 "page": len(starts), "body": 0})
+            else:
+                body_chars += len(stripped)
+                if headings:
+                    headings[-1]["body"] += len(stripped)
+            prev_blank = not stripped
+            if chars >= TXT_PAGE_CHARS * 1.5 or (prev_blank and chars >= TXT_PAGE_CHARS):
+                flush()
+                lines, chars, body_chars = [], 0, 0
+        if lines:
+            flush()
+
+        # 正文過短的標題多半是書前目錄列表；但緊接著較小層級標題者（如 PART 之後的 CHAPTER）保留
+        headings = [
+            h for h, nxt in zip(headings, headings[1:] + [None])
+            if h["body"] >= TXT_MIN_SECTION_CHARS
+            or (nxt and HEADING_KINDS.index(nxt["kind"]) > HEADING_KINDS.index(h["kind"]))
+        ]
+        kinds = sorted({h["kind"] for h in headings}, key=HEADING_KINDS.index)
+        for h in headings:
+            h["level"] = min(kinds.index(h["kind"]) + 1, 3)
+        self._page_starts, self._page_stats, self._headings = starts, stats, headings
+
+    @property
+    def page_count(self):
+        self._scan()
+        return len(self._page_starts)
+
+    def page_stats(self):
+        self._scan()
+        return self._page_stats
+
+    def _metadata(self):
+        self._scan()
+        return self.header.get("title", ""), self.header.get("author", "")
+
+    def _read_toc(self):
+        self._scan()
+        return [{"level": h["level"], "title": h["title"], "page": h["page"]} for h in self._headings]
+
+    def info(self, per_page=False):
+        info = super().info(per_page)
+        info["encoding"] = self.encoding
+        info["gutenberg"] = self.gutenberg
+        if self.header.get("language"):
+            info["language"] = self.header["language"]
+        return info
+
+    def iter_pages(self, indices=None):
+        """依序產生 (頁索引, markdown)：再次串流讀檔，只保留目前這一頁；
+        偵測到的章節標題轉為 markdown 標題"""
+        self._scan()
+        starts = self._page_starts
+        wanted = set(range(len(starts)) if indices is None else indices)
+        wanted = {i for i in wanted if 0 <= i < len(starts)}
+        if not wanted:
+            return
+        last = max(wanted)
+        heading_lines = {h["line"]: h["level"] for h in self._headings}
+        page, buf = 0, []
+        for n, line in self._body_lines():
+            while page + 1 < len(starts) and n >= starts[page + 1]:
+                if page in wanted:
+                    yield page, "".join(buf)
+                buf = []
+                page += 1
+            if page > last:
+                return
+            if page in wanted:
+                level = heading_lines.get(n)
+                buf.append(f"{'#' * level} {line.strip()}\n" if level else line)
+        if page in wanted:
+            yield page, "".join(buf)
+
+    def extract(
+        self, pages=None, use_cache=False, boilerplate=None, profile="faithful", return_pages=False
+    ):
+        indices = parse_page_range(pages) if pages else None
+        self._scan()
+        with TIMINGS.stage("convert:text") as counters:
+            texts = [text for _, text in self.iter_pages(indices)]
+            counters["pages"] = len(texts)
+        result = {"success": True, "content": "".join(texts)}
+        if return_pages:
+            result["page_texts"] = texts
+        return result
+
+
+def iter_pages_text(input_path, pages=None, encoding=None):
+    """逐頁產生 (頁索引, markdown)；先串流掃描一次建立頁邊界"""
+    session = TextSession(input_path, encoding=encoding)
+    yield from session.iter_pages(parse_page_range(pages) if pages else None)
+
+
+def extract_via_text(input_path, pages=None, encoding=None):
+    """純文字提取（略過 Gutenberg 授權說明，章節標題轉為 markdown 標題）"""
+    return TextSession(input_path, encoding=encoding).extract(pages)
+
+
+def is_epub_path(input_path):
+    return Path(input_path).suffix.lower() == ".epub"
+
+
+def open_session(input_path, tokenizer=None, workers=1, encoding=None):
+    """依副檔名開啟對應的工作階段：EPUB → EpubSession、TXT → TextSession，其餘 → DocumentSession（PDF）。
+    encoding 僅用於 TXT（未指定時自動偵測）。
+    """
+    with TIMINGS.stage("open"):
+        if is_epub_path(input_path):
+            return EpubSession(input_path, tokenizer, workers)
+        if is_text_path(input_path):
+            return TextSession(input_path, tokenizer, workers, encoding)
+        return DocumentSession(input_path, tokenizer, workers)
+
+
+def _open_session_or_error(input_path, tokenizer=None, workers=1, encoding=None):
+    """回傳 (session, None) 或 (None, 錯誤 dict)"""
+    try:
+        return open_session(input_path, tokenizer, workers, encoding), None
+    except ImportError as e:
+        return None, {"success": False, "error": str(e)}
+    except (zipfile.BadZipFile, ET.ParseError, KeyError, ValueError) as e:
+        return None, {"success": False, "error": f"無法解析 EPUB：{e}"}
+
+
+def extract_document(
+    input_path, pages=None, use_cache=False, boilerplate=None, profile="faithful",
+    return_pages=False, encoding=None,
+):
+    """依副檔名選擇內建提取方式（不經 gateway）；boilerplate 與 profile 僅用於 PDF，encoding 僅用於 TXT"""
+    if is_epub_path(input_path):
+        return extract_via_epub(
+            input_path, pages=pages, use_cache=use_cache, return_pages=return_pages
+        )
+    if is_text_path(input_path):
+        return TextSession(input_path, encoding=encoding).extract(pages, return_pages=return_pages)
+    return extract_via_pymupdf(
+        input_path, pages=pages, use_cache=use_cache, boilerplate=boilerplate, profile=profile,
+        return_pages=return_pages,
+    )
+
+
+def extract_via_epub(
+    input_path, pages=None, use_cache=False, workers=1, session=None, return_pages=False
+):
+    """內建 EPUB 提取：spine 項目逐一轉為 markdown 後串接（pages 指 spine 項目序號）"""
+    parts = []
+    hits = 0
+    try:
+        for _, text, hit in iter_pages_epub(
+            input_path, pages, use_cache, workers, with_hits=True, session=session
+        ):
+            parts.append(text)
+            hits += hit
+    except (zipfile.BadZipFile, ET.ParseError, KeyError, ValueError) as e:
+        return {"success": False, "error": f"無法解析 EPUB：{e}"}
+    result = {"success": True, "content": "\n".join(parts)}
+    if return_pages:
+        result["page_texts"] = parts
+    if use_cache:
+        result["cache"] = {"hits": hits, "misses": len(parts) - hits}
+    return result
+
+
+def iter_pages_epub(
+    input_path, pages=None, use_cache=False, workers=1, with_hits=False, session=None
+):
+    """逐一產生 (spine 索引, markdown)；use_cache 時命中的項目直接讀快取。
+    傳入 session 時沿用其已開啟的 EPUB。"""
+    if session is None:
+        with EpubSession(input_path, workers=workers) as session:
+            yield from iter_pages_epub(input_path, pages, use_cache, workers, with_hits, session)
+        return
+    indices = parse_page_range(pages) if pages else list(range(session.page_count))
+    indices = [i for i in indices if 0 <= i < session.page_count]
+    cached = {}
+    if use_cache:
+        file_hash = cache_file_hash(input_path)
+        cached = cache_get(file_hash, EPUB_BACKEND, [_page_entry(i) for i in indices])
+    missing = [i for i in indices if _page_entry(i) not in cached]
+    converted = session.iter_items(missing)
+    for i in indices:
+        if _page_entry(i) in cached:
+            text, hit = cached[_page_entry(i)], 1
+        else:
+            _, text = next(converted)
+            hit = 0
+            if use_cache:
+                cache_put(file_hash, EPUB_BACKEND, {_page_entry(i): text})
+        yield (i, text, hit) if with_hits else (i, text)
+
+
+def get_pdf_page_count(input_path):
+    """只開檔取得頁數（不做文字取樣）；pymupdf 不可用時回傳 None"""
+    if _import_pymupdf() is None:
+        return None
+    with DocumentSession(input_path) as session:
+        return session.page_count
+
+
+def get_pdf_info(input_path, tokenizer=None, workers=1, per_page=False, encoding=None):
+    """取得書籍基本資訊（PDF / EPUB；全書掃描估算 token；per_page 時附逐頁字數與 token）"""
+    session, error = _open_session_or_error(input_path, tokenizer, workers, encoding)
+    if error:
+        return error
+    with session:
+        return session.info(per_page)
+
+
+def get_toc(input_path, encoding=None):
+    """提取目錄結構（PDF / EPUB）"""
+    session, error = _open_session_or_error(input_path, encoding=encoding)
+    if error:
+        return error
+    with session:
+        return session.toc()
+
+
+def get_boilerplate(input_path):
+    """單次掃描找出頁首頁尾雜湊集合；非 PDF 或無法開檔時回傳空集合"""
+    session, error = _open_session_or_error(input_path)
+    if error:
+        return frozenset()
+    with session:
+        return session.boilerplate()
+
+
+def plan_document(
+    input_path, chunk_size=None, max_tokens=None, toc_level=None, output_dir=None,
+    tokenizer=None, scan_workers=1, encoding=None, **extract_kwargs
+):
+    """--plan：單次開檔，一次回傳 info、目錄、逐頁統計與分塊計畫。
+    指定 output_dir 時在同一個 session 內直接依計畫分塊提取（extract_kwargs 傳給 chunk_extract）。
+    """
+    session, error = _open_session_or_error(input_path, tokenizer, scan_workers, encoding)
+    if error:
+        return error
+    with session:
+        ranges, chunk_by = session.plan(chunk_size, max_tokens, toc_level)
+        result = _plan_result(session, ranges, chunk_by)
+        if output_dir:
+            result["extraction"] = chunk_extract(
+                input_path, chunk_size, output_dir, max_tokens=max_tokens, toc_level=toc_level,
+                session=session, **extract_kwargs,
+            )
+            result["success"] = result["extraction"]["success"]
+        return result
+
+
+def _plan_result(session, ranges, chunk_by):
+    page_tokens = session.page_tokens()
+    page_chars = session.page_chars()
+    chunks = []
+    for start, end, planned, titles in ranges:
+        if planned is None:
+            planned = sum(page_tokens[start - 1:end])
+        chunk = {"pages": f"{start}-{end}", "planned_tokens": planned}
+        if titles:
+            chunk["titles"] = titles
+        chunks.append(chunk)
+    info = session.info()
+    info.pop("success")
+    toc = session.toc()
+    toc.pop("success")
     return {
         "success": True,
-        "title": info.get("title", ""),
-        "author": info.get("author", ""),
-        "page_count": page_count,
-        "file_size_mb": round(file_size / 1024 / 1024, 1),
-        "estimated_chars": estimated_chars,
-        "estimated_tokens": estimated_tokens,
-        "needs_chunking": estimated_tokens > 80000,
-        "suggested_chunks": max(1, -(-estimated_tokens // 60000)),  # 無條件進位
+        "info": info,
+        **toc,
+        "page_chars": page_chars,
+        "page_tokens": page_tokens,
+        "empty_pages": [i + 1 for i, n in enumerate(page_chars) if n == 0],
+        "chunk_by": chunk_by,
+        "chunks": chunks,
     }
 
 
-def get_toc(input_path):
-    """提取 PDF 目錄結構"""
+def _extract_chunk(
+    input_path, pages, chunk_file, gateway_path=None, retries=0, use_cache=False, session=None,
+    gateway_worker=False, gateway_timeout=GATEWAY_TIMEOUT, boilerplate=None, profile="faithful",
+    return_pages=False, timings=False, encoding=None, tokenizer=None,
+):
+    """提取單一分塊並寫入檔案；失敗時重試 retries 次。
+    供循序與平行模式共用（須為模組層級函式，才能被 process pool pickle）；
+    session 僅在循序模式傳入，沿用已開啟的文件。
+    gateway_worker 時使用本行程的常駐 gateway worker；boilerplate 時寫檔前去除頁首頁尾。
+    return_pages 時（不經 gateway）分塊結果附逐頁 markdown，供寫入書籍封裝檔。
+    timings 時以獨立的 Timings 量測本分塊，結果附 timings（各階段）與 trace_events。
+    tokenizer 為 --tokenizer 的 spec，用於計算分塊的 estimated_tokens。
+    """
+    global TIMINGS
+    if timings:
+        outer_timings, TIMINGS = TIMINGS, Timings(enabled=True)
+        try:
+            entry = _extract_chunk(
+                input_path, pages, chunk_file, gateway_path, retries, use_cache, session,
+                gateway_worker, gateway_timeout, boilerplate, profile, return_pages,
+                encoding=encoding, tokenizer=tokenizer,
+            )
+        finally:
+            chunk_timings, TIMINGS = TIMINGS, outer_timings
+        entry["timings"] = chunk_timings.summary()
+        entry["trace_events"] = chunk_timings.events
+        return entry
+
+    attempts = 0
+    start_time = time.perf_counter()
+    while True:
+        attempts += 1
+        try:
+            if gateway_path:
+                result = extract_via_gateway(
+                    gateway_path, input_path, pages=pages, output_path=str(chunk_file),
+                    use_cache=use_cache, timeout=gateway_timeout, boilerplate=boilerplate,
+                    worker=(
+                        _get_gateway_worker(gateway_path, gateway_timeout)
+                        if gateway_worker else None
+                    ),
+                )
+            else:
+                if session is not None:
+                    result = session.extract(pages, use_cache, boilerplate, profile, return_pages)
+                else:
+                    result = extract_document(
+                        input_path, pages, use_cache, boilerplate, profile, return_pages, encoding
+                    )
+                if result["success"] and "content" in result:
+                    with TIMINGS.stage("write:chunk") as counters:
+                        counters["bytes"] = Path(chunk_file).write_bytes(
+                            result["content"].encode("utf-8")
+                        )
+                    result["output_path"] = str(chunk_file)
+        except Exception as e:  # subprocess 逾時等例外不應中斷其他分塊
+            result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+        if result["success"] or attempts > retries:
+            break
+
+    entry = {
+        "pages": pages,
+        "file": str(chunk_file),
+        "success": result["success"],
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "attempts": attempts,
+    }
+    if result["success"]:
+        # 實際輸出量（gateway 直接寫檔，需讀回計算）
+        content = result.get("content")
+        if content is None:
+            content = Path(chunk_file).read_text(encoding="utf-8")
+        entry["chars"] = len(content)
+        entry["estimated_tokens"] = estimate_text_tokens(content, _get_tokenizer(tokenizer))
+        entry["sha256"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    if "cache" in result:
+        entry["cache"] = result["cache"]
+    if "boilerplate" in result:
+        entry["boilerplate"] = result["boilerplate"]
+    if "paths" in result:
+        entry["paths"] = result["paths"]
+    if "page_texts" in result:
+        entry["page_texts"] = result["page_texts"]
+    if not result["success"]:
+        entry["error"] = result.get("error", "unknown error")
+    return entry
+
+
+def plan_token_chunks(page_tokens, max_tokens):
+    """依每頁預估 token 貪婪裝箱，回傳 [(起始頁, 結束頁, 預估 token)]（1-based）。
+    單頁即超過預算時獨立成塊。
+    """
+    ranges = []
+    start = None
+    tokens = 0
+    for i, n in enumerate(page_tokens):
+        if start is not None and tokens + n > max_tokens:
+            ranges.append((start + 1, i, tokens))
+            start = None
+        if start is None:
+            start, tokens = i, 0
+        tokens += n
+    if start is not None:
+        ranges.append((start + 1, len(page_tokens), tokens))
+    return ranges
+
+
+def plan_toc_chunks(
+    toc, page_count, toc_level=1, page_tokens=None, chunk_size=None, max_tokens=None
+):
+    """依目錄切分章節，回傳 [(起始頁, 結束頁, 預估 token, [章節標題])]（1-based）。
+    level ≤ toc_level 的目錄項目作為章節起點；有預算（max_tokens 或 chunk_size）時，
+    超出預算的章節再切小，相鄰的小章節合併到預算內。
+    """
+    starts = {}
+    for entry in toc:
+        level, title, page = entry["level"], entry["title"], entry["page"]
+        if level <= toc_level and 1 <= page <= page_count:
+            starts.setdefault(page, title.strip())
+    if 1 not in starts:
+        starts[1] = "front-matter"
+    pages = sorted(starts)
+    sections = [
+        (start, (pages[i + 1] - 1) if i + 1 < len(pages) else page_count, starts[start])
+        for i, start in enumerate(pages)
+    ]
+
+    def tokens(start, end):
+        if page_tokens is None:
+            return None
+        return sum(page_tokens[start - 1:end])
+
+    def fits(start, end):
+        if max_tokens:
+            return tokens(start, end) <= max_tokens
+        if chunk_size:
+            return end - start + 1 <= chunk_size
+        return False  # 無預算：一章一塊，不合併
+
+    # 切分過大的章節
+    pieces = []
+    for start, end, title in sections:
+        if fits(start, end) or not (max_tokens or chunk_size):
+            pieces.append((start, end, title))
+            continue
+        if max_tokens:
+            sub = [(a, b) for a, b, _ in plan_token_chunks(page_tokens[start - 1:end], max_tokens)]
+            sub = [(a + start - 1, b + start - 1) for a, b in sub]
+        else:
+            sub = [(a, min(a + chunk_size - 1, end)) for a in range(start, end + 1, chunk_size)]
+        for n, (a, b) in enumerate(sub, 1):
+            pieces.append((a, b, f"{title} ({n}/{len(sub)})" if len(sub) > 1 else title))
+
+    # 合併相鄰的小章節
+    ranges = []
+    for start, end, title in pieces:
+        if ranges and fits(ranges[-1][0], end):
+            prev_start, _, _, titles = ranges.pop()
+            ranges.append((prev_start, end, tokens(prev_start, end), titles + [title]))
+        else:
+            ranges.append((start, end, tokens(start, end), [title]))
+    return ranges
+
+
+def _slugify(text, max_len=40):
+    """檔名用 slug：保留中日韓文字與英數，其餘轉為 -"""
+    slug = re.sub(r"[^\w]+", "-", text, flags=re.UNICODE).strip("-_").lower()
+    return slug[:max_len].rstrip("-_") or "section"
+
+
+# ── 分塊進度紀錄 ────────────────────────────────────────
+# 輸出目錄的 .chunk-manifest.json 於每個分塊完成後以原子方式更新（暫存檔 + os.replace），
+# 記錄頁碼範圍、輸出檔雜湊、提取後端與耗時。--resume 時略過檔案仍存在且雜湊相符的分塊。
+
+MANIFEST_FILE = ".chunk-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _chunk_backend(input_path, gateway_path=None, profile="faithful", strip_boilerplate=False):
+    """分塊內容的提取後端識別；後端不同的舊分塊不可沿用"""
+    if gateway_path:
+        backend = "gateway-" + cache_file_hash(gateway_path)[:12]
+    elif is_epub_path(input_path):
+        backend = EPUB_BACKEND
+    elif is_text_path(input_path):
+        backend = "text"
+    else:
+        backend = _profile_backend(profile)
+    return backend + "+strip-boilerplate" if strip_boilerplate else backend
+
+
+def load_manifest(output_dir):
+    """讀取分塊進度紀錄；不存在或損壞時回傳 None"""
     try:
-        import pymupdf
-    except ImportError:
+        return json.loads((Path(output_dir) / MANIFEST_FILE).read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(output_dir, manifest):
+    path = Path(output_dir) / MANIFEST_FILE
+    tmp = path.with_suffix(".tmp")
+    with TIMINGS.stage("write:manifest") as counters:
+        counters["bytes"] = tmp.write_bytes(
+            json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+        )
+        os.replace(tmp, path)
+
+
+def _file_sha256(path):
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _resumable_chunks(manifest, input_hash, backend, jobs):
+    """自進度紀錄挑出可沿用的分塊：輸入檔、後端、頁碼範圍相同，且輸出檔存在、雜湊相符"""
+    if not manifest or manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    if manifest.get("input_hash") != input_hash:
+        return {}
+    done = {}
+    for pages, chunk_file in jobs:
+        entry = manifest.get("chunks", {}).get(chunk_file.name)
+        if (
+            entry
+            and entry["pages"] == pages
+            and entry["backend"] == backend
+            and _file_sha256(chunk_file) == entry["sha256"]
+        ):
+            done[chunk_file.name] = entry
+    return done
+
+
+# ── 書籍封裝檔 ──────────────────────────────────────────
+# 單一檔案保存一本書的逐頁 markdown：檔頭、逐頁獨立 zlib 壓縮的頁面資料、
+# 固定寬度的頁碼位移索引，以及壓縮後的 JSON metadata（目錄、逐頁字數、後端、來源雜湊）。
+# 讀取時以 mmap 依索引直接解壓所需頁面，不必解壓整本書。
+#
+#   [檔頭 STORE_HEADER][頁面資料 ...][索引 STORE_INDEX × page_count][metadata]
+
+STORE_SUFFIX = ".crispbook"
+STORE_MAGIC = b"CRSPBOOK"
+STORE_VERSION = 1
+STORE_FLAG_ZLIB = 1
+STORE_HEADER = struct.Struct("<8sHHIQQI")  # magic, version, flags, 頁數, 索引位移, metadata 位移, metadata 長度
+STORE_INDEX = struct.Struct("<QIII")  # 位移（0 表示缺頁）, 壓縮長度, 原始長度, 字數
+
+
+def default_store_path(input_path):
+    """預設封裝檔路徑：與來源檔同目錄，如 book.pdf → book.pdf.crispbook"""
+    return Path(str(input_path) + STORE_SUFFIX)
+
+
+class BookStoreWriter:
+    """寫入書籍封裝檔：逐頁 add_page，最後 commit 寫入索引與 metadata 並以原子方式換上"""
+
+    def __init__(self, path, page_count):
+        self.path = Path(path)
+        self.page_count = page_count
+        self.index = [(0, 0, 0, 0)] * page_count
+        self.raw_bytes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.path.with_name(self.path.name + ".tmp")
+        self.file = open(self.tmp, "wb")
+        self.file.write(b"\0" * STORE_HEADER.size)
+
+    def add_page(self, index, text):
+        """寫入第 index 頁（0 起算）；每頁獨立壓縮，讀取時可單獨解壓"""
+        raw = text.encode("utf-8")
+        with TIMINGS.stage("write:store") as counters:
+            data = zlib.compress(raw, 6)
+            offset = self.file.tell()
+            counters["bytes"] = self.file.write(data)
+        self.index[index] = (offset, len(data), len(raw), len(text))
+        self.raw_bytes += len(raw)
+
+    def has_page(self, index):
+        return self.index[index][0] != 0
+
+    def commit(self, meta):
+        """寫入索引與 metadata、回填檔頭後換上正式檔名；回傳封裝檔摘要"""
+        meta = {**meta, "page_count": self.page_count,
+                "page_chars": [entry[3] for entry in self.index]}
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(STORE_INDEX.pack(*entry))
+        meta_offset = self.file.tell()
+        meta_data = zlib.compress(json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+        with TIMINGS.stage("write:store") as counters:
+            self.file.write(meta_data)
+            size = self.file.tell()
+            counters["bytes"] = size - index_offset
+            self.file.seek(0)
+            self.file.write(STORE_HEADER.pack(
+                STORE_MAGIC, STORE_VERSION, STORE_FLAG_ZLIB, self.page_count,
+                index_offset, meta_offset, len(meta_data),
+            ))
+            self.file.close()
+            os.replace(self.tmp, self.path)
+        return {
+            "path": str(self.path),
+            "pages": sum(1 for entry in self.index if entry[0]),
+            "bytes": size,
+            "raw_bytes": self.raw_bytes,
+        }
+
+    def abort(self):
+        self.file.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+class BookStore:
+    """讀取書籍封裝檔：mmap 開檔，依索引隨機讀取單頁"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
         try:
-            import fitz as pymupdf
-        except ImportError:
-            return {"success": False, "error": "需要安裝 pymupdf：pip install pymupdf4llm"}
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空檔
+            self._file.close()
+            raise ValueError(f"不是書籍封裝檔: {self.path}")
+        try:
+            if len(self._map) < STORE_HEADER.size:
+                raise ValueError(f"不是書籍封裝檔: {self.path}")
+            magic, version, flags, page_count, index_offset, meta_offset, meta_len = (
+                STORE_HEADER.unpack_from(self._map, 0)
+            )
+            if magic != STORE_MAGIC:
+                raise ValueError(f"不是書籍封裝檔: {self.path}")
+            if version != STORE_VERSION:
+                raise ValueError(f"不支援的封裝檔版本 {version}: {self.path}")
+            self.page_count = page_count
+            self._compressed = bool(flags & STORE_FLAG_ZLIB)
+            self._index_offset = index_offset
+            self.meta = json.loads(
+                zlib.decompress(self._map[meta_offset:meta_offset + meta_len]).decode("utf-8")
+            )
+        except Exception:
+            self.close()
+            raise
 
-    doc = pymupdf.open(str(input_path))
-    toc = doc.get_toc()
-    doc.close()
+    def __enter__(self):
+        return self
 
-    if not toc:
-        return {"success": True, "toc": [], "note": "此 PDF 無內嵌目錄"}
+    def __exit__(self, *exc):
+        self.close()
 
-    entries = []
-    for level, title, page in toc:
-        entries.append({"level": level, "title": title, "page": page})
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
 
-    return {"success": True, "toc": entries}
+    def has_page(self, index):
+        return STORE_INDEX.unpack_from(self._map, self._index_offset + index * STORE_INDEX.size)[0] != 0
 
+    def page(self, index):
+        """第 index 頁（0 起算）的 markdown"""
+        offset, length, _, _ = STORE_INDEX.unpack_from(
+            self._map, self._index_offset + index * STORE_INDEX.size
+        )
+        if not offset:
+            raise KeyError(f"封裝檔缺少第 {index + 1} 頁")
+        data = self._map[offset:offset + length]
+        return (zlib.decompress(data) if self._compressed else data).decode("utf-8")
 
-def chunk_extract(input_path, chunk_size, output_dir, gateway_path=None):
-    """分塊提取 PDF，每塊 chunk_size 頁"""
-    info = get_pdf_info(input_path)
-    if not info["success"]:
-        return info
+    def read(self, pages=None):
+        """依頁碼範圍字串讀取並串接頁面；串接方式與直接提取相同（EPUB 章節以換行分隔）"""
+        indices = parse_page_range(pages) if pages else range(self.page_count)
+        indices = [i for i in indices if 0 <= i < self.page_count]
+        sep = "\n" if self.meta.get("unit") == "spine_item" else ""
+        with TIMINGS.stage("store:read", len(indices)):
+            return sep.join(self.page(i) for i in indices)
+
+    def is_current(self, input_path, backend):
+        """封裝檔是否對應目前的來源檔與提取後端（backend 為 None 時不限後端）；
+        大小與修改時間相同即視為未變，否則比對雜湊"""
+        if backend is not None and self.meta.get("backend") != backend:
+            return False
+        stat = os.stat(input_path)
+        if (
+            stat.st_size == self.meta.get("source_size")
+            and stat.st_mtime_ns == self.meta.get("source_mtime_ns")
+        ):
+            return True
+        return cache_file_hash(input_path) == self.meta.get("source_hash")
+
+    def info(self):
+        return {
+            "path": str(self.path),
+            "pages": self.page_count,
+            "bytes": len(self._map),
+            "backend": self.meta.get("backend"),
+        }
+
+
+def open_current_store(store_path, input_path, backend):
+    """開啟仍對應來源檔的封裝檔；不存在、損壞或已過期時回傳 None"""
+    try:
+        store = BookStore(store_path)
+    except (OSError, ValueError, zlib.error):
+        return None
+    if not store.is_current(input_path, backend):
+        store.close()
+        return None
+    return store
+
+
+def open_page_source(input_path, pages=None, plain=False, use_cache=False, profile="faithful"):
+    """逐頁文字來源（定位引句、段落索引等工具用），回傳 (pages, meta)。
+    pages 為頁碼範圍字串（預設全書），回傳的 iterator 逐頁產生 (頁索引, 文字)。
+    input_path 為封裝檔，或來源檔旁有仍有效的封裝檔（不限後端）時直接讀封裝檔；
+    否則逐頁提取，plain 時 PDF 只取純文字層（不做 markdown 轉換，快得多）。
+    meta 含 page_count、unit、toc、page_labels（PDF 的書上頁碼，沒有時為 None）與
+    source（store / extract）。開檔失敗時拋出例外。
+    """
+    page_range = pages
+    input_path = Path(input_path)
+    if input_path.suffix == STORE_SUFFIX:
+        store = BookStore(input_path)
+    else:
+        store = open_current_store(default_store_path(input_path), input_path, None)
+    if store is not None:
+        meta = {
+            "page_count": store.page_count,
+            "unit": store.meta.get("unit", "page"),
+            "toc": store.meta.get("toc", []),
+            "page_labels": store.meta.get("page_labels"),
+            "source": "store",
+            "store": str(store.path),
+        }
+
+        def pages():
+            indices = parse_page_range(page_range) if page_range else range(store.page_count)
+            with store, TIMINGS.stage("store:read"):
+                for i in indices:
+                    if 0 <= i < store.page_count and store.has_page(i):
+                        yield i, store.page(i)
+
+        return pages(), meta
+
+    session = open_session(input_path)
+    meta = {
+        "page_count": session.page_count,
+        "unit": session.unit,
+        "toc": session.toc()["toc"],
+        "page_labels": session.page_labels(),
+        "source": "extract",
+    }
+
+    def pages():
+        with session:
+            if isinstance(session, EpubSession):
+                yield from iter_pages_epub(input_path, page_range, use_cache, session=session)
+            elif isinstance(session, TextSession):
+                yield from session.iter_pages(parse_page_range(page_range) if page_range else None)
+            elif plain:
+                indices = parse_page_range(page_range) if page_range else range(session.page_count)
+                for i in indices:
+                    if 0 <= i < session.page_count:
+                        with TIMINGS.stage("convert:plain", 1):
+                            text = session.doc[i].get_text()
+                        yield i, text
+            else:
+                yield from iter_pages_pymupdf(
+                    input_path, page_range, use_cache, doc=session.doc, profile=profile
+                )
+
+    return pages(), meta
+
+
+def toc_lookup(toc):
+    """頁碼（1 起算）→ 所在章節名稱的查詢函式（取第一、二層目錄）；toc 為 open_page_source 的 meta["toc"]"""
+    entries = sorted(
+        ((entry["page"], entry["title"]) for entry in toc
+         if entry.get("level", 1) <= 2 and entry.get("page")),
+        key=lambda e: e[0],
+    )
+    starts = [page for page, _ in entries]
+
+    def chapter(page):
+        i = bisect.bisect_right(starts, page) - 1
+        return entries[i][1] if i >= 0 else None
+
+    return chapter
+
+
+def _store_meta(session, input_path, input_hash, backend):
+    stat = os.stat(input_path)
+    title, author = session._metadata()
+    return {
+        "source": str(input_path),
+        "source_hash": input_hash,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "backend": backend,
+        "unit": session.unit,
+        "title": title,
+        "author": author,
+        "toc": session.toc()["toc"],
+        "page_labels": session.page_labels(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _fill_store(writer, store_path, session, input_path, page_ranges, backend, options):
+    """補齊續跑時沿用分塊的頁面：優先取自仍有效的舊封裝檔，否則重新提取"""
+    old = open_current_store(store_path, input_path, backend)
+    try:
+        for pages in page_ranges:
+            indices = parse_page_range(pages)
+            if old and all(old.has_page(i) for i in indices):
+                texts = [old.page(i) for i in indices]
+            else:
+                result = session.extract(
+                    pages, options["use_cache"], options.get("boilerplate"), options["profile"],
+                    return_pages=True,
+                )
+                if not result["success"]:
+                    continue  # 缺頁留空，讀取時回報
+                texts = result["page_texts"]
+            for index, text in zip(indices, texts):
+                writer.add_page(index, text)
+    finally:
+        if old:
+            old.close()
+
+
+def chunk_extract(
+    input_path, chunk_size, output_dir, gateway_path=None, workers=1, retries=1, use_cache=False,
+    max_tokens=None, toc_level=None, session=None, gateway_worker=True,
+    gateway_timeout=GATEWAY_TIMEOUT, tokenizer=None, strip_boilerplate=False, profile="faithful",
+    resume=False, pack=None, encoding=None,
+):
+    """分塊提取 PDF / EPUB / TXT，每塊 chunk_size 頁（EPUB 為 spine 項目，TXT 為文字區塊）；指定 max_tokens 時改依 token 預算裝箱；
+    指定 toc_level 時依目錄章節切分（chunk_size / max_tokens 作為章節合併與切分的預算）。
+    workers > 1 時以 process pool 平行提取，各分塊完成即寫檔；
+    失敗的分塊會重試 retries 次，不影響其他分塊。
+    傳入 session 時沿用其已開啟的 document 與已計算的統計，不重新開檔。
+    使用 gateway 時預設由常駐 worker 處理所有分塊（每個行程一個），
+    gateway_worker=False 則每塊各起一個 subprocess。
+    strip_boilerplate 時先單次掃描全書找出頁首頁尾，各分塊寫檔前去除，並回報節省量。
+    profile 為 fast / balanced 時（PDF）回報各轉換路徑處理的頁數。
+    每個分塊完成即更新輸出目錄的 .chunk-manifest.json；resume 時只重做缺少或損壞的分塊。
+    TIMINGS 啟用時各分塊附 timings（該分塊各階段的耗時），並併入整體量測。
+    pack 為封裝檔路徑時同時把逐頁 markdown 寫入書籍封裝檔（不經 gateway，gateway 結果沒有頁界）。
+    encoding 為 TXT 編碼（未指定時自動偵測），平行 worker 一併沿用。
+    """
+    if session is None:
+        session, error = _open_session_or_error(input_path, tokenizer, workers, encoding)
+        if error:
+            return error
+        with session:
+            return chunk_extract(
+                input_path, chunk_size, output_dir, gateway_path, workers, retries, use_cache,
+                max_tokens, toc_level, session, gateway_worker, gateway_timeout,
+                strip_boilerplate=strip_boilerplate, profile=profile, resume=resume, pack=pack,
+                encoding=encoding,
+            )
+
+    ranges, chunk_by = session.plan(chunk_size, max_tokens, toc_level)
+    page_count = session.page_count
 
-    page_count = info["page_count"]
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    chunks = []
-    for start in range(1, page_count + 1, chunk_size):
-        end = min(start + chunk_size - 1, page_count)
-        pages = f"{start}-{end}"
-        chunk_file = output_dir / f"chunk_{start:04d}-{end:04d}.md"
+    jobs = []
+    for start, end, _, titles in ranges:
+        name = f"chunk_{start:04d}-{end:04d}"
+        if titles:
+            name += "_" + _slugify(titles[0])
+        jobs.append((f"{start}-{end}", output_dir / f"{name}.md"))
 
-        if gateway_path:
-            result = extract_via_gateway(
-                gateway_path, input_path, pages=pages, output_path=str(chunk_file)
-            )
+    options = {
+        "gateway_path": gateway_path,
+        "retries": retries,
+        "use_cache": use_cache,
+        "gateway_worker": bool(gateway_path and gateway_worker),
+        "gateway_timeout": gateway_timeout,
+        "profile": profile,
+    }
+    if TIMINGS.enabled:
+        options["timings"] = True
+    if isinstance(session, TextSession):
+        options["encoding"] = session.encoding
+    if session.tokenizer:
+        options["tokenizer"] = session.tokenizer
+    start_time = time.perf_counter()
+    boilerplate = session.boilerplate() if strip_boilerplate else None
+    if boilerplate:
+        options["boilerplate"] = boilerplate
+    if pack:
+        options["gateway_path"] = gateway_path = None
+        options["gateway_worker"] = False
+        options["return_pages"] = True
+
+    backend = _chunk_backend(input_path, gateway_path, profile, bool(boilerplate))
+    input_hash = cache_file_hash(input_path)
+    done = _resumable_chunks(load_manifest(output_dir) if resume else None, input_hash, backend, jobs)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "input": str(input_path),
+        "input_hash": input_hash,
+        "backend": backend,
+        "chunks": dict(done),
+    }
+    _write_manifest(output_dir, manifest)
+
+    chunks = [None] * len(jobs)
+    pending = []
+    for i, (pages, chunk_file) in enumerate(jobs):
+        entry = done.get(chunk_file.name)
+        if entry:
+            chunks[i] = {
+                "pages": pages, "file": str(chunk_file), "success": True, "resumed": True,
+                **{k: entry[k] for k in ("seconds", "chars", "estimated_tokens", "sha256")},
+            }
         else:
-            result = extract_via_pymupdf(input_path, pages=pages)
-            if result["success"] and "content" in result:
-                chunk_file.write_text(result["content"], encoding="utf-8")
-                result["output_path"] = str(chunk_file)
+            pending.append(i)
+
+    writer = BookStoreWriter(pack, page_count) if pack else None
+
+    def record(i, entry):
+        chunks[i] = entry
+        if "timings" in entry:
+            TIMINGS.merge(entry["timings"], entry.pop("trace_events", ()))
+        page_texts = entry.pop("page_texts", None)
+        if writer and page_texts is not None:
+            for index, text in zip(parse_page_range(entry["pages"]), page_texts):
+                writer.add_page(index, text)
+        if entry["success"]:
+            manifest["chunks"][Path(entry["file"]).name] = {
+                "pages": entry["pages"],
+                "sha256": entry["sha256"],
+                "backend": backend,
+                "seconds": entry["seconds"],
+                "chars": entry["chars"],
+                "estimated_tokens": entry["estimated_tokens"],
+            }
+            _write_manifest(output_dir, manifest)
+
+    try:
+        if workers > 1 and len(pending) > 1:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)),
+                initializer=_init_chunk_worker,
+                initargs=(_file_hashes, options["gateway_worker"]),
+            ) as pool:
+                futures = {
+                    pool.submit(_extract_chunk, input_path, *jobs[i], **options): i
+                    for i in pending
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        entry = future.result()
+                    except Exception as e:  # worker 行程異常終止
+                        pages, chunk_file = jobs[i]
+                        entry = {
+                            "pages": pages,
+                            "file": str(chunk_file),
+                            "success": False,
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                    record(i, entry)
+        else:
+            try:
+                for i in pending:
+                    record(i, _extract_chunk(input_path, *jobs[i], session=session, **options))
+            finally:
+                _close_gateway_workers()
+
+        store = None
+        if writer:
+            resumed = [pages for (pages, _), chunk in zip(jobs, chunks) if chunk.get("resumed")]
+            _fill_store(writer, pack, session, input_path, resumed, backend, options)
+            store = writer.commit(_store_meta(session, input_path, input_hash, backend))
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+
+    for chunk, (_, _, planned, titles) in zip(chunks, ranges):
+        if planned is not None:
+            chunk["planned_tokens"] = planned
+        if titles:
+            chunk["titles"] = titles
+
+    failed = [c["pages"] for c in chunks if not c["success"]]
+    result = {
+        "success": not failed,
+        "chunks": chunks,
+        "total_pages": page_count,
+        "max_tokens_per_chunk": max_tokens,
+        "chunk_by": chunk_by,
+        "workers": max(1, workers),
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "failed_chunks": failed,
+        "resumed_chunks": len(done),
+        "manifest": str(output_dir / MANIFEST_FILE),
+    }
+    if strip_boilerplate:
+        saved = {"patterns": len(boilerplate or ()), **NO_BOILERPLATE}
+        for chunk in chunks:
+            if "boilerplate" in chunk:
+                add_boilerplate_saved(saved, chunk["boilerplate"])
+        result["boilerplate_removed"] = saved
+    if profile != "faithful":
+        paths = {"fast": 0, "full": 0, "cached": 0}
+        for chunk in chunks:
+            for path, n in chunk.get("paths", {}).items():
+                paths[path] += n
+        result["profile"] = profile
+        result["paths"] = paths
+    if store:
+        result["store"] = store
+    return result
 
-        chunks.append({"pages": pages, "file": str(chunk_file), "success": result["success"]})
 
-    return {"success": True, "chunks": chunks, "total_pages": page_count}
+def _write_output(path, content):
+    with TIMINGS.stage("write:output") as counters:
+        counters["bytes"] = Path(path).write_bytes(content.encode("utf-8"))
+
+
+def _with_timings(result, trace_path=None):
+    """--timings：於輸出 JSON 附上量測結果；指定 trace_path 時同時寫出 Chrome trace"""
+    if TIMINGS.enabled:
+        result["timings"] = TIMINGS.report()
+        if trace_path:
+            TIMINGS.write_trace(trace_path)
+            result["timings"]["trace_path"] = str(trace_path)
+    return result
+
+
+def _print_timings(trace_path=None):
+    """輸出為 markdown（stdout）時，量測結果改印到 stderr"""
+    if TIMINGS.enabled:
+        print(json.dumps(_with_timings({}, trace_path), ensure_ascii=False), file=sys.stderr)
 
 
 def main():
     parser = argparse.ArgumentParser(description="CRISP 閱讀助手：文件文字提取")
-    parser.add_argument("input", help="PDF 或 EPUB 檔案路徑")
-    parser.add_argument("--pages", "-p", help="頁碼範圍，如 1-10,15,20-25")
+    parser.add_argument("input", nargs="?", help="PDF、EPUB 或 TXT 檔案路徑")
+    parser.add_argument(
+        "--pages", "-p",
+        help="頁碼範圍，如 1-10,15,20-25（EPUB 指 spine 項目序號，TXT 指文字區塊序號）",
+    )
+    parser.add_argument(
+        "--encoding", help="TXT 編碼（預設自動偵測：BOM、Gutenberg 檔頭宣告、utf-8 / gb18030 / big5）"
+    )
     parser.add_argument("--output", "-o", help="輸出檔案路徑（預設 stdout）")
     parser.add_argument("--toc", action="store_true", help="僅提取目錄結構（JSON）")
+    parser.add_argument(
+        "--stream", nargs="?", const="markdown", choices=["markdown", "ndjson"],
+        help="逐頁串流輸出（markdown 或 ndjson），記憶體只保留一頁；"
+        "PDF 一律以 pymupdf4llm 逐頁轉換，EPUB 以內建讀取器逐章轉換",
+    )
     parser.add_argument("--info", action="store_true", help="僅顯示書籍資訊（JSON）")
+    parser.add_argument(
+        "--tokenizer",
+        help="以實際 tokenizer 計算 token：tiktoken[:編碼] 或 模組:函式（預設依文字系統比例估算）",
+    )
+    parser.add_argument("--per-page", action="store_true", help="--info 附上逐頁字數與 token 數")
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="單次開檔輸出 info、目錄、逐頁字數與分塊計畫（JSON）；加 --output-dir 時同時分塊提取",
+    )
     parser.add_argument("--chunk-size", type=int, help="分塊頁數，自動切割並輸出到目錄")
+    parser.add_argument(
+        "--max-tokens-per-chunk", type=int,
+        help="依每頁實際字數裝箱，每塊不超過此 token 預算（取代 --chunk-size 的固定頁數）",
+    )
+    parser.add_argument(
+        "--chunk-by",
+        help="依目錄章節分塊，如 toc 或 toc:2（目錄層級）；"
+        "可搭配 --chunk-size / --max-tokens-per-chunk 作為合併與切分章節的預算",
+    )
     parser.add_argument("--output-dir", help="分塊輸出目錄（搭配 --chunk-size）")
+    parser.add_argument(
+        "--workers", "-j", type=int, default=1,
+        help="分塊提取與全書文字掃描的平行行程數（預設 1，循序執行）",
+    )
+    parser.add_argument("--retries", type=int, default=1, help="分塊失敗時的重試次數（預設 1）")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="依輸出目錄的 .chunk-manifest.json 續跑：略過已完成且檔案雜湊相符的分塊",
+    )
+    parser.add_argument(
+        "--gateway-timeout", type=int, default=GATEWAY_TIMEOUT,
+        help=f"gateway 單次請求逾時秒數（預設 {GATEWAY_TIMEOUT}）",
+    )
+    parser.add_argument(
+        "--no-gateway-worker", action="store_true",
+        help="分塊時每塊各起一個 gateway subprocess（預設由單一常駐 worker 處理）",
+    )
+    parser.add_argument("--gateway-worker", metavar="GATEWAY", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--profile", choices=PROFILES, default="faithful",
+        help="PDF 提取速度：fast 直接讀文字區塊並依字級推斷標題；balanced 只有表格或多欄頁面"
+        "走完整版面分析；faithful 每頁完整分析（預設）。fast / balanced 不經 gateway",
+    )
+    parser.add_argument(
+        "--strip-boilerplate", action="store_true",
+        help="去除各頁重複的書眉、頁碼與版權頁尾（PDF），並於 JSON 輸出回報節省的字數與 token",
+    )
+    parser.add_argument(
+        "--pack", action="store_true",
+        help="分塊（或 --plan --output-dir）時同時寫入書籍封裝檔（預設為 <輸入檔>.crispbook）",
+    )
+    parser.add_argument(
+        "--store", metavar="PATH", help="書籍封裝檔路徑（預設為輸入檔路徑加上 .crispbook）"
+    )
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="於輸出 JSON 附上各階段耗時、CPU 時間、峰值記憶體、處理頁數與寫出位元組"
+        "（分塊時另附逐塊明細；輸出為 markdown 時改印到 stderr）",
+    )
+    parser.add_argument(
+        "--trace", metavar="PATH", help="另寫出 Chrome trace 格式檔（chrome://tracing、Perfetto）；隱含 --timings"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="停用提取快取（預設啟用）")
+    parser.add_argument("--cache-stats", action="store_true", help="顯示提取快取使用狀況（JSON）")
     args = parser.parse_args()
 
+    if args.gateway_worker:
+        gateway_worker_loop(args.gateway_worker)
+        return
+    if args.cache_stats:
+        print(json.dumps(cache_stats(), ensure_ascii=False, indent=2))
+        return
+    if not args.input:
+        parser.error("需要指定輸入檔案")
+    TIMINGS.enabled = bool(args.timings or args.trace)
+    use_cache = not args.no_cache
+    if use_cache:
+        atexit.register(cache_evict)  # 整次執行只淘汰一次，不在每次寫入快取時掃描目錄
+    if args.tokenizer:
+        try:
+            load_tokenizer(args.tokenizer)
+        except (ImportError, ValueError, AttributeError) as e:
+            print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
+
     input_path = Path(args.input).resolve()
     if not input_path.is_file():
         print(json.dumps({"success": False, "error": f"找不到檔案：{args.input}"}))
@@ -230,72 +2930,171 @@ def main():
     ext = input_path.suffix.lower()
     is_pdf = ext == ".pdf"
     is_epub = ext == ".epub"
+    is_text = is_text_path(input_path)
     gateway_path = find_gateway()
 
-    # EPUB 需要 gateway；若不可用，提前告知
-    if is_epub and not gateway_path:
+    if not is_pdf and not is_epub and not is_text:
         print(json.dumps({
             "success": False,
-            "error": (
-                "EPUB 格式需要 document-to-markdown skill 的 gateway.py 才能處理。\n"
-                "請安裝 document-to-markdown skill，或將 EPUB 轉換為 PDF 後重試。"
-            ),
+            "error": f"不支援的檔案格式：{ext}。僅支援 .pdf、.epub 和 .txt。",
         }, ensure_ascii=False), file=sys.stderr)
         sys.exit(1)
 
-    if not is_pdf and not is_epub:
-        print(json.dumps({
-            "success": False,
-            "error": f"不支援的檔案格式：{ext}。僅支援 .pdf 和 .epub。",
-        }, ensure_ascii=False), file=sys.stderr)
-        sys.exit(1)
+    toc_level = None
+    if args.chunk_by:
+        mode, _, level = args.chunk_by.partition(":")
+        if mode != "toc" or (level and not level.isdigit()):
+            parser.error("--chunk-by 格式為 toc 或 toc:<層級>")
+        toc_level = int(level or 1)
+
+    # EPUB 一律以內建讀取器處理（分塊、資訊、串流）；gateway 僅作為一般提取失敗時的備援。
+    # TXT 不經 gateway；PDF 指定 fast / balanced 時改用內建的分流轉換
+    if is_pdf and args.profile != "faithful":
+        gateway_path = None
+    chunk_gateway = gateway_path if is_pdf else None
+    store_path = Path(args.store) if args.store else default_store_path(input_path)
+    pack = store_path if args.pack else None
 
-    # 資訊模式（僅 PDF 支援；EPUB 需透過 gateway 提取後自行評估）
+    # 計畫模式
+    if args.plan:
+        result = plan_document(
+            input_path, args.chunk_size, args.max_tokens_per_chunk, toc_level,
+            output_dir=args.output_dir, tokenizer=args.tokenizer, scan_workers=args.workers,
+            gateway_path=chunk_gateway,
+            workers=args.workers, retries=args.retries, use_cache=use_cache,
+            gateway_worker=not args.no_gateway_worker, gateway_timeout=args.gateway_timeout,
+            strip_boilerplate=args.strip_boilerplate, profile=args.profile, resume=args.resume,
+            pack=pack, encoding=args.encoding,
+        )
+        print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False, indent=2))
+        return
+
+    # 資訊模式（EPUB 的頁數為 spine 項目數）
     if args.info:
-        if not is_pdf:
-            print(json.dumps({
-                "success": False,
-                "error": f"--info 僅支援 PDF 格式。EPUB 請先提取文字後自行評估大小。",
-            }, ensure_ascii=False), file=sys.stderr)
-            sys.exit(1)
-        print(json.dumps(get_pdf_info(input_path), ensure_ascii=False, indent=2))
+        result = get_pdf_info(
+            input_path, args.tokenizer, args.workers, per_page=args.per_page, encoding=args.encoding
+        )
+        print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False, indent=2))
         return
 
-    # 目錄模式（僅 PDF 支援）
+    # 目錄模式
     if args.toc:
-        if not is_pdf:
-            print(json.dumps({
-                "success": False,
-                "error": f"--toc 僅支援 PDF 格式。",
-            }, ensure_ascii=False), file=sys.stderr)
-            sys.exit(1)
-        print(json.dumps(get_toc(input_path), ensure_ascii=False, indent=2))
+        print(json.dumps(_with_timings(get_toc(input_path, args.encoding), args.trace), ensure_ascii=False, indent=2))
         return
 
     # 分塊模式
-    if args.chunk_size:
+    if args.chunk_size or args.max_tokens_per_chunk or args.chunk_by:
         output_dir = args.output_dir or str(input_path.parent / f"{input_path.stem}_chunks")
-        result = chunk_extract(input_path, args.chunk_size, output_dir, gateway_path)
-        print(json.dumps(result, ensure_ascii=False, indent=2))
+        result = chunk_extract(
+            input_path, args.chunk_size, output_dir, chunk_gateway,
+            workers=args.workers, retries=args.retries, use_cache=use_cache,
+            max_tokens=args.max_tokens_per_chunk, toc_level=toc_level,
+            gateway_worker=not args.no_gateway_worker, gateway_timeout=args.gateway_timeout,
+            tokenizer=args.tokenizer, strip_boilerplate=args.strip_boilerplate,
+            profile=args.profile, resume=args.resume, pack=pack, encoding=args.encoding,
+        )
+        print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False, indent=2))
         return
 
-    # 一般提取
-    if gateway_path:
-        result = extract_via_gateway(gateway_path, input_path, pages=args.pages, output_path=args.output)
+    # 封裝檔提取：封裝檔對應目前的來源檔與提取設定（含 gateway）時，只解壓所需頁面
+    if not args.stream:
+        store_backend = _chunk_backend(
+            input_path, chunk_gateway, args.profile, args.strip_boilerplate and is_pdf
+        )
+        store = open_current_store(store_path, input_path, store_backend)
+        if store:
+            with store:
+                try:
+                    content = store.read(args.pages)
+                except KeyError as e:  # 封裝時失敗的分塊留有缺頁
+                    content = None
+                    store_error = str(e)
+                store_info = store.info()
+            if content is not None:
+                if args.output:
+                    _write_output(args.output, content)
+                    print(json.dumps(_with_timings(
+                        {"success": True, "output_path": args.output, "store": store_info},
+                        args.trace,
+                    ), ensure_ascii=False))
+                else:
+                    print(content)
+                    _print_timings(args.trace)
+                return
+            print(json.dumps({"store": store_info, "note": store_error + "，改為直接提取"},
+                             ensure_ascii=False), file=sys.stderr)
+
+    boilerplate = get_boilerplate(input_path) if args.strip_boilerplate and is_pdf else None
+
+    # 串流提取
+    if args.stream:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            result = stream_extract(
+                input_path, out, args.stream, pages=args.pages, use_cache=use_cache,
+                workers=args.workers, boilerplate=boilerplate, profile=args.profile,
+                encoding=args.encoding,
+            )
+            # 內建 EPUB 讀取失敗（尚未輸出任何內容）時改由 gateway 轉送
+            if is_epub and not result["success"] and not result.get("pages") and gateway_path:
+                if args.stream == "ndjson":
+                    result["error"] += "（gateway 無逐頁輸出，無法以 ndjson 備援）"
+                else:
+                    result = stream_via_gateway(gateway_path, input_path, out, pages=args.pages)
+        finally:
+            if args.output:
+                out.close()
+        if not result["success"]:
+            print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
+        if args.output:
+            result["output_path"] = args.output
+            print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False))
+        else:
+            _print_timings(args.trace)
+        return
+
+    # 一般提取：EPUB 以內建讀取器為主，解析失敗時改用 gateway
+    if is_text:
+        result = extract_via_text(input_path, pages=args.pages, encoding=args.encoding)
+    elif is_epub:
+        result = extract_via_epub(
+            input_path, pages=args.pages, use_cache=use_cache, workers=args.workers
+        )
+        if not result["success"] and gateway_path:
+            result = extract_via_gateway(
+                gateway_path, input_path, pages=args.pages, output_path=args.output,
+                use_cache=use_cache, timeout=args.gateway_timeout,
+            )
+    elif gateway_path:
+        result = extract_via_gateway(
+            gateway_path, input_path, pages=args.pages, output_path=args.output,
+            use_cache=use_cache, timeout=args.gateway_timeout, boilerplate=boilerplate,
+        )
     else:
-        result = extract_via_pymupdf(input_path, pages=args.pages)
+        result = extract_via_pymupdf(
+            input_path, pages=args.pages, use_cache=use_cache, boilerplate=boilerplate,
+            profile=args.profile,
+        )
 
     if not result["success"]:
         print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
         sys.exit(1)
 
     if args.output and "content" in result:
-        Path(args.output).write_text(result["content"], encoding="utf-8")
-        print(json.dumps({"success": True, "output_path": args.output}, ensure_ascii=False))
+        _write_output(args.output, result["content"])
+        summary = {"success": True, "output_path": args.output}
+        if "boilerplate" in result:
+            summary["boilerplate_removed"] = result["boilerplate"]
+        if "paths" in result:
+            summary["profile"] = args.profile
+            summary["paths"] = result["paths"]
+        print(json.dumps(_with_timings(summary, args.trace), ensure_ascii=False))
     elif "content" in result:
         print(result["content"])
+        _print_timings(args.trace)
     else:
-        print(json.dumps(result, ensure_ascii=False))
+        print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False))
 
 
 if __name__ == "__main__":
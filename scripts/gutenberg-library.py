@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Project Gutenberg 書目查詢與取得，支援離線書目與本機鏡像。
+書名模式可用 search 找書、fetch 取得全文；batch 可在無網路環境下，
+以本機 Gutendex 格式書目 + 鏡像目錄批次處理數百冊公共領域書籍。
+
+用法：
+  python gutenberg-library.py search 老殘遊記 --languages zh          # 線上 Gutendex
+  python gutenberg-library.py search "great gatsby" --catalog books.json
+                                                                     # 本機書目（離線）
+  python gutenberg-library.py fetch 1342 --mirror /data/gutenberg     # 取得全文路徑（離線）
+  python gutenberg-library.py fetch 1342 -o pg1342.txt                # 無本機副本時下載
+  python gutenberg-library.py batch --catalog books.json --mirror /data/gutenberg \\
+      --languages zh --output-dir corpus/ --max-tokens-per-chunk 60000 --workers 4
+
+書目格式（--catalog，或環境變數 CRISP_READING_GUTENDEX_CATALOG）：
+  Gutendex API 回應的 JSON（{"results": [...]}）、書籍陣列、每行一本的 NDJSON，
+  或存放上述檔案的目錄（例如逐頁下載的 API 回應）。
+鏡像目錄（--mirror，或 CRISP_READING_GUTENBERG_MIRROR）：
+  依 formats 網址的路徑（cache/epub/1342/pg1342.txt）、rsync 鏡像的
+  1/3/4/1342/1342-0.txt，或平放的 pg1342.txt / 1342.epub 尋找本機檔案。
+
+batch 對每本書單次開檔產出 info、目錄與分塊計畫（plan.json），並依計畫分塊提取；
+輸出目錄的 .batch-state.json 記錄來源檔雜湊，未變更的書會略過（--force 強制重做）。
+
+輸出：JSON 至 stdout
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+
+GUTENDEX_URL = "https://gutendex.com/books"
+# 與 references/ebook-library.md 一致：優先純文字 UTF-8，其次 EPUB
+FORMAT_PREFERENCE = (
+    "text/plain; charset=utf-8",
+    "text/plain; charset=us-ascii",
+    "text/plain",
+    "application/epub+zip",
+)
+BATCH_STATE_FILE = ".batch-state.json"
+DOWNLOAD_TIMEOUT = 60  # 秒
+DEFAULT_MAX_TOKENS = 60000  # 未指定 --chunk-size 時的每塊 token 預算
+
+_spec = importlib.util.spec_from_file_location(
+    "extract_text", Path(__file__).resolve().parent / "extract-text.py"
+)
+extract_text = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(extract_text)
+
+
+# ── 書目 ───────────────────────────────────────────────
+
+def _books_from_json(data):
+    if isinstance(data, dict):
+        return data.get("results", [data] if "id" in data else [])
+    return data if isinstance(data, list) else []
+
+
+def iter_catalog(catalog):
+    """逐本產生書目中的書籍 dict（Gutendex 格式）；目錄則依檔名順序讀取其中所有 JSON / NDJSON"""
+    path = Path(catalog)
+    files = sorted(
+        p for p in path.iterdir() if p.suffix in (".json", ".jsonl", ".ndjson")
+    ) if path.is_dir() else [path]
+    seen = set()
+    for file in files:
+        with open(file, encoding="utf-8") as f:
+            if file.suffix == ".json":
+                books = _books_from_json(json.load(f))
+            else:
+                books = (json.loads(line) for line in f if line.strip())
+            for book in books:
+                # 逐頁下載的 API 回應可能重疊
+                if book.get("id") in seen:
+                    continue
+                seen.add(book.get("id"))
+                yield book
+
+
+def _book_text(book):
+    authors = " ".join(a.get("name", "") for a in book.get("authors", []))
+    return f"{book.get('title', '')} {authors}".lower()
+
+
+def match_book(book, search=None, languages=None):
+    """比照 Gutendex：search 的每個詞都須出現在書名或作者中；languages 任一符合即可"""
+    if languages and not set(languages) & set(book.get("languages", [])):
+        return False
+    if search:
+        text = _book_text(book)
+        return all(term in text for term in search.lower().split())
+    return True
+
+
+def search_catalog(catalog, search=None, languages=None, ids=None, limit=None):
+    """在本機書目中搜尋，回傳符合的書籍 list"""
+    results = []
+    for book in iter_catalog(catalog):
+        if ids and book.get("id") not in ids:
+            continue
+        if match_book(book, search, languages):
+            results.append(book)
+            if limit and len(results) >= limit:
+                break
+    return results
+
+
+def search_online(search=None, languages=None, ids=None):
+    """查詢線上 Gutendex API（僅第一頁結果）"""
+    params = {}
+    if search:
+        params["search"] = search
+    if languages:
+        params["languages"] = ",".join(languages)
+    if ids:
+        params["ids"] = ",".join(str(i) for i in ids)
+    url = f"{GUTENDEX_URL}?{urllib.parse.urlencode(params)}"
+    with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+        return json.load(response).get("results", [])
+
+
+def summarize_book(book):
+    """搜尋結果摘要：id、書名、作者、語言與可用格式"""
+    formats = book.get("formats", {})
+    return {
+        "id": book.get("id"),
+        "title": book.get("title", ""),
+        "authors": [a.get("name", "") for a in book.get("authors", [])],
+        "languages": book.get("languages", []),
+        "formats": {fmt: formats[fmt] for fmt in FORMAT_PREFERENCE if fmt in formats},
+    }
+
+
+# ── 鏡像 ───────────────────────────────────────────────
+
+def _rsync_dir(book_id):
+    """Gutenberg rsync 鏡像的目錄：1342 → 1/3/4/1342，7 → 0/7"""
+    digits = str(book_id)
+    return "/".join(digits[:-1]) + f"/{digits}" if len(digits) > 1 else f"0/{digits}"
+
+
+def mirror_candidates(book):
+    """本機鏡像中可能的相對路徑，依偏好順序（純文字優先）"""
+    book_id = book["id"]
+    candidates = []
+    for fmt in FORMAT_PREFERENCE:
+        url = book.get("formats", {}).get(fmt)
+        if url:
+            url_path = urllib.parse.urlparse(url).path.lstrip("/")
+            candidates += [url_path, url_path.rsplit("/", 1)[-1]]
+    for ext in ("txt", "epub"):
+        candidates += [
+            f"cache/epub/{book_id}/pg{book_id}.{ext}",
+            f"{_rsync_dir(book_id)}/{book_id}-0.{ext}",
+            f"{_rsync_dir(book_id)}/{book_id}.{ext}",
+            f"{book_id}/pg{book_id}.{ext}",
+            f"pg{book_id}.{ext}",
+            f"{book_id}-0.{ext}",
+            f"{book_id}.{ext}",
+        ]
+    # extract-text.py 依副檔名判斷格式，只採用 .txt / .epub
+    return [
+        c for i, c in enumerate(candidates)
+        if c.endswith((".txt", ".epub")) and c not in candidates[:i]
+    ]
+
+
+def resolve_local(book, mirror):
+    """在鏡像目錄中尋找書籍檔案，找不到時回傳 None"""
+    mirror = Path(mirror)
+    for candidate in mirror_candidates(book):
+        path = mirror / candidate
+        if path.is_file():
+            return path
+    return None
+
+
+def download_book(book, output_path=None):
+    """下載偏好格式的全文；output_path 未指定時存為目前目錄的 pg<id>.txt / .epub"""
+    formats = book.get("formats", {})
+    fmt = next((f for f in FORMAT_PREFERENCE if f in formats), None)
+    if fmt is None:
+        raise ValueError(f"書籍 {book.get('id')} 無純文字或 EPUB 格式")
+    ext = "epub" if fmt == "application/epub+zip" else "txt"
+    output_path = Path(output_path or f"pg{book['id']}.{ext}")
+    tmp = output_path.with_name(output_path.name + ".tmp")
+    with urllib.request.urlopen(formats[fmt], timeout=DOWNLOAD_TIMEOUT) as response:
+        tmp.write_bytes(response.read())
+    os.replace(tmp, output_path)
+    return output_path
+
+
+def fetch(book_id, catalog=None, mirror=None, output_path=None, offline=False):
+    """取得單本書的本機檔案：先查鏡像，找不到且允許連網時下載"""
+    if catalog:
+        books = search_catalog(catalog, ids={book_id}, limit=1)
+    elif offline:
+        books = [{"id": book_id}]
+    else:
+        books = search_online(ids=[book_id])
+    if not books:
+        return {"success": False, "error": f"書目中找不到書籍 {book_id}"}
+    book = books[0]
+    if mirror:
+        path = resolve_local(book, mirror)
+        if path:
+            return {"success": True, "id": book_id, "path": str(path), "source": "mirror"}
+    if offline:
+        return {"success": False, "error": f"鏡像中找不到書籍 {book_id}（離線模式不下載）"}
+    try:
+        path = download_book(book, output_path)
+    except (OSError, ValueError) as e:
+        return {"success": False, "error": f"下載失敗：{e}"}
+    return {"success": True, "id": book_id, "path": str(path), "source": "download"}
+
+
+# ── 批次處理 ────────────────────────────────────────────
+
+def _file_hash(path):
+    return extract_text.cache_file_hash(path)
+
+
+def _book_dir_name(book):
+    slug = extract_text._slugify(book.get("title", ""))
+    return f"{book['id']}_{slug}" if slug else str(book["id"])
+
+
+def _process_book(book, source, book_dir, plan_options):
+    """單本書：單次開檔產生計畫並分塊提取，寫出 plan.json"""
+    start_time = time.perf_counter()
+    book_dir = Path(book_dir)
+    book_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        result = extract_text.plan_document(
+            source, output_dir=str(book_dir / "chunks"), **plan_options
+        )
+    except Exception as e:  # 單本書失敗不中斷整批
+        result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+    result["book"] = summarize_book(book)
+    result["source"] = str(source)
+    plan_path = book_dir / "plan.json"
+    plan_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    entry = {
+        "id": book["id"],
+        "title": book.get("title", ""),
+        "success": result["success"],
+        "plan": str(plan_path),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+    if result["success"]:
+        entry["estimated_tokens"] = result["info"]["estimated_tokens"]
+        entry["chunks"] = len(result["chunks"])
+    else:
+        entry["error"] = result.get("error") or "部分分塊提取失敗"
+    return entry
+
+
+def run_batch(
+    catalog, mirror, output_dir, search=None, languages=None, ids=None, limit=None,
+    workers=1, force=False, **plan_options
+):
+    """批次處理書目中符合條件且鏡像中有檔案的書；依 .batch-state.json 略過未變更的書"""
+    start_time = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state_path = output_dir / BATCH_STATE_FILE
+    try:
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    jobs = []
+    skipped = []
+    missing = []
+    for book in search_catalog(catalog, search, languages, ids, limit):
+        source = resolve_local(book, mirror)
+        if source is None:
+            missing.append({"id": book["id"], "title": book.get("title", "")})
+            continue
+        source_hash = _file_hash(source)
+        book_dir = output_dir / _book_dir_name(book)
+        previous = state.get(str(book["id"]))
+        if (
+            not force
+            and previous
+            and previous["source_hash"] == source_hash
+            and previous["options"] == plan_options
+            and (book_dir / "plan.json").is_file()
+        ):
+            skipped.append({"id": book["id"], "plan": str(book_dir / "plan.json")})
+            continue
+        jobs.append((book, source, book_dir, source_hash))
+
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                _process_book,
+                [book for book, _, _, _ in jobs],
+                [source for _, source, _, _ in jobs],
+                [book_dir for _, _, book_dir, _ in jobs],
+                [plan_options] * len(jobs),
+            ))
+    else:
+        results = [
+            _process_book(book, source, book_dir, plan_options)
+            for book, source, book_dir, _ in jobs
+        ]
+
+    for (book, source, _, source_hash), result in zip(jobs, results):
+        if result["success"]:
+            state[str(book["id"])] = {
+                "source": str(source),
+                "source_hash": source_hash,
+                "options": plan_options,
+            }
+    tmp = state_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, state_path)
+
+    processed = [r for r in results if r["success"]]
+    failures = [r for r in results if not r["success"]]
+    return {
+        "success": not failures,
+        "processed": processed,
+        "skipped": skipped,
+        "missing": missing,
+        "failures": failures,
+        "counts": {
+            "processed": len(processed), "skipped": len(skipped),
+            "missing": len(missing), "failed": len(failures),
+        },
+        "workers": max(1, workers),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def _fail(message):
+    print(json.dumps({"success": False, "error": message}, ensure_ascii=False), file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRISP 閱讀助手：Project Gutenberg 書目與鏡像")
+    parser.add_argument(
+        "--catalog", default=os.environ.get("CRISP_READING_GUTENDEX_CATALOG"),
+        help="本機 Gutendex 格式書目（JSON / NDJSON 檔或目錄）；未指定時查詢線上 API",
+    )
+    parser.add_argument(
+        "--mirror", default=os.environ.get("CRISP_READING_GUTENBERG_MIRROR"),
+        help="本機 Gutenberg 鏡像目錄",
+    )
+    parser.add_argument(
+        "--languages", help="語言代碼，逗號分隔，如 zh 或 en,fr（中文書必須加 zh）"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_search = sub.add_parser("search", help="搜尋書目")
+    p_search.add_argument("query", help="書名或作者（勿自行翻譯書名）")
+    p_search.add_argument("--limit", type=int, default=20, help="最多回傳筆數（預設 20）")
+
+    p_fetch = sub.add_parser("fetch", help="取得全文檔案（鏡像優先，必要時下載）")
+    p_fetch.add_argument("id", type=int, help="Gutenberg 書籍 ID")
+    p_fetch.add_argument("--output", "-o", help="下載存檔路徑（預設 pg<id>.txt）")
+    p_fetch.add_argument("--offline", action="store_true", help="只查鏡像，不連網")
+
+    p_batch = sub.add_parser("batch", help="離線批次：依書目 + 鏡像產生計畫並分塊提取")
+    p_batch.add_argument("--search", help="只處理書名 / 作者符合者")
+    p_batch.add_argument("--ids", help="只處理指定 ID，逗號分隔")
+    p_batch.add_argument("--limit", type=int, help="最多處理幾本")
+    p_batch.add_argument("--output-dir", "-O", required=True, help="輸出目錄（每本書一個子目錄）")
+    p_batch.add_argument("--chunk-size", type=int, help="分塊頁數（TXT 為文字區塊數）")
+    p_batch.add_argument(
+        "--max-tokens-per-chunk", type=int,
+        help=f"每塊 token 預算（未指定 --chunk-size 時預設 {DEFAULT_MAX_TOKENS}）",
+    )
+    p_batch.add_argument("--chunk-by", help="依目錄章節分塊，如 toc 或 toc:2")
+    p_batch.add_argument("--workers", "-j", type=int, default=1, help="平行處理的書籍數")
+    p_batch.add_argument("--force", action="store_true", help="忽略記錄，全部重做")
+    args = parser.parse_args()
+
+    languages = args.languages.split(",") if args.languages else None
+
+    if args.command == "search":
+        try:
+            if args.catalog:
+                books = search_catalog(args.catalog, args.query, languages, limit=args.limit)
+            else:
+                books = search_online(args.query, languages)[: args.limit]
+        except (OSError, json.JSONDecodeError) as e:
+            _fail(f"書目查詢失敗：{e}")
+        result = {"success": True, "count": len(books), "results": [summarize_book(b) for b in books]}
+    elif args.command == "fetch":
+        try:
+            result = fetch(args.id, args.catalog, args.mirror, args.output, args.offline)
+        except (OSError, json.JSONDecodeError) as e:
+            _fail(f"書目查詢失敗：{e}")
+        if not result["success"]:
+            _fail(result["error"])
+    else:
+        if not args.catalog or not args.mirror:
+            _fail("batch 需要 --catalog 與 --mirror（或對應的環境變數）")
+        toc_level = None
+        if args.chunk_by:
+            mode, _, level = args.chunk_by.partition(":")
+            if mode != "toc" or (level and not level.isdigit()):
+                parser.error("--chunk-by 格式為 toc 或 toc:<層級>")
+            toc_level = int(level or 1)
+        # token 預算優先於 --chunk-size，預設值只在未指定 --chunk-size 時套用
+        max_tokens = args.max_tokens_per_chunk
+        if max_tokens is None and not args.chunk_size:
+            max_tokens = DEFAULT_MAX_TOKENS
+        ids = {int(i) for i in args.ids.split(",")} if args.ids else None
+        result = run_batch(
+            args.catalog, args.mirror, args.output_dir, args.search, languages, ids, args.limit,
+            args.workers, args.force,
+            chunk_size=args.chunk_size, max_tokens=max_tokens, toc_level=toc_level,
+        )
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result["success"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
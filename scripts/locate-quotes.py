@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+驗證分析 JSON 的引句並補上頁碼：在書籍逐頁文字上建立字元 n-gram 索引
+（CJK 無詞界亦適用），逐則查出引句所在頁面與相符程度，可選擇改寫 quotes[].source。
+
+用法：
+  python locate-quotes.py analysis.json book.pdf                # 只回報
+  python locate-quotes.py analysis.json book.pdf --write        # 補上 / 修正 source 的頁碼（原地改寫）
+  python locate-quotes.py analysis.json book.pdf --write -o fixed.json
+  python locate-quotes.py analysis.json book.pdf.crispbook      # 直接讀 extract-text.py --pack 的封裝檔
+
+書籍來源：來源檔旁有仍有效的封裝檔（book.pdf.crispbook）時直接讀取，否則逐頁提取
+（PDF 只取文字層，不做 markdown 轉換）。索引只掃描全書一次，每則引句查詢為毫秒級。
+
+比對方式：
+  - 引句與頁面皆正規化（全形轉半形、小寫、去除標點與空白），容忍標點、斷行與少量 OCR 差異。
+  - 中英並列的引句（原文 + 譯文）拆成各文字系統的片段分別查詢，取最相符者（書中通常只有原文）。
+  - 以 trigram 倒排索引找出候選頁，再以「引句 trigram 出現在頁面中的比例」計分（0–1）；
+    跨頁的引句比對相鄰兩頁的銜接處。分數低於 --min-score 視為找不到。
+
+頁碼：PDF 定義了頁碼標籤（書上印的頁碼）時以標籤比對與補寫；未定義時 page 為檔案中的頁序（1 起算），
+此時既有的頁碼可能是書上頁碼而無法判斷對錯，只回報 page_unverified、不改寫，--write 只補上缺少的頁碼。
+EPUB / TXT 沒有頁碼，改以章節名稱作為來源。
+
+輸出：JSON 至 stdout（各引句的頁面、章節、分數、狀態與建議的 source）
+"""
+
+import argparse
+import importlib.util
+import json
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+
+NGRAM = 3
+DEFAULT_MIN_SCORE = 0.6
+CANDIDATES = 5          # 每個片段驗證的候選頁數
+COMMON_GRAM_RATIO = 0.5  # 出現在超過此比例頁面的 trigram 不用於找候選
+MIN_SEGMENT_CHARS = 4
+TEXT_PREVIEW_CHARS = 40
+
+# 來源中的頁碼寫法：p. 12、pp. 12-13、第 12 頁、頁 12
+_PAGE_REF_RE = re.compile(
+    r"\bpp?\.\s*(\d+)(?:\s*[-–]\s*(\d+))?|第\s*(\d+)\s*(?:[-–]\s*(\d+)\s*)?頁|頁\s*(\d+)",
+    re.IGNORECASE,
+)
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+
+_spec = importlib.util.spec_from_file_location(
+    "extract_text", Path(__file__).resolve().parent / "extract-text.py"
+)
+extract_text = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(extract_text)
+
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """比對用正規化：NFKC、小寫，只留文字與數字（去除標點、符號、markdown 標記與空白）"""
+    return _NON_WORD_RE.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def ngrams(normalized, n=NGRAM):
+    return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+
+def quote_segments(text):
+    """將引句依文字系統（CJK / 其他）拆段並正規化，略過過短的片段；單一文字系統時即整句。
+    數字與標點跟隨所在的片段，不造成分段。"""
+    runs, current, current_cjk = [], [], None
+    for ch in text:
+        if unicodedata.category(ch)[0] == "L":
+            is_cjk = bool(_CJK_RE.match(ch))
+            if current_cjk is not None and is_cjk != current_cjk:
+                runs.append("".join(current))
+                current = []
+            current_cjk = is_cjk
+        current.append(ch)
+    runs.append("".join(current))
+    segments = [normalize(run) for run in runs]
+    return [s for s in segments if len(s) >= MIN_SEGMENT_CHARS]
+
+
+class PageIndex:
+    """逐頁 trigram 倒排索引；add_page 依序加入（單次掃描），locate 查詢片段所在頁"""
+
+    def __init__(self):
+        self.pages = []       # 頁索引
+        self.texts = []       # 正規化後的頁面文字
+        self.postings = {}    # trigram → 含此 trigram 的頁面序號（self.pages 中的位置）
+
+    def add_page(self, page, text):
+        slot = len(self.pages)
+        normalized = normalize(text)
+        self.pages.append(page)
+        self.texts.append(normalized)
+        for gram in ngrams(normalized):
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = [slot]
+            else:
+                posting.append(slot)
+
+    def _coverage(self, grams, text):
+        return sum(1 for gram in grams if gram in text) / len(grams)
+
+    def locate(self, segment):
+        """回傳 (頁面序號清單, 分數, 完全相符的候選頁數)；找不到候選時為 ([], 0.0, 0)。
+        完全相符的頁數大於 1 表示片段在書中重複出現（如每章都有的句子），位置不可靠。
+        """
+        grams = ngrams(segment)
+        if not grams:
+            return [], 0.0, 0
+        common = max(2, int(len(self.pages) * COMMON_GRAM_RATIO))
+        counts = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting and len(posting) <= common:
+                counts.update(posting)
+        if not counts:  # 全是常見 trigram（極短的引句）
+            for gram in grams:
+                counts.update(self.postings.get(gram, ()))
+        candidates = [slot for slot, _ in counts.most_common(CANDIDATES)]
+        exact = [slot for slot in candidates if segment in self.texts[slot]]
+        if exact:
+            return [min(exact)], 1.0, len(exact)
+        best = ([], 0.0, 0)
+        for slot in candidates:
+            text = self.texts[slot]
+            score = self._coverage(grams, text)
+            if score > best[1]:
+                best = ([slot], score, 0)
+            # 跨頁：與前後頁的銜接處合併比對
+            window = len(segment) * 2
+            for first in (slot - 1, slot):
+                if 0 <= first and first + 1 < len(self.texts):
+                    joined = self.texts[first][-window:] + self.texts[first + 1][:window]
+                    if segment in joined:
+                        return [first, first + 1], 1.0, 1
+                    joined_score = self._coverage(grams, joined)
+                    if joined_score > best[1] + 0.05:
+                        best = ([first, first + 1], joined_score, 0)
+        return best
+
+
+def _page_label(pages):
+    return f"p. {pages[0]}" if len(pages) == 1 else f"pp. {pages[0]}–{pages[-1]}"
+
+
+def check_source(source, pages, chapter, paged, printed=None):
+    """比對既有 source 與定位結果，回傳 (狀態, 建議的 source 或 None)。
+    printed 為各頁的書上頁碼標籤；沒有時 pages（檔案頁序）與書上頁碼可能不同，
+    既有頁碼對不上只回報 page_unverified，不建議改寫。"""
+    source = (source or "").strip()
+    if not paged:
+        if source:
+            return "ok", None
+        return "missing_source", chapter
+    shown = printed or pages
+    refs = [m for m in _PAGE_REF_RE.finditer(source)]
+    if not refs:
+        if not source:
+            return "missing_page", f"{chapter}，{_page_label(shown)}" if chapter else _page_label(shown)
+        return "missing_page", f"{source}，{_page_label(shown)}"
+    targets = [int(label) for label in printed if label.isdigit()] if printed else pages
+    for match in refs:
+        numbers = [int(n) for n in match.groups() if n]
+        start, end = numbers[0], numbers[-1]
+        if any(start <= page <= end for page in targets):
+            return "ok", None
+    if not printed:
+        return "page_unverified", None
+    first = refs[0]
+    return "page_mismatch", source[:first.start()] + _page_label(printed) + source[first.end():]
+
+
+def build_index(book_path):
+    """單次掃描書籍逐頁文字建立索引，回傳 (PageIndex, meta)"""
+    pages, meta = extract_text.open_page_source(book_path, plain=True)
+    index = PageIndex()
+    for page, text in pages:
+        index.add_page(page, text)
+    return index, meta
+
+
+def locate_quotes(data, index, meta, min_score=DEFAULT_MIN_SCORE):
+    """逐則定位 data["quotes"]，回傳結果清單（不修改 data）"""
+    paged = meta.get("unit", "page") == "page"
+    chapter_of = extract_text.toc_lookup(meta.get("toc") or [])
+    labels = meta.get("page_labels")
+    results = []
+    for i, quote in enumerate(data.get("quotes") or []):
+        text = quote.get("text", "") if isinstance(quote, dict) else str(quote)
+        entry = {"index": i, "text": text[:TEXT_PREVIEW_CHARS] + ("…" if len(text) > TEXT_PREVIEW_CHARS else "")}
+        # 各片段取分數最高者；同分時完全相符頁數少（位置明確）、片段長者優先
+        best, best_rank = ([], 0.0, 0), None
+        for segment in quote_segments(text):
+            found = index.locate(segment)
+            rank = (found[1], -found[2] if found[2] else -CANDIDATES, len(segment))
+            if found[0] and (best_rank is None or rank > best_rank):
+                best, best_rank = found, rank
+        slots, score, exact = best
+        entry["score"] = round(score, 3)
+        if not slots or score < min_score:
+            entry["status"] = "not_found"
+            results.append(entry)
+            continue
+        pages = [index.pages[slot] + 1 for slot in slots]
+        chapter = chapter_of(pages[0])
+        entry["page" if len(pages) == 1 else "pages"] = pages[0] if len(pages) == 1 else pages
+        printed = [labels[page - 1] for page in pages] if labels else None
+        if printed and all(printed):
+            entry["printed_page" if len(pages) == 1 else "printed_pages"] = (
+                printed[0] if len(printed) == 1 else printed
+            )
+        else:
+            printed = None  # 部分頁面（如封面）沒有標籤：視同無書上頁碼
+        if chapter:
+            entry["chapter"] = chapter
+        if exact:
+            entry["exact"] = True
+        if exact > 1:
+            entry["repeated_on_pages"] = exact  # 重複出現於多頁，取第一處
+        source = quote.get("source", "") if isinstance(quote, dict) else ""
+        entry["source"] = source
+        status, suggested = check_source(source, pages, chapter, paged, printed)
+        entry["status"] = status
+        if suggested and isinstance(quote, dict):
+            entry["suggested_source"] = suggested
+        results.append(entry)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRISP 閱讀解構師：引句定位與頁碼校正")
+    parser.add_argument("analysis", help="分析結果 JSON")
+    parser.add_argument("book", help="書籍檔案（PDF / EPUB / TXT）或 .crispbook 封裝檔")
+    parser.add_argument(
+        "--min-score", type=float, default=DEFAULT_MIN_SCORE,
+        help=f"視為找到的最低相符分數（0–1，預設 {DEFAULT_MIN_SCORE}）",
+    )
+    parser.add_argument("--write", action="store_true", help="依定位結果補上 / 修正 quotes[].source")
+    parser.add_argument("--output", "-o", help="--write 的輸出路徑（預設原地改寫分析 JSON）")
+    args = parser.parse_args()
+
+    analysis_path, book_path = Path(args.analysis), Path(args.book)
+    for path in (analysis_path, book_path):
+        if not path.is_file():
+            print(json.dumps({"success": False, "error": f"找不到：{path}"}, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
+    try:
+        data = json.loads(analysis_path.read_text(encoding="utf-8"))
+        start_time = time.perf_counter()
+        index, meta = build_index(book_path)
+    except Exception as e:
+        print(json.dumps({"success": False, "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+    index_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    results = locate_quotes(data, index, meta, args.min_score)
+    lookup_seconds = time.perf_counter() - start_time
+
+    result = {
+        "success": True,
+        "book": str(book_path),
+        "text_source": meta["source"],
+        "unit": meta["unit"],
+        "pages_indexed": len(index.pages),
+        "index_seconds": round(index_seconds, 3),
+        "lookup_ms_per_quote": round(lookup_seconds * 1000 / max(1, len(results)), 2),
+        "counts": dict(Counter(r["status"] for r in results)),
+        "quotes": results,
+    }
+    if args.write:
+        changed = 0
+        for entry in results:
+            if "suggested_source" in entry:
+                data["quotes"][entry["index"]]["source"] = entry["suggested_source"]
+                changed += 1
+        output_path = Path(args.output) if args.output else analysis_path
+        if changed or args.output:
+            tmp = output_path.with_name(output_path.name + ".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(output_path)
+        result["output_path"] = str(output_path)
+        result["sources_updated"] = changed
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
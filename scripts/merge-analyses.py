@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+合併大型書籍各分塊的局部分析 JSON（結構同 references/json-schema.md）為單一分析 JSON。
+不需把所有局部筆記再讀回 context：重複的概念、引句、知識卡片等以正規化鍵與
+字元 n-gram 相似度（CJK 無詞界亦適用）合併，並列出需要人工或 Claude 複查的衝突。
+
+用法：
+  python merge-analyses.py partials/*.json -o analysis.json          # 依檔名（自然排序）為分塊順序
+  python merge-analyses.py partials/ -o analysis.json --threshold 0.85
+  python merge-analyses.py partials/ -o analysis.json --no-provenance  # 不在各項目加 provenance
+
+合併規則：
+  - 清單欄位依鍵欄位（key_concepts.name、quotes.text、zettelkasten.concept、
+    core_arguments.title…）比對：正規化後相同（含去掉括號內原文的名稱）直接合併；
+    否則字元 bigram 的 Dice 相似度 ≥ --threshold 視為同一項（引句另接受一方包含另一方）。
+  - 同一項的其他欄位：缺的補上、相近的取較完整者；差異大時保留先出現者並列入衝突。
+    引句的 source 不同即列入衝突；知識卡片的 type 取最成熟者（permanent > literature > fleeting）。
+  - 書名、評分等單值欄位取第一個非空值，各分塊不一致時列入衝突。
+  - 各項目附 provenance（來自哪些分塊，以檔名表示）；模糊比對的合併也列入衝突供確認。
+
+輸出：合併後的分析 JSON 寫入 --output；摘要（各欄位合併前後筆數、衝突清單）以 JSON 印至 stdout
+"""
+
+import argparse
+import glob
+import json
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+
+# 清單欄位 → (鍵欄位, 主要內容欄位)；內容欄位用於判斷同一項的說法是否衝突
+LIST_FIELDS = {
+    "core_arguments": ("title", "body"),
+    "key_concepts": ("name", "definition"),
+    "critical_perspectives": ("title", "content"),
+    "quotes": ("text", "source"),
+    "actions": ("title", "description"),
+    "zettelkasten": ("concept", "reason"),
+    "meta_knowledge": ("lens", "description"),
+    "further_reading": ("title", "reason"),
+}
+SCALAR_FIELDS = (
+    "slug", "book_title", "book_author", "book_author_zh", "book_type_tag",
+    "one_line_review", "book_introduction", "tips_scores", "concept_relations_svg",
+    "generation_date",
+)
+ZETTEL_TYPE_RANK = {"fleeting": 0, "literature": 1, "permanent": 2}
+
+DEFAULT_THRESHOLD = 0.8
+AGREE_THRESHOLD = 0.5      # 同一項的內容欄位相似度低於此值視為說法衝突
+CONTAINMENT_MIN_GRAMS = 8  # 引句包含關係至少需要的 bigram 數（避免短句誤判）
+POSTING_CAP = 64           # 出現於過多項目的 bigram 不用於找候選，維持近線性時間
+CANDIDATES = 8             # 每項最多驗證的候選數
+CONFLICT_VALUE_CHARS = 160
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_PAREN_RE = re.compile(r"[（(][^（）()]*[）)]")
+_NUMERAL_RE = re.compile(r"[0-9零〇一二三四五六七八九十百千]+")
+
+
+def normalize(text):
+    """比對用正規化：NFKC（全形轉半形）、小寫、去除 HTML 標籤、標點、符號與空白"""
+    text = unicodedata.normalize("NFKC", _TAG_RE.sub("", str(text))).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PSZC")
+
+
+def bigrams(normalized):
+    """字元 bigram 集合；單字元字串以自身為唯一元素"""
+    if len(normalized) < 2:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + 2] for i in range(len(normalized) - 1)}
+
+
+def similarity(a, b):
+    """兩段文字的 bigram Dice 相似度（0–1）"""
+    ga, gb = bigrams(normalize(a)), bigrams(normalize(b))
+    if not ga or not gb:
+        return 0.0
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+
+def numerals(normalized):
+    """數字序列（含中文數字）；「第一定律」與「第二定律」、「原則 1」與「原則 2」字面相近但不是同一項"""
+    return tuple(_NUMERAL_RE.findall(normalized))
+
+
+def _key_variants(text):
+    """精確比對鍵：完整名稱，以及去掉括號內原文 / 譯名的名稱（如「複利（Compounding）」→「複利」）"""
+    keys = {normalize(text)}
+    stripped = normalize(_PAREN_RE.sub("", str(text)))
+    if stripped:
+        keys.add(stripped)
+    keys.discard("")
+    return keys
+
+
+class FuzzyIndex:
+    """已合併項目的比對索引：精確鍵字典 + bigram 倒排索引。
+    每筆查詢只檢查共享 bigram 最多的少數候選，出現於過多項目的 bigram 不參與找候選，
+    整體時間與項目數近線性。
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, containment=False):
+        self.threshold = threshold
+        self.containment = containment
+        self.exact = {}
+        self.grams = []
+        self.numerals = []
+        self.postings = {}
+
+    def find(self, keys, grams, numbers=()):
+        """回傳 (項目編號, 相似度)；無相符者為 (None, 0.0)。數字序列不同者不做模糊比對"""
+        for key in keys:
+            if key in self.exact:
+                return self.exact[key], 1.0
+        counts = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting and len(posting) <= POSTING_CAP:
+                counts.update(posting)
+        best, best_score = None, 0.0
+        for index, _ in counts.most_common(CANDIDATES):
+            if self.numerals[index] != numbers:
+                continue
+            other = self.grams[index]
+            shared = len(grams & other)
+            score = 2 * shared / (len(grams) + len(other))
+            if self.containment and min(len(grams), len(other)) >= CONTAINMENT_MIN_GRAMS:
+                score = max(score, shared / min(len(grams), len(other)))
+            if score >= self.threshold and score > best_score:
+                best, best_score = index, score
+        return best, round(best_score, 3)
+
+    def add(self, keys, grams, numbers=()):
+        index = len(self.grams)
+        self.grams.append(grams)
+        self.numerals.append(numbers)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(index)
+        self.alias(index, keys)
+        return index
+
+    def alias(self, index, keys):
+        for key in keys:
+            self.exact.setdefault(key, index)
+
+
+def _clip(value):
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= CONFLICT_VALUE_CHARS else text[:CONFLICT_VALUE_CHARS] + "…"
+
+
+class AnalysisMerger:
+    """依分塊順序逐份併入局部分析；merged() 取得結果，conflicts 為複查清單"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, provenance=True):
+        self.threshold = threshold
+        self.provenance = provenance
+        self.scalars = {}
+        self.scalar_sources = {}
+        self.lists = {field: [] for field in LIST_FIELDS}
+        self.item_sources = {field: [] for field in LIST_FIELDS}
+        self.indexes = {
+            field: FuzzyIndex(threshold, containment=field == "quotes") for field in LIST_FIELDS
+        }
+        self.critical_text = {}  # 字串形式的 critical_perspectives：正規化文字 → 在清單中的位置
+        self.extra = {}
+        self.conflicts = []
+        self._value_conflicts = {}
+        self.counts = {field: {"input": 0, "merged": 0} for field in LIST_FIELDS}
+
+    def add(self, label, data):
+        for field in SCALAR_FIELDS:
+            self._add_scalar(label, field, data.get(field))
+        for field in LIST_FIELDS:
+            value = data.get(field)
+            if field == "critical_perspectives" and isinstance(value, str):
+                self._add_critical_text(label, value)
+                continue
+            for item in value or []:
+                self.counts[field]["input"] += 1
+                self._add_item(label, field, item)
+        for key, value in data.items():
+            if key not in SCALAR_FIELDS and key not in LIST_FIELDS and value not in (None, "", [], {}):
+                self.extra.setdefault(key, value)
+
+    def _add_critical_text(self, label, value):
+        """字串形式的 critical_perspectives 依分塊順序併入清單（相同文字只保留一份）"""
+        text = value.strip()
+        if not text:
+            return
+        field = "critical_perspectives"
+        self.counts[field]["input"] += 1
+        index = self.critical_text.get(normalize(text))
+        if index is not None:
+            if label not in self.item_sources[field][index]:
+                self.item_sources[field][index].append(label)
+            return
+        self.critical_text[normalize(text)] = len(self.lists[field])
+        self.lists[field].append(text)
+        self.item_sources[field].append([label])
+        self.indexes[field].add(set(), set())
+
+    def _add_scalar(self, label, field, value):
+        if value in (None, "", [], {}):
+            return
+        if field not in self.scalars:
+            self.scalars[field] = value
+            self.scalar_sources[field] = label
+            return
+        current = self.scalars[field]
+        same = (
+            normalize(current) == normalize(value)
+            if isinstance(current, str) and isinstance(value, str)
+            else current == value
+        )
+        if not same:
+            self._conflict(
+                field, None, None,
+                [(self.scalar_sources[field], current), (label, value)],
+            )
+
+    def _add_item(self, label, field, item):
+        key_field, _ = LIST_FIELDS[field]
+        key_text = item if isinstance(item, str) else item.get(key_field, "") if isinstance(item, dict) else ""
+        if not isinstance(item, (str, dict)) or not normalize(key_text):
+            # 無鍵可比對的項目原樣保留
+            self.lists[field].append(item)
+            self.item_sources[field].append([label])
+            self.indexes[field].add(set(), set())
+            return
+        keys = _key_variants(key_text)
+        normalized = normalize(key_text)
+        grams, numbers = bigrams(normalized), numerals(normalized)
+        index, score = self.indexes[field].find(keys, grams, numbers)
+        if index is None:
+            self.indexes[field].add(keys, grams, numbers)
+            self.lists[field].append(dict(item) if isinstance(item, dict) else item)
+            self.item_sources[field].append([label])
+            return
+        self.indexes[field].alias(index, keys)
+        if label not in self.item_sources[field][index]:
+            self.item_sources[field][index].append(label)
+        existing = self.lists[field][index]
+        existing_key = existing if isinstance(existing, str) else existing.get(key_field, "")
+        if score < 1.0:
+            self.conflicts.append({
+                "kind": "fuzzy_merge",
+                "field": field,
+                "kept": _clip(existing_key),
+                "merged": _clip(key_text),
+                "score": score,
+                "provenance": [self.item_sources[field][index][0], label],
+            })
+        if isinstance(existing, dict) and isinstance(item, dict):
+            self._merge_fields(label, field, index, existing, item)
+
+    def _merge_fields(self, label, field, index, existing, item):
+        key_field, _ = LIST_FIELDS[field]
+        first = self.item_sources[field][index][0]
+        for name, value in item.items():
+            if value in (None, "", [], {}):
+                continue
+            current = existing.get(name)
+            if current in (None, "", [], {}):
+                existing[name] = value
+                continue
+            if name == "type" and field == "zettelkasten":
+                if ZETTEL_TYPE_RANK.get(value, -1) > ZETTEL_TYPE_RANK.get(current, -1):
+                    existing[name] = value
+                continue
+            if not isinstance(current, str) or not isinstance(value, str):
+                if current != value:
+                    self._conflict(field, existing.get(key_field), name, [(first, current), (label, value)])
+                continue
+            a, b = normalize(current), normalize(value)
+            if a == b:
+                continue
+            if name == key_field:
+                # 名稱沿用先出現者；引句取較完整的一方（另一方為節錄）
+                if field == "quotes" and len(b) > len(a):
+                    existing[name] = value
+                continue
+            if a in b or b in a:
+                if len(b) > len(a):
+                    existing[name] = value
+                continue
+            if field == "quotes" and name == "source":
+                self._conflict(field, existing.get(key_field), name, [(first, current), (label, value)])
+                continue
+            if similarity(current, value) >= AGREE_THRESHOLD:
+                if len(b) > len(a):
+                    existing[name] = value
+            else:
+                self._conflict(field, existing.get(key_field), name, [(first, current), (label, value)])
+
+    def _conflict(self, field, key, attribute, values):
+        """同一欄位（或同一項的同一屬性）已有衝突時併入既有紀錄"""
+        conflict = self._value_conflicts.get((field, key, attribute))
+        if conflict is not None:
+            for source, value in values[1:]:
+                conflict["values"].append({"provenance": source, "value": _clip(value)})
+            return
+        entry = {"kind": "value", "field": field}
+        if key is not None:
+            entry["key"] = _clip(key)
+        if attribute is not None:
+            entry["attribute"] = attribute
+        entry["kept"] = values[0][0]
+        entry["values"] = [{"provenance": source, "value": _clip(value)} for source, value in values]
+        self.conflicts.append(entry)
+        self._value_conflicts[(field, key, attribute)] = entry
+
+    def merged(self):
+        result = dict(self.scalars)
+        for field in LIST_FIELDS:
+            # critical_perspectives 全為字串時維持字串；與清單混用時字串轉為只有 content 的項目
+            texts = set(self.critical_text.values()) if field == "critical_perspectives" else set()
+            if texts and len(texts) == len(self.lists[field]):
+                self.counts[field]["merged"] = len(texts)
+                result[field] = "\n\n".join(self.lists[field])
+                continue
+            items = []
+            for i, (item, sources) in enumerate(zip(self.lists[field], self.item_sources[field])):
+                if i in texts:
+                    item = {"content": item}
+                if self.provenance and isinstance(item, dict):
+                    item = {**item, "provenance": sources}
+                items.append(item)
+            self.counts[field]["merged"] = len(items)
+            if items:
+                result[field] = items
+        for key, value in self.extra.items():
+            result.setdefault(key, value)
+        return result
+
+
+def _natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", str(path))]
+
+
+def expand_inputs(sources):
+    """檔案、目錄（其下 *.json）或 glob 樣式 → 依自然排序（chunk-2 在 chunk-10 之前）的路徑"""
+    paths = []
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            paths.extend(sorted(path.glob("*.json"), key=_natural_key))
+        elif path.is_file():
+            paths.append(path)
+        else:
+            matches = sorted(glob.glob(source), key=_natural_key)
+            if not matches:
+                raise FileNotFoundError(f"找不到：{source}")
+            paths.extend(Path(m) for m in matches)
+    return paths
+
+
+def merge_analyses(paths, threshold=DEFAULT_THRESHOLD, provenance=True):
+    """合併多份局部分析，回傳 (合併後的分析, 摘要)"""
+    merger = AnalysisMerger(threshold, provenance)
+    for path in paths:
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON 無效：{path}：{e}") from e
+        if not isinstance(data, dict):
+            raise ValueError(f"JSON 最外層須為物件：{path}")
+        merger.add(Path(path).stem, data)
+    merged = merger.merged()
+    summary = {
+        "inputs": [str(p) for p in paths],
+        "counts": {field: c for field, c in merger.counts.items() if c["input"]},
+        "conflicts": merger.conflicts,
+    }
+    return merged, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRISP 閱讀解構師：合併分塊的局部分析 JSON")
+    parser.add_argument("inputs", nargs="+", help="局部分析 JSON：檔案、目錄或 glob（依自然排序為分塊順序）")
+    parser.add_argument("--output", "-o", default="merged-analysis.json", help="合併結果路徑（預設 merged-analysis.json）")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help=f"模糊比對視為同一項的 bigram 相似度（0–1，預設 {DEFAULT_THRESHOLD}）",
+    )
+    parser.add_argument("--no-provenance", action="store_true", help="不在各項目附上來源分塊")
+    args = parser.parse_args()
+    if not 0 < args.threshold <= 1:
+        parser.error("--threshold 須介於 0 與 1 之間")
+
+    start_time = time.perf_counter()
+    try:
+        paths = expand_inputs(args.inputs)
+        if not paths:
+            raise FileNotFoundError(f"沒有局部分析 JSON：{' '.join(args.inputs)}")
+        merged, summary = merge_analyses(paths, args.threshold, not args.no_provenance)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+
+    output_path = Path(args.output)
+    tmp = output_path.with_name(output_path.name + ".tmp")
+    tmp.write_text(json.dumps(merged, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(output_path)
+    result = {"success": True, "output_path": str(output_path), **summary}
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+段落檢索索引：把書籍逐頁文字切成段落，建立持久化的 BM25 倒排索引（SQLite 單一檔案），
+供分析時以關鍵字找回原文段落與頁碼，不必把整本書重新讀進上下文。
+
+用法：
+  python passage-index.py build chunks/                       # 依分塊輸出的進度紀錄，索引已提取的頁面
+  python passage-index.py build book.pdf --output-dir chunks/ # 直接索引整本書（或 --pages 指定範圍）
+  python passage-index.py search chunks/ "認知負荷 working memory" -k 5
+  python passage-index.py search chunks/.passage-index.sqlite "deliberate practice" --pages 1-120
+
+索引檔：<輸出目錄>/.passage-index.sqlite，與 extract-text.py 的分塊輸出放在一起。
+
+建立方式：
+  - 逐頁串流：一次只讀一頁、切段落、寫入索引，記憶體用量與書的大小無關。
+  - 增量：每頁記錄文字雜湊，重跑時未變動的頁面直接跳過，內容變動的頁面換掉舊段落；
+    分塊提取續跑（--resume）新增頁面後再跑一次 build，只索引新頁面。
+  - 頁面文字：來源檔旁有仍有效的封裝檔（book.pdf.crispbook）時直接讀取，否則逐頁提取
+    （PDF 只取文字層，不做 markdown 轉換）。
+
+斷詞：全形轉半形、小寫；拉丁字母與數字以詞為單位，CJK 連續字串切成重疊的雙字（bigram），
+單一 CJK 字則自成一詞。查詢字串以同樣方式斷詞，不需要中文分詞詞典。
+
+輸出：JSON 至 stdout（build 為索引統計，search 為前 k 個段落、分數、頁碼與章節）
+"""
+
+import argparse
+import hashlib
+import heapq
+import importlib.util
+import json
+import math
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+
+INDEX_FILE = ".passage-index.sqlite"
+INDEX_VERSION = 1
+PASSAGE_CHARS = 600     # 段落目標長度（字元）；不跨頁
+MIN_PASSAGE_CHARS = 80  # 頁尾過短的殘段併入前一段
+COMMIT_EVERY = 50       # 每寫入幾頁提交一次
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_TOP_K = 5
+
+_CJK = "\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RUN_RE = re.compile(rf"[{_CJK}]")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[。！？；.!?;])\s*")
+
+_spec = importlib.util.spec_from_file_location(
+    "extract_text", Path(__file__).resolve().parent / "extract-text.py"
+)
+extract_text = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(extract_text)
+
+
+def tokenize(text):
+    """斷詞：拉丁字母 / 數字取整詞，CJK 連續字串取重疊雙字"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        run = match.group()
+        if _CJK_RUN_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def split_passages(text, size=PASSAGE_CHARS):
+    """把一頁文字切成段落：依空行分段，短段合併到約 size 字元，過長的段落在句末切開"""
+    pieces = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= size:
+            pieces.append(paragraph)
+            continue
+        # 過長：先依行、再依句子切成不超過 size 的片段
+        for line in paragraph.split("\n"):
+            line = line.strip()
+            if len(line) <= size:
+                if line:
+                    pieces.append(line)
+                continue
+            for sentence in _SENTENCE_RE.split(line):
+                for start in range(0, len(sentence), size):
+                    if sentence[start:start + size].strip():
+                        pieces.append(sentence[start:start + size].strip())
+
+    passages, current = [], []
+    current_len = 0
+    for piece in pieces:
+        if current and current_len + len(piece) > size:
+            passages.append("\n".join(current))
+            current, current_len = [], 0
+        current.append(piece)
+        current_len += len(piece) + 1
+    if current:
+        if passages and current_len < MIN_PASSAGE_CHARS:
+            passages[-1] += "\n" + "\n".join(current)
+        else:
+            passages.append("\n".join(current))
+    return passages
+
+
+def default_index_path(output_dir):
+    return Path(output_dir) / INDEX_FILE
+
+
+class PassageIndex:
+    """SQLite 上的段落倒排索引。
+
+    passages 存段落原文與斷詞後長度；postings 以 (詞, 段落) 為主鍵存詞頻，
+    查詢時依詞直接範圍掃描；pages 存逐頁文字雜湊，供增量重建判斷。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path))
+        # WAL：建立索引時查詢仍可讀取；NORMAL 同步在 WAL 下仍保證一致性，只是斷電可能遺失最後一批
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA cache_size = -65536;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS pages (page INTEGER PRIMARY KEY, chars INTEGER, hash TEXT);
+            CREATE TABLE IF NOT EXISTS passages (
+                id INTEGER PRIMARY KEY, page INTEGER, ord INTEGER, length INTEGER, text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS passages_page ON passages (page);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, passage INTEGER, tf INTEGER, PRIMARY KEY (term, passage)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._pending = []  # 尚未寫入的 postings，提交前排序後批次寫入
+        version = self.get_meta("version")
+        if version is not None and version != INDEX_VERSION:
+            raise ValueError(f"索引版本不符（{version}），請刪除 {self.path} 後重建")
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        """寫入累積的 postings 並提交；依主鍵 (詞, 段落) 排序後批次寫入，B-tree 插入較集中"""
+        if self._pending:
+            self._pending.sort()
+            self.conn.executemany(
+                "INSERT INTO postings (term, passage, tf) VALUES (?, ?, ?)", self._pending
+            )
+            self._pending = []
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value, ensure_ascii=False)),
+        )
+
+    def page_hashes(self):
+        return dict(self.conn.execute("SELECT page, hash FROM pages"))
+
+    def _drop_page(self, page):
+        """刪除某頁的段落與其 postings（以舊段落重新斷詞取得主鍵，不需額外的反向索引）"""
+        self.commit()
+        rows = self.conn.execute("SELECT id, text FROM passages WHERE page = ?", (page,)).fetchall()
+        for passage_id, text in rows:
+            self.conn.executemany(
+                "DELETE FROM postings WHERE term = ? AND passage = ?",
+                ((term, passage_id) for term in set(tokenize(text))),
+            )
+        self.conn.execute("DELETE FROM passages WHERE page = ?", (page,))
+        self.conn.execute("DELETE FROM pages WHERE page = ?", (page,))
+
+    def add_page(self, page, text, digest, replace=False):
+        """寫入一頁（0 起算）的段落；replace 時先移除該頁舊資料。回傳段落數"""
+        if replace:
+            self._drop_page(page)
+        count = 0
+        for ord_, passage in enumerate(split_passages(text)):
+            terms = Counter(tokenize(passage))
+            if not terms:
+                continue
+            cursor = self.conn.execute(
+                "INSERT INTO passages (page, ord, length, text) VALUES (?, ?, ?, ?)",
+                (page, ord_, sum(terms.values()), passage),
+            )
+            passage_id = cursor.lastrowid
+            self._pending.extend((term, passage_id, tf) for term, tf in terms.items())
+            count += 1
+        self.conn.execute(
+            "INSERT INTO pages (page, chars, hash) VALUES (?, ?, ?)", (page, len(text), digest)
+        )
+        return count
+
+    def stats(self):
+        passages, avg_length = self.conn.execute(
+            "SELECT COUNT(*), AVG(length) FROM passages"
+        ).fetchone()
+        pages = self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {"pages": pages, "passages": passages, "avg_length": avg_length or 0.0}
+
+    def search(self, query, k=DEFAULT_TOP_K, pages=None):
+        """BM25 查詢，回傳 [(分數, 段落 id, 頁 0 起算)]，依分數由高至低。
+        pages 為允許的頁索引集合（None 為全書）。"""
+        terms = set(tokenize(query))
+        stats = self.stats()
+        total, avg_length = stats["passages"], stats["avg_length"] or 1.0
+        scores = defaultdict(float)
+        page_of = {}
+        for term in terms:
+            rows = self.conn.execute(
+                "SELECT p.passage, p.tf, s.length, s.page FROM postings p "
+                "JOIN passages s ON s.id = p.passage WHERE p.term = ?",
+                (term,),
+            ).fetchall()
+            if not rows:
+                continue
+            df = len(rows)
+            idf = max(0.0, math.log(1 + (total - df + 0.5) / (df + 0.5)))
+            for passage_id, tf, length, page in rows:
+                if pages is not None and page not in pages:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[passage_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                page_of[passage_id] = page
+        top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(score, passage_id, page_of[passage_id]) for passage_id, score in top]
+
+    def passage_text(self, passage_id):
+        row = self.conn.execute("SELECT text FROM passages WHERE id = ?", (passage_id,)).fetchone()
+        return row[0] if row else ""
+
+
+def _chunk_pages(output_dir):
+    """自分塊進度紀錄取出來源檔與已提取（分塊檔仍存在）的頁碼範圍；沒有紀錄時回傳 (None, None)"""
+    manifest = extract_text.load_manifest(output_dir)
+    if not manifest or not manifest.get("input"):
+        return None, None
+    ranges = [
+        entry["pages"] for name, entry in sorted(manifest.get("chunks", {}).items())
+        if (Path(output_dir) / name).is_file()
+    ]
+    return Path(manifest["input"]), ",".join(ranges)
+
+
+def build_index(book_path, index_path, pages=None):
+    """逐頁串流建立 / 更新索引，回傳統計"""
+    page_source, meta = extract_text.open_page_source(book_path, pages=pages, plain=True)
+    indexed = unchanged = passages = 0
+    with PassageIndex(index_path) as index:
+        known = index.page_hashes()
+        for page, text in page_source:
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            if known.get(page) == digest:
+                unchanged += 1
+                continue
+            passages += index.add_page(page, text, digest, replace=page in known)
+            indexed += 1
+            if indexed % COMMIT_EVERY == 0:
+                index.commit()
+        # 來源變短（如改用另一版本）時移除超出範圍的頁面
+        for page in [p for p in known if p >= meta["page_count"]]:
+            index._drop_page(page)
+        index.set_meta("version", INDEX_VERSION)
+        index.set_meta("book", str(book_path))
+        index.set_meta("unit", meta["unit"])
+        index.set_meta("page_count", meta["page_count"])
+        index.set_meta("toc", meta.get("toc") or [])
+        index.commit()
+        stats = index.stats()
+    return {
+        "pages_indexed": indexed,
+        "pages_unchanged": unchanged,
+        "passages_added": passages,
+        "total_pages": stats["pages"],
+        "total_passages": stats["passages"],
+        "text_source": meta["source"],
+        "unit": meta["unit"],
+    }
+
+
+def search_index(index_path, query, k=DEFAULT_TOP_K, pages=None):
+    with PassageIndex(index_path) as index:
+        allowed = set(extract_text.parse_page_range(pages)) if pages else None
+        hits = index.search(query, k, allowed)
+        chapter_of = extract_text.toc_lookup(index.get_meta("toc", []))
+        paged = index.get_meta("unit", "page") == "page"
+        results = []
+        for rank, (score, passage_id, page) in enumerate(hits, 1):
+            entry = {"rank": rank, "score": round(score, 3), "page": page + 1}
+            chapter = chapter_of(page + 1)
+            if chapter:
+                entry["chapter"] = chapter
+            if not paged:
+                entry["unit"] = index.get_meta("unit")
+            entry["text"] = index.passage_text(passage_id)
+            results.append(entry)
+        stats = index.stats()
+    return {"results": results, "passages": stats["passages"], "terms": len(set(tokenize(query)))}
+
+
+def _fail(message):
+    print(json.dumps({"success": False, "error": message}, ensure_ascii=False), file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRISP 閱讀解構師：段落檢索索引（BM25）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="建立 / 增量更新索引")
+    build.add_argument("source", help="分塊輸出目錄（讀取其進度紀錄），或書籍檔案 / .crispbook 封裝檔")
+    build.add_argument("--output-dir", help="索引所在目錄（source 為書籍檔案時必填）")
+    build.add_argument("--pages", help="只索引指定頁碼範圍，如 1-50（預設：分塊已提取的頁面或全書）")
+
+    search = sub.add_parser("search", help="查詢索引，回傳前 k 個段落")
+    search.add_argument("index", help="索引檔，或含索引檔的分塊輸出目錄")
+    search.add_argument("query", help="查詢字串（中英文皆可）")
+    search.add_argument("-k", "--top-k", type=int, default=DEFAULT_TOP_K, help=f"回傳段落數（預設 {DEFAULT_TOP_K}）")
+    search.add_argument("--pages", help="只在指定頁碼範圍內查詢，如 30-80")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    if args.command == "build":
+        source = Path(args.source)
+        if source.is_dir():
+            book_path, chunk_pages = _chunk_pages(source)
+            if book_path is None:
+                _fail(f"{source} 沒有分塊進度紀錄，請改為指定書籍檔案並加上 --output-dir")
+            output_dir, pages = Path(args.output_dir or source), args.pages or chunk_pages
+            if not pages:
+                _fail(f"{source} 尚無已提取的分塊")
+        else:
+            if not args.output_dir:
+                _fail("指定書籍檔案時需要 --output-dir")
+            book_path, output_dir, pages = source, Path(args.output_dir), args.pages
+        if not book_path.is_file():
+            _fail(f"找不到：{book_path}")
+        output_dir.mkdir(parents=True, exist_ok=True)
+        index_path = default_index_path(output_dir)
+        try:
+            result = build_index(book_path, index_path, pages)
+        except Exception as e:
+            _fail(f"{type(e).__name__}: {e}")
+        result = {"success": True, "book": str(book_path), "index": str(index_path), **result}
+    else:
+        index_path = Path(args.index)
+        if index_path.is_dir():
+            index_path = default_index_path(index_path)
+        if not index_path.is_file():
+            _fail(f"找不到索引：{index_path}（請先執行 build）")
+        try:
+            found = search_index(index_path, args.query, max(1, args.top_k), args.pages)
+        except Exception as e:
+            _fail(f"{type(e).__name__}: {e}")
+        result = {"success": True, "query": args.query, **found}
+
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
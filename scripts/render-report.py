@@ -7,22 +7,79 @@
   python render-report.py analysis.json                     # 輸出到同目錄
   python render-report.py analysis.json -o report.html      # 指定輸出路徑
   echo '{"book_title": "..."}' | python render-report.py -  # 從 stdin 讀取
+  python render-report.py --batch analyses/ -O reports/     # 批次：目錄下所有 JSON
+  python render-report.py --batch "analyses/*.json" -j 4    # 批次：glob，4 個行程平行
+  cat analyses.ndjson | python render-report.py --batch -   # 批次：stdin 每行一份 JSON
+  python render-report.py --batch analyses/ -O site/ --assets shared --minify --precompress gz,br
+                                                            # 書庫：共用 CSS/JS、壓縮 HTML、預先壓縮檔
+  python render-report.py analysis.json --timings           # 附上各階段耗時與峰值記憶體
+  python render-report.py --batch analyses/ --trace t.json  # 另寫出 Chrome trace
+  python render-report.py analysis.json --no-svg-optimize  # 概念關係圖 SVG 原樣填入
+  python render-report.py --serve --data-dir analyses/      # 常駐服務：http://127.0.0.1:8765/report/<slug>
+
+批次模式只載入模板一次，並在輸出目錄記錄 .render-state.json：
+輸入 JSON 與模板雜湊皆未變的報告會略過（--force 強制重建）。
+
+--assets shared 時 CSS / JS 抽成 assets/crisp-report.<內容雜湊>.css / .js，各報告只引用；
+預設 inline 仍輸出可單獨分享的單一 HTML 檔。
+
+概念關係圖 SVG 填入前解析並驗證、座標取 --svg-precision 位小數、重複樣式抽成 class；
+最佳化前後的位元組數記於輸出 JSON 的 svg，驗證問題記於 warnings.svg。
+
+--serve 為只聽本機的常駐服務，模板常駐並在變更時重新載入，結果快取並支援 ETag / 304（見 RenderService）。
 
 JSON 結構見底部的 SCHEMA 說明。
 """
 
 import argparse
+import glob
+import gzip
+import hashlib
 import html
+import importlib.util
 import json
+import os
 import re
 import sys
+import threading
+import time
 from datetime import date
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:  # 選用：未安裝時 --precompress br 略過並回報
+    brotli = None
+
 
 TEMPLATE_PATH = Path(__file__).resolve().parent.parent / "assets" / "reading-report-template.html"
 
 
+# ── 效能量測（--timings） ───────────────────────────────
+# 與 extract-text.py 相同：各階段以 TIMINGS.stage(名稱) 包住（實作見 timings.py）。
+# 階段：read:input、load_template、render:values（含 render:svg）、render:fill、write:report；
+# 批次另有 scan:inputs 與 write:state，worker 行程的量測隨結果併回主行程。
+
+
+_timings_spec = importlib.util.spec_from_file_location(
+    "timings", Path(__file__).resolve().parent / "timings.py"
+)
+timings = importlib.util.module_from_spec(_timings_spec)
+_timings_spec.loader.exec_module(timings)
+
+
+class Timings(timings.Timings):
+    """渲染的逐階段量測；stage() 產生的 dict 可由呼叫端填入 bytes"""
+
+    counters = ("bytes",)
+
+    def totals(self, stages):
+        return {"reports": stages.get("render:fill", {}).get("count", 0)}
+
+
+TIMINGS = Timings()
+
+
 def escape(text):
     """HTML 轉義"""
     if not text:
@@ -233,7 +290,7 @@ def render_critical(critical):
             content = "".join(
                 f"<p>{escape(line)}</p>" for line in content.split("\n") if line.strip()
             )
-        parts.append(f"<h3>{title}</h3>\n{content}")
+        parts.append(f"<h3>{title}</h3>\n{content}" if title else content)  # 合併自純文字的段落無標題
     return "\n".join(parts)
 
 
@@ -307,56 +364,1264 @@ def render_meta_knowledge(items):
     )
 
 
-def render_svg(svg_data):
-    """概念關係圖 SVG — 直接傳入或空字串"""
+# ── 概念關係圖 SVG 最佳化與驗證 ───────────────────────────
+# 產生的 SVG 常帶多餘屬性、過長的小數、重複的行內樣式，偶有壞掉的標記讓瀏覽器進入錯誤修復。
+# 填入前解析一次並驗證：座標四捨五入到 SVG_PRECISION 位、去除 metadata 與編輯器屬性、
+# 重複出現的樣式組合抽成 class（符合設計規範色板者以色系命名，見 references/design-spec.md），
+# 並回報最佳化前後的位元組數。結果依 SVG 雜湊快取；無法解析時原樣填入並回報原因。
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+SVG_PRECISION = 2
+SVG_OPTIMIZER_VERSION = 1
+SVG_CACHE_SIZE = 256
+SVG_CLASS_PREFIX = "rel"
+
+# 設計規範固定色板：色系 → (背景, 文字, 邊框)
+SVG_PALETTE = {
+    "core": ("#1e293b", "#f8fafc", "#334155"),
+    "red": ("#7f1d1d", "#fecaca", "#991b1b"),
+    "green": ("#14532d", "#bbf7d0", "#166534"),
+    "blue": ("#1e3a5f", "#bfdbfe", "#1e40af"),
+    "purple": ("#4a1d6e", "#e9d5ff", "#6b21a8"),
+    "brown": ("#713f12", "#fde68a", "#92400e"),
+    "gray": ("#374151", "#e5e7eb", "#4b5563"),
+}
+SVG_LINE_COLOR = "#64748b"
+SVG_NOTE_COLOR = "#94a3b8"
+_SVG_NODE_BG = {bg: name for name, (bg, _, _) in SVG_PALETTE.items()}
+_SVG_NODE_TEXT = {text: name for name, (_, text, _) in SVG_PALETTE.items()}
+_SVG_PALETTE_COLORS = {c for colors in SVG_PALETTE.values() for c in colors} | {
+    SVG_LINE_COLOR, SVG_NOTE_COLOR,
+}
+
+# 可抽成 class 的呈現屬性（CSS 屬性與 SVG 呈現屬性同名）
+_SVG_PRESENTATION = (
+    "fill", "fill-opacity", "fill-rule", "stroke", "stroke-width", "stroke-opacity",
+    "stroke-dasharray", "stroke-linecap", "stroke-linejoin", "opacity",
+    "font-family", "font-size", "font-weight", "font-style", "text-anchor", "dominant-baseline",
+    "stop-color",
+)
+# 繼承屬性的預設值：祖先未設定時才可省略
+_SVG_INHERITED_DEFAULTS = {
+    "fill-opacity": "1", "fill-rule": "nonzero", "stroke": "none", "stroke-width": "1",
+    "stroke-opacity": "1", "stroke-linecap": "butt", "stroke-linejoin": "miter",
+    "font-style": "normal", "font-weight": "normal", "text-anchor": "start",
+}
+_SVG_ZERO_DEFAULTS = {"x", "y", "cx", "cy", "x1", "y1", "x2", "y2", "dx", "dy"}
+# 這些元素的 x / y / dx / dy 是絕對位置或位移（如多行標籤 <tspan x="0" dy="1.2em">），0 不是預設值
+_SVG_POSITIONED_ELEMENTS = {"text", "tspan", "textPath", "use"}
+_SVG_NUMERIC_ATTRS = _SVG_ZERO_DEFAULTS | {
+    "r", "rx", "ry", "width", "height", "d", "points", "transform", "viewBox",
+    "stroke-width", "font-size", "refX", "refY", "markerWidth", "markerHeight",
+}
+_SVG_COLOR_PROPS = ("fill", "stroke", "stop-color")
+_SVG_TEXT_ELEMENTS = {"text", "tspan", "textPath", "title", "desc", "style"}
+# 這些容器內的元素經由引用才顯示，不抽 class
+_SVG_REFERENCED_CONTAINERS = {"defs", "marker", "symbol", "pattern", "clipPath", "mask"}
+_SVG_NUMBER_RE = re.compile(r"-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?")
+_SVG_ID_REF_RE = re.compile(r"url\(\s*['\"]?#([^)'\"\s]+)|^#(.+)$")
+
+_svg_cache = {}
+_svg_cache_lock = threading.Lock()
+_svg_etree = None
+
+
+def _load_svg_etree():
+    """延後載入 ElementTree（沒有 SVG 的報告不需要），並註冊 SVG 命名空間前綴"""
+    global _svg_etree
+    if _svg_etree is None:
+        import xml.etree.ElementTree as ET
+
+        ET.register_namespace("", SVG_NS)
+        ET.register_namespace("xlink", XLINK_NS)
+        _svg_etree = ET
+    return _svg_etree
+
+
+def _svg_local(name):
+    return name.rsplit("}", 1)[-1]
+
+
+def _svg_namespace(name):
+    return name[1:].split("}", 1)[0] if name.startswith("{") else ""
+
+
+def _round_numbers(value, precision):
+    """將數值字串中的小數四捨五入；整數不動，避免相鄰數字黏在一起（如 1.0001.5 → 1 .5）"""
+
+    def replace(match):
+        text = match.group(0)
+        if "." not in text and "e" not in text.lower():
+            return text
+        rounded = f"{round(float(text), precision):.{precision}f}"
+        if "." in rounded:
+            rounded = rounded.rstrip("0").rstrip(".")
+        if rounded == "-0":
+            rounded = "0"
+        if "." not in rounded and match.string[match.end():match.end() + 1] == ".":
+            rounded += " "
+        return rounded
+
+    return _SVG_NUMBER_RE.sub(replace, value)
+
+
+def _normalize_color(value):
+    """#ABC / #AABBCC → #aabbcc，其他值轉小寫後原樣回傳"""
+    value = value.strip().lower()
+    if re.fullmatch(r"#[0-9a-f]{3}", value):
+        return "#" + "".join(c * 2 for c in value[1:])
+    return value
+
+
+def _short_color(value):
+    if re.fullmatch(r"#([0-9a-f])\1([0-9a-f])\2([0-9a-f])\3", value):
+        return "#" + value[1::2]
+    return value
+
+
+def _svg_css_value(key, value):
+    """呈現屬性 → CSS 宣告：顏色取短格式；CSS 中的長度需單位，無單位的字號與線寬補 px"""
+    if key in _SVG_COLOR_PROPS:
+        value = _short_color(value)
+    elif key in ("font-size", "stroke-width") and _SVG_NUMBER_RE.fullmatch(value):
+        value += "px"
+    return f"{key}:{value}"
+
+
+def _parse_style(style):
+    props = {}
+    for decl in style.split(";"):
+        key, sep, value = decl.partition(":")
+        if sep and key.strip() and value.strip():
+            props[key.strip().lower()] = value.strip()
+    return props
+
+
+def _svg_class_name(props, taken):
+    """依色板為樣式組合命名：節點背景 / 節點文字 / 連接線 / 標註，其餘以流水號命名"""
+    fill, stroke = props.get("fill"), props.get("stroke")
+    if fill in _SVG_NODE_BG:
+        base = f"{SVG_CLASS_PREFIX}-node-{_SVG_NODE_BG[fill]}"
+    elif fill in _SVG_NODE_TEXT:
+        base = f"{SVG_CLASS_PREFIX}-text-{_SVG_NODE_TEXT[fill]}"
+    elif SVG_LINE_COLOR in (fill, stroke):
+        base = f"{SVG_CLASS_PREFIX}-line"
+    elif fill == SVG_NOTE_COLOR:
+        base = f"{SVG_CLASS_PREFIX}-note"
+    else:
+        base = f"{SVG_CLASS_PREFIX}-s{len(taken) + 1}"
+    name, n = base, 2
+    while name in taken:
+        name, n = f"{base}-{n}", n + 1
+    return name
+
+
+def optimize_svg(svg_text, precision=SVG_PRECISION):
+    """解析並最佳化 SVG，回傳 (SVG 文字, 報告)。
+    報告含 bytes_before / bytes_after、抽出的 class 數與 issues（驗證發現的問題）；
+    無法解析或根元素不是 <svg> 時回傳原文，報告附 fallback 原因。
+    """
+    ET = _load_svg_etree()
+    report = {"bytes_before": len(svg_text.encode("utf-8"))}
+
+    def fallback(reason):
+        report.update(bytes_after=report["bytes_before"], fallback=reason)
+        return svg_text, report
+
+    if re.search(r"<!(?:DOCTYPE|ENTITY)", svg_text, re.IGNORECASE):
+        return fallback("含 DOCTYPE / ENTITY 宣告，未處理")
+    try:
+        root = ET.fromstring(svg_text.strip())
+    except ET.ParseError as e:
+        return fallback(f"SVG 解析失敗：{e}")
+    if _svg_local(root.tag) != "svg" or _svg_namespace(root.tag) not in ("", SVG_NS):
+        return fallback(f"根元素不是 <svg>：<{_svg_local(root.tag)}>")
+
+    issues = []
+    off_palette = set()
+    has_style = any(_svg_local(el.tag) == "style" for el in root.iter())
+    referenced = set()
+    for el in root.iter():
+        for value in el.attrib.values():
+            for m in _SVG_ID_REF_RE.finditer(value.strip()):
+                referenced.add(m.group(1) or m.group(2))
+
+    # 第一輪：清除 metadata / 編輯器內容、四捨五入、收集樣式
+    styled = []
+
+    def visit(el, inherited, referenced_only):
+        for child in list(el):
+            if not isinstance(child.tag, str):  # 註解與處理指令
+                el.remove(child)
+                continue
+            ns = _svg_namespace(child.tag)
+            if _svg_local(child.tag) == "metadata" or ns not in ("", SVG_NS):
+                el.remove(child)
+        name = _svg_local(el.tag)
+        props = {}
+        for key in list(el.attrib):
+            ns = _svg_namespace(key)
+            if ns and ns not in (XLINK_NS, XML_NS):
+                del el.attrib[key]
+                continue
+            value = el.attrib[key]
+            if key in _SVG_NUMERIC_ATTRS:
+                value = el.attrib[key] = _round_numbers(value, precision)
+            if key == "id" and value not in referenced and not has_style:
+                del el.attrib[key]
+            elif key in ("version", "baseProfile") and el is root:
+                del el.attrib[key]
+            elif (
+                key in _SVG_ZERO_DEFAULTS and value.strip() in ("0", "-0")
+                and name not in _SVG_POSITIONED_ELEMENTS
+            ):
+                del el.attrib[key]
+            elif key in _SVG_PRESENTATION:
+                props[key] = el.attrib.pop(key)
+        if "style" in el.attrib:
+            declarations = _parse_style(el.attrib.pop("style"))
+            rest = []
+            for key, value in declarations.items():
+                if key in _SVG_PRESENTATION:
+                    props[key] = value
+                else:
+                    rest.append(f"{key}:{value}")
+            if rest:
+                el.set("style", ";".join(rest))
+        for key in list(props):
+            value = props[key]
+            if key in _SVG_COLOR_PROPS:
+                value = _normalize_color(value)
+                if value.startswith("#") and value not in _SVG_PALETTE_COLORS:
+                    off_palette.add(value)
+            elif key in ("stroke-width", "font-size", "opacity", "fill-opacity", "stroke-opacity"):
+                value = _round_numbers(value, precision)
+            if (key == "opacity" and value == "1") or (
+                not has_style and key not in inherited and _SVG_INHERITED_DEFAULTS.get(key) == value
+            ):
+                del props[key]
+            else:
+                props[key] = value
+        if name not in _SVG_TEXT_ELEMENTS:
+            if el.text is not None and not el.text.strip():
+                el.text = None
+            for child in el:
+                if child.tail is not None and not child.tail.strip():
+                    child.tail = None
+        referenced_only = referenced_only or name in _SVG_REFERENCED_CONTAINERS
+        if props:
+            styled.append((el, props, referenced_only))
+        child_inherited = inherited | set(props)
+        for child in el:
+            visit(child, child_inherited, referenced_only)
+
+    visit(root, frozenset(), False)
+
+    if "viewBox" not in root.attrib:
+        issues.append("缺少 viewBox，無法隨容器縮放")
+    if off_palette:
+        issues.append(f"使用設計規範色板以外的顏色：{', '.join(sorted(off_palette))}")
+
+    # 第二輪：重複兩次以上的樣式組合抽成 class，其餘寫回屬性
+    counts = {}
+    for el, props, referenced_only in styled:
+        if not referenced_only and not has_style:
+            signature = tuple(sorted(props.items()))
+            counts[signature] = counts.get(signature, 0) + 1
+    classes = {}
+    for el, props, referenced_only in styled:
+        signature = tuple(sorted(props.items()))
+        if counts.get(signature, 0) >= 2:
+            if signature not in classes:
+                classes[signature] = _svg_class_name(props, set(classes.values()))
+            existing = el.get("class")
+            el.set("class", f"{existing} {classes[signature]}" if existing else classes[signature])
+        else:
+            for key, value in props.items():
+                el.set(key, _short_color(value) if key in _SVG_COLOR_PROPS else value)
+    if classes:
+        rules = "".join(
+            f".{name}{{" + ";".join(_svg_css_value(k, v) for k, v in signature) + "}"
+            for signature, name in classes.items()
+        )
+        style = ET.Element(f"{{{SVG_NS}}}style" if _svg_namespace(root.tag) else "style")
+        style.text = rules
+        root.insert(0, style)
+
+    optimized = ET.tostring(root, encoding="unicode").replace(" />", "/>")
+    report["bytes_after"] = len(optimized.encode("utf-8"))
+    if report["bytes_after"] >= report["bytes_before"]:
+        # 已精簡的 SVG 經序列化（補上命名空間等）可能反而變大：保留原文，驗證結果照常回報
+        optimized = svg_text
+        report["bytes_after"] = report["bytes_before"]
+        report["kept_original"] = True
+    elif classes:
+        report["classes"] = len(classes)
+    if issues:
+        report["issues"] = issues
+    return optimized, report
+
+
+def render_svg(svg_data, precision=SVG_PRECISION, report=None):
+    """概念關係圖 SVG — 最佳化後填入，或空字串。
+    precision 為 None 時原樣填入；report 為 dict 時寫入最佳化報告（見 optimize_svg）。
+    """
     if not svg_data:
         return ""
-    return svg_data
-
-
-def render(data, template_text):
-    """將分析 JSON 填入模板"""
-    replacements = {
-        "{{BOOK_TITLE}}": escape(data.get("book_title", "未知書名")),
-        "{{BOOK_AUTHOR}}": render_author(data),
-        "{{ONE_LINE_REVIEW}}": escape(data.get("one_line_review", "")),
-        "{{BOOK_TYPE_TAG}}": escape(data.get("book_type_tag", "閱讀報告")),
-        "{{BOOK_INTRODUCTION}}": render_introduction(data.get("book_introduction", "")),
-        "{{TIPS_SCORES_HTML}}": render_tips_scores(data.get("tips_scores")),
-        "{{CORE_ARGUMENTS_HTML}}": render_arguments(data.get("core_arguments", [])),
-        "{{KEY_CONCEPTS_HTML}}": render_concepts(data.get("key_concepts", [])),
-        "{{QUOTES_HTML}}": render_quotes(data.get("quotes", [])),
-        "{{ACTION_CARDS_HTML}}": render_actions(data.get("actions", [])),
-        "{{CONCEPT_RELATIONS_SVG}}": render_svg(data.get("concept_relations_svg", "")),
-        "{{CRITICAL_PERSPECTIVES_HTML}}": render_critical(data.get("critical_perspectives")),
-        "{{ZETTELKASTEN_HTML}}": render_zettelkasten(data.get("zettelkasten", [])),
-        "{{META_KNOWLEDGE_HTML}}": render_meta_knowledge(data.get("meta_knowledge", [])),
-        "{{FURTHER_READING_HTML}}": render_further_reading(data.get("further_reading", [])),
-        "{{GENERATION_DATE}}": data.get("generation_date", date.today().isoformat()),
+    if precision is None:
+        return svg_data
+    key = _hash_bytes(f"{SVG_OPTIMIZER_VERSION}:{precision}:{svg_data}".encode("utf-8"))
+    cached = _svg_cache.get(key)
+    if cached is None:
+        with TIMINGS.stage("render:svg") as counters:
+            cached = optimize_svg(svg_data, precision)
+            counters["bytes"] = cached[1]["bytes_after"]
+        with _svg_cache_lock:  # --serve 時多執行緒共用
+            if len(_svg_cache) >= SVG_CACHE_SIZE:
+                _svg_cache.pop(next(iter(_svg_cache)))
+            _svg_cache[key] = cached
+    elif report is not None:
+        report["cached"] = True
+    svg_text, svg_report = cached
+    if report is not None:
+        report.update(svg_report)
+    return svg_text
+
+
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
+
+
+class CompiledTemplate:
+    """預先編譯的模板：字面片段與插槽交錯（literals 比 slots 多一個）。
+    渲染時單次 join 組裝，不會再解析填入內容中的 {{...}}，結果與填入順序無關。
+    可重複用於多次渲染；to_dict / from_dict 為可序列化形式（JSON），供跨行程或磁碟快取。
+    """
+
+    def __init__(self, literals, slots, template_hash):
+        self.literals = literals
+        self.slots = slots
+        self.hash = template_hash
+
+    @classmethod
+    def compile(cls, template_text):
+        parts = _PLACEHOLDER_RE.split(template_text)
+        template_hash = hashlib.sha256(template_text.encode("utf-8")).hexdigest()
+        return cls(parts[0::2], parts[1::2], template_hash)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["literals"], data["slots"], data["hash"])
+
+    def to_dict(self):
+        return {"literals": self.literals, "slots": self.slots, "hash": self.hash}
+
+    @property
+    def placeholders(self):
+        return set(self.slots)
+
+    def fill(self, values):
+        """填入 {名稱: HTML}；沒有值的插槽保留原樣 {{名稱}}"""
+        out = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            value = values.get(slot)
+            out.append(f"{{{{{slot}}}}}" if value is None else value)
+            out.append(literal)
+        return "".join(out)
+
+
+_compiled_templates = {}
+
+
+def compile_template(template_text):
+    """編譯模板（同一份模板文字只編譯一次）"""
+    compiled = _compiled_templates.get(template_text)
+    if compiled is None:
+        compiled = _compiled_templates[template_text] = CompiledTemplate.compile(template_text)
+    return compiled
+
+
+def load_template(template_path=TEMPLATE_PATH):
+    """讀取並編譯模板檔"""
+    with TIMINGS.stage("load_template"):
+        return compile_template(Path(template_path).read_text(encoding="utf-8"))
+
+
+def render_values(data, svg_precision=SVG_PRECISION, svg_report=None):
+    """分析 JSON → {插槽名稱: HTML}；svg_precision / svg_report 見 render_svg"""
+    return {
+        "BOOK_TITLE": escape(data.get("book_title", "未知書名")),
+        "BOOK_AUTHOR": render_author(data),
+        "ONE_LINE_REVIEW": escape(data.get("one_line_review", "")),
+        "BOOK_TYPE_TAG": escape(data.get("book_type_tag", "閱讀報告")),
+        "BOOK_INTRODUCTION": render_introduction(data.get("book_introduction", "")),
+        "TIPS_SCORES_HTML": render_tips_scores(data.get("tips_scores")),
+        "CORE_ARGUMENTS_HTML": render_arguments(data.get("core_arguments", [])),
+        "KEY_CONCEPTS_HTML": render_concepts(data.get("key_concepts", [])),
+        "QUOTES_HTML": render_quotes(data.get("quotes", [])),
+        "ACTION_CARDS_HTML": render_actions(data.get("actions", [])),
+        "CONCEPT_RELATIONS_SVG": render_svg(
+            data.get("concept_relations_svg", ""), svg_precision, svg_report
+        ),
+        "CRITICAL_PERSPECTIVES_HTML": render_critical(data.get("critical_perspectives")),
+        "ZETTELKASTEN_HTML": render_zettelkasten(data.get("zettelkasten", [])),
+        "META_KNOWLEDGE_HTML": render_meta_knowledge(data.get("meta_knowledge", [])),
+        "FURTHER_READING_HTML": render_further_reading(data.get("further_reading", [])),
+        "GENERATION_DATE": data.get("generation_date", date.today().isoformat()),
+    }
+
+
+def render_with_warnings(data, template, svg_precision=SVG_PRECISION, svg_report=None):
+    """渲染並回報插槽問題：(html, warnings)。
+    template 可為模板文字或 CompiledTemplate。
+    warnings 含 unknown_placeholders（模板中無對應資料，原樣保留）
+    與 unused_fields（有資料但模板中沒有插槽）；概念關係圖未通過驗證時另有 svg。
+    svg_report 為 dict 時寫入 SVG 最佳化報告。
+    """
+    if not isinstance(template, CompiledTemplate):
+        template = compile_template(template)
+    svg_report = {} if svg_report is None else svg_report
+    with TIMINGS.stage("render:values"):
+        values = render_values(data, svg_precision, svg_report)
+    warnings = {}
+    svg_problems = svg_report.get("issues", []) + (
+        [svg_report["fallback"]] if "fallback" in svg_report else []
+    )
+    if svg_problems:
+        warnings["svg"] = svg_problems
+    unknown = sorted(template.placeholders - values.keys())
+    if unknown:
+        warnings["unknown_placeholders"] = unknown
+    unused = sorted(values.keys() - template.placeholders)
+    if unused:
+        warnings["unused_fields"] = unused
+    with TIMINGS.stage("render:fill"):
+        return template.fill(values), warnings
+
+
+def render(data, template):
+    """將分析 JSON 填入模板（template 可為模板文字或 CompiledTemplate）"""
+    return render_with_warnings(data, template)[0]
+
+
+# ── 共用資產、壓縮與預先壓縮輸出 ─────────────────────────
+# --assets shared：模板內嵌的 <style> / <script> 抽成以內容雜湊命名的共用檔
+# （crisp-report.<hash>.css / .js），各報告只留 <link> / <script src>；內容不變則檔名不變，
+# 可設長效快取。--minify 壓縮 HTML（去除縮排與註解，<pre> / <textarea> / <script> / <style>
+# 內容不動）與 CSS / JS。--precompress gz,br 另寫出 .gz / .br 供靜態伺服器直接送出。
+
+ASSET_MODES = ("inline", "shared")
+ASSET_PREFIX = "crisp-report"
+PRECOMPRESS_FORMATS = ("gz", "br")
+
+_INLINE_BLOCK_RE = re.compile(r"<(style|script)>\s*(.*?)\s*</\1>", re.DOTALL)
+_PRESERVE_RE = re.compile(r"(<(pre|textarea|script|style)\b.*?</\2>)", re.DOTALL | re.IGNORECASE)
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+_JS_LINE_COMMENT_RE = re.compile(r"^\s*(?://.*|/\*.*?\*/)\s*$", re.MULTILINE)
+
+
+def minify_css(css):
+    """去除註解與多餘空白（選擇器內的空白語意不變，冒號前後不動）"""
+    css = _CSS_COMMENT_RE.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    return _CSS_PUNCT_RE.sub(r"\1", css).replace(";}", "}").strip()
+
+
+def minify_js(js):
+    """保守壓縮：只去除整行註解、縮排與空行（不解析字串，不改動程式碼本身）"""
+    js = _JS_LINE_COMMENT_RE.sub("", js)
+    return "\n".join(line.strip() for line in js.splitlines() if line.strip())
+
+
+def minify_html(text):
+    """去除 HTML 註解與行首縮排、空行；保留一個換行，行內元素間的空白語意不變"""
+    parts = _PRESERVE_RE.split(text)
+    out = []
+    # split 的結果依序為：一般片段、保留區塊、標籤名稱、一般片段…
+    for i in range(0, len(parts), 3):
+        chunk = _HTML_COMMENT_RE.sub("", parts[i])
+        out.append(re.sub(r"\s*\n\s*", "\n", chunk))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return "".join(out).strip() + "\n"
+
+
+def _minify_block(kind, content):
+    return minify_css(content) if kind == "style" else minify_js(content)
+
+
+def prepare_template(template_text, assets="inline", minify=False, asset_url="assets"):
+    """依輸出模式改寫模板，回傳 (CompiledTemplate, {共用資產檔名: 內容})。
+    shared 時抽出 <style> / <script> 為共用資產，以 asset_url 為前綴引用；
+    minify 時壓縮其中的 CSS / JS（HTML 本身於渲染後以 minify_html 壓縮）。
+    """
+    shared = {}
+
+    def replace(match):
+        kind, content = match.group(1), match.group(2)
+        if minify:
+            content = _minify_block(kind, content)
+        if assets != "shared":
+            return f"<{kind}>{content}</{kind}>" if minify else match.group(0)
+        ext = "css" if kind == "style" else "js"
+        name = f"{ASSET_PREFIX}.{_hash_bytes(content.encode('utf-8'))[:12]}.{ext}"
+        shared[name] = content + "\n"
+        href = f"{asset_url.rstrip('/')}/{name}" if asset_url else name
+        if kind == "style":
+            return f'<link rel="stylesheet" href="{html.escape(href)}">'
+        return f'<script src="{html.escape(href)}"></script>'
+
+    return compile_template(_INLINE_BLOCK_RE.sub(replace, template_text)), shared
+
+
+def precompress_bytes(data, fmt):
+    """gz（gzip，mtime 固定為 0，相同內容產生相同位元組）或 br（需 brotli 套件）"""
+    if fmt == "gz":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def write_output(path, text, precompress=()):
+    """寫出檔案並依 precompress 寫出 .gz / .br；回傳 {格式: 位元組數}（含 "raw"）。
+    未指定的格式若留有舊的壓縮檔則刪除，避免靜態伺服器送出過期內容。
+    """
+    data = text.encode("utf-8")
+    sizes = {}
+    with TIMINGS.stage("write:report") as counters:
+        sizes["raw"] = Path(path).write_bytes(data)
+        for fmt in PRECOMPRESS_FORMATS:
+            sibling = Path(f"{path}.{fmt}")
+            if fmt in precompress:
+                sizes[fmt] = sibling.write_bytes(precompress_bytes(data, fmt))
+            else:
+                sibling.unlink(missing_ok=True)
+        counters["bytes"] = sum(sizes.values())
+    return sizes
+
+
+def write_assets(shared, assets_dir, precompress=()):
+    """寫出共用資產（檔名含內容雜湊；已存在即略過），回傳 [{path, bytes}]"""
+    assets_dir = Path(assets_dir)
+    assets_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for name, content in shared.items():
+        path = assets_dir / name
+        if path.is_file() and all(Path(f"{path}.{fmt}").is_file() for fmt in precompress):
+            written.append({"path": str(path), "bytes": path.stat().st_size, "reused": True})
+            continue
+        written.append({"path": str(path), "bytes": write_output(path, content, precompress)["raw"]})
+    return written
+
+
+def load_output_template(
+    template_path=TEMPLATE_PATH, assets="inline", minify=False, precompress=(), asset_url="assets",
+    svg_precision=SVG_PRECISION,
+):
+    """讀取模板並依輸出模式改寫，回傳 (CompiledTemplate, 共用資產, 輸出設定雜湊)。
+    輸出設定雜湊供批次記錄比對：模板、輸出模式或 SVG 最佳化設定改變時重建報告。
+    """
+    if assets == "inline" and not minify:
+        template, shared = load_template(template_path), {}
+    else:
+        with TIMINGS.stage("load_template"):
+            text = Path(template_path).read_text(encoding="utf-8")
+            template, shared = prepare_template(text, assets, minify, asset_url)
+    options = {"svg": [SVG_OPTIMIZER_VERSION, svg_precision]}
+    if minify or precompress:
+        options.update(minify=minify, precompress=sorted(precompress))
+    output_hash = _hash_bytes(f"{template.hash}:{json.dumps(options)}".encode("utf-8"))
+    return template, shared, output_hash
+
+
+def check_precompress(formats):
+    """驗證 --precompress 格式；回傳 (可用格式, 警告或 None)"""
+    unknown = [fmt for fmt in formats if fmt not in PRECOMPRESS_FORMATS]
+    if unknown:
+        raise ValueError(f"不支援的預先壓縮格式：{', '.join(unknown)}（可用：gz、br）")
+    if "br" in formats and brotli is None:
+        return [fmt for fmt in formats if fmt != "br"], "未安裝 brotli（pip install brotli），略過 .br"
+    return list(formats), None
+
+
+BATCH_STATE_FILE = ".render-state.json"
+
+
+def _hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def iter_batch_inputs(source, stdin=None):
+    """批次輸入：目錄（其下 *.json）、glob 樣式，或 - 表示 stdin 每行一份 JSON（NDJSON）。
+    逐筆產生 (名稱, 原始位元組)，JSON 解析留給 worker。
+    """
+    if source == "-":
+        stdin = stdin or sys.stdin
+        for n, line in enumerate(stdin, 1):
+            if line.strip():
+                yield f"stdin:{n}", line.encode("utf-8")
+        return
+    path = Path(source)
+    paths = sorted(path.glob("*.json")) if path.is_dir() else sorted(map(Path, glob.glob(source)))
+    for p in paths:
+        yield str(p), p.read_bytes()
+
+
+def _batch_slug(raw):
+    """輸入 JSON 的 slug；無法解析或沒有 slug 時回傳 None（解析錯誤留待渲染時回報）"""
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    slug = data.get("slug") if isinstance(data, dict) else None
+    return str(slug) if slug else None
+
+
+def _batch_output_names(inputs):
+    """[(輸入名稱, slug)] → {輸入名稱: 報告檔名}。
+    slug 只有一份輸入使用時才採用，重複時改用輸入檔名（stdin 為行號）；
+    改用後仍重複的輸入不列入，由呼叫端回報失敗，避免互相覆寫（平行渲染時還會同時寫同一檔）。
+    """
+    counts = {}
+    for _, slug in inputs:
+        if slug:
+            counts[slug] = counts.get(slug, 0) + 1
+    chosen = {}
+    for name, slug in inputs:
+        if slug and counts[slug] == 1:
+            chosen[name] = slug
+        else:
+            chosen[name] = name[6:] if name.startswith("stdin:") else Path(name).stem
+    taken = {}
+    for base in chosen.values():
+        taken[base] = taken.get(base, 0) + 1
+    return {
+        name: f"reading-report-{base}.html" for name, base in chosen.items() if taken[base] == 1
     }
 
-    result = template_text
-    for placeholder, value in replacements.items():
-        result = result.replace(placeholder, value)
+
+_batch_template = None
+_batch_timings = False
+_batch_output = {"minify": False, "precompress": (), "svg_precision": SVG_PRECISION}
+
+
+def _init_batch_worker(template, timings=False, output=None):
+    global _batch_template, _batch_timings, _batch_output
+    if isinstance(template, dict):
+        template = CompiledTemplate.from_dict(template)
+    _batch_template = template
+    _batch_timings = timings
+    _batch_output = output or {"minify": False, "precompress": (), "svg_precision": SVG_PRECISION}
+
+
+def _render_batch_item(name, raw, output_path):
+    """批次 worker：解析 JSON → 渲染 → 寫入 output_path（檔名由主行程以 _batch_output_names 決定）。
+    啟用量測時以獨立的 Timings 量測本項，結果附 timings 與 trace_events 供主行程併入。
+    """
+    global TIMINGS
+    if not _batch_timings:
+        return _render_batch_item_untimed(name, raw, output_path)
+    outer_timings, TIMINGS = TIMINGS, Timings(enabled=True)
+    try:
+        result = _render_batch_item_untimed(name, raw, output_path)
+    finally:
+        item_timings, TIMINGS = TIMINGS, outer_timings
+    result["timings"] = item_timings.summary()
+    result["trace_events"] = item_timings.events
+    return result
+
+
+def _render_batch_item_untimed(name, raw, output_path):
+    start_time = time.perf_counter()
+    output_path = Path(output_path)
+    try:
+        with TIMINGS.stage("read:input"):
+            data = json.loads(raw)
+        svg_report = {}
+        html_output, warnings = render_with_warnings(
+            data, _batch_template, _batch_output["svg_precision"], svg_report
+        )
+        if _batch_output["minify"]:
+            with TIMINGS.stage("render:minify"):
+                html_output = minify_html(html_output)
+        sizes = write_output(output_path, html_output, _batch_output["precompress"])
+        result = {
+            "input": name,
+            "output_path": str(output_path),
+            "success": True,
+            "bytes": sizes,
+            "seconds": round(time.perf_counter() - start_time, 4),
+        }
+        if svg_report:
+            result["svg"] = _svg_sizes(svg_report)
+        if warnings:
+            result["warnings"] = warnings
+        return result
+    except Exception as e:
+        return {
+            "input": name,
+            "success": False,
+            "error": f"{type(e).__name__}: {e}",
+            "seconds": round(time.perf_counter() - start_time, 4),
+        }
+
+
+def render_batch(
+    source, output_dir, template_path=TEMPLATE_PATH, workers=1, force=False,
+    assets="inline", minify=False, precompress=(), assets_dir=None, asset_url=None,
+    svg_precision=SVG_PRECISION,
+):
+    """批次渲染：模板只讀一次，依 .render-state.json 略過未變更的報告，回傳摘要。
+    assets="shared" 時共用資產寫入 assets_dir（預設輸出目錄下的 assets/）一次，
+    各報告以 asset_url（預設為相對路徑）引用；minify / precompress 見 write_output；
+    svg_precision 見 render_svg。
+    """
+    start_time = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    assets_dir = Path(assets_dir) if assets_dir else output_dir / "assets"
+    if asset_url is None:
+        asset_url = Path(os.path.relpath(assets_dir, output_dir)).as_posix()
+    template, shared, template_hash = load_output_template(
+        template_path, assets, minify, precompress, asset_url, svg_precision
+    )
+    asset_files = write_assets(shared, assets_dir, precompress) if shared else []
+
+    state_path = output_dir / BATCH_STATE_FILE
+    try:
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    # 報告檔名取自 slug，須先看過全部輸入才能發現重複；未變更的輸入沿用狀態檔記錄的 slug
+    inputs = []
+    with TIMINGS.stage("scan:inputs"):
+        for name, raw in iter_batch_inputs(source):
+            input_hash = _hash_bytes(raw)
+            previous = state.get(name)
+            if previous and previous["input_hash"] == input_hash and "slug" in previous:
+                slug = previous["slug"]
+            else:
+                slug = _batch_slug(raw)
+            inputs.append((name, raw, input_hash, slug))
+    output_names = _batch_output_names([(name, slug) for name, _, _, slug in inputs])
+
+    jobs = []
+    skipped = []
+    conflicts = []
+    for name, raw, input_hash, slug in inputs:
+        if name not in output_names:
+            state.pop(name, None)
+            conflicts.append({
+                "input": name,
+                "success": False,
+                "error": "報告檔名與其他輸入重複（slug 重複，改用輸入檔名仍衝突），請修改 slug",
+            })
+            continue
+        output_path = str(output_dir / output_names[name])
+        previous = state.get(name)
+        if (
+            not force
+            and previous
+            and previous["input_hash"] == input_hash
+            and previous["template_hash"] == template_hash
+            and previous["output_path"] == output_path
+            and Path(output_path).is_file()
+        ):
+            skipped.append({"input": name, "output_path": output_path})
+            continue
+        jobs.append((name, raw, input_hash, slug, output_path))
+
+    output_options = {
+        "minify": minify, "precompress": tuple(precompress), "svg_precision": svg_precision,
+    }
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_batch_worker,
+            initargs=(template.to_dict(), TIMINGS.enabled, output_options),
+        ) as pool:
+            results = list(pool.map(
+                _render_batch_item,
+                [job[0] for job in jobs],
+                [job[1] for job in jobs],
+                [job[4] for job in jobs],
+                chunksize=max(1, len(jobs) // (workers * 4)),
+            ))
+    else:
+        _init_batch_worker(template, TIMINGS.enabled, output_options)
+        results = [_render_batch_item(name, raw, path) for name, raw, _, _, path in jobs]
+
+    for (name, _, input_hash, slug, _), result in zip(jobs, results):
+        if "timings" in result:
+            TIMINGS.merge(result.pop("timings"), result.pop("trace_events"))
+        if result["success"]:
+            state[name] = {
+                "input_hash": input_hash,
+                "template_hash": template_hash,
+                "output_path": result["output_path"],
+                "slug": slug,
+            }
+    results += conflicts
+    tmp = state_path.with_suffix(".tmp")
+    with TIMINGS.stage("write:state") as counters:
+        counters["bytes"] = tmp.write_bytes(
+            json.dumps(state, ensure_ascii=False, indent=2).encode("utf-8")
+        )
+        os.replace(tmp, state_path)
+
+    rendered = [r for r in results if r["success"]]
+    failures = [r for r in results if not r["success"]]
+    result = {
+        "success": not failures,
+        "template_hash": template_hash[:16],
+        "rendered": rendered,
+        "skipped": skipped,
+        "failures": failures,
+        "counts": {"rendered": len(rendered), "skipped": len(skipped), "failed": len(failures)},
+        "workers": max(1, workers),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+    svg_sizes = [r["svg"] for r in rendered if "svg" in r]
+    if svg_sizes:
+        result["svg"] = {
+            key: sum(sizes[key] for sizes in svg_sizes) for key in ("bytes_before", "bytes_after")
+        }
+    if assets != "inline" or minify or precompress:
+        totals = {}
+        for r in rendered:
+            for fmt, n in r["bytes"].items():
+                totals[fmt] = totals.get(fmt, 0) + n
+        result["output"] = {
+            "assets": assets, "minify": minify, "precompress": list(precompress),
+            "report_bytes": totals, "asset_files": asset_files,
+        }
+    return result
+
+
+# ── 常駐渲染服務（--serve） ─────────────────────────────
+# 入口網站逐次呼叫本腳本時，每次都要付出直譯器啟動、讀模板與完整渲染的成本。
+# --serve 啟動只聽本機的 HTTP 服務：模板常駐記憶體，檔案 mtime 改變時重新載入；
+# 渲染結果以「輸入 JSON 雜湊 + 輸出設定雜湊」為鍵放在 LRU 快取，ETag 即由此鍵導出，
+# 客戶端帶 If-None-Match 時不必渲染即可回 304。多執行緒處理並行請求，不連外網。
+#
+#   POST /render           請求本文為分析 JSON，回傳 HTML
+#   GET  /report/<slug>    從 --data-dir 讀取 <slug>.json（或 slug 欄位相符者）渲染
+#   GET  /assets/<name>    --assets shared 時的共用 CSS / JS
+#   GET  /health           服務狀態（模板雜湊、快取命中數）
+
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_CACHE_SIZE = 128
+SERVE_MAX_BODY = 16 * 1024 * 1024
+SERVE_ASSET_URL = "/assets"
+_LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+class RenderService:
+    """--serve 的狀態：常駐模板（mtime 改變即重新載入）、slug 索引與渲染結果 LRU 快取。
+    各方法可由多個執行緒同時呼叫。
+    """
+
+    def __init__(
+        self, template_path=TEMPLATE_PATH, data_dir=None, cache_size=SERVE_CACHE_SIZE,
+        assets="inline", minify=False, svg_precision=SVG_PRECISION, quiet=False,
+    ):
+        from collections import OrderedDict
+
+        self.template_path = Path(template_path)
+        self.data_dir = Path(data_dir) if data_dir else None
+        self.cache_size = max(0, cache_size)
+        self.assets = assets
+        self.minify = minify
+        self.svg_precision = svg_precision
+        self.quiet = quiet
+        self.cache = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "reloads": 0}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._template = None
+        self._slug_index = (None, {})
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """模板檔的 mtime / 大小改變時重新載入，回傳 (CompiledTemplate, 共用資產, 輸出設定雜湊)"""
+        stat = self.template_path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        current = self._template
+        if current is None or current[0] != signature:
+            with self._lock:
+                if self._template is None or self._template[0] != signature:
+                    loaded = load_output_template(
+                        self.template_path, self.assets, self.minify, (), SERVE_ASSET_URL,
+                        self.svg_precision,
+                    )
+                    if self._template is not None:
+                        self.stats["reloads"] += 1
+                    self._template = (signature, loaded)
+                current = self._template
+        return current[1]
+
+    def cache_key(self, raw):
+        """快取鍵（亦作為 ETag）：輸入 JSON 雜湊 + 輸出設定雜湊，不必渲染即可比對"""
+        _, _, output_hash = self.reload_if_changed()
+        return f"{_hash_bytes(raw)[:20]}-{output_hash[:12]}"
+
+    def render(self, raw, key=None):
+        """渲染分析 JSON 位元組，回傳 (HTML 位元組, 快取是否命中, warnings)。
+        JSON 無效時拋出 ValueError。
+        """
+        key = key or self.cache_key(raw)
+        template, _, _ = self.reload_if_changed()
+        with self._lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached[0], True, cached[1]
+            self.stats["misses"] += 1
+        try:
+            data = json.loads(raw)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ValueError(f"JSON 無效：{e}") from e
+        if not isinstance(data, dict):
+            raise ValueError("JSON 最外層須為物件")
+        html_output, warnings = render_with_warnings(data, template, self.svg_precision)
+        if self.minify:
+            html_output = minify_html(html_output)
+        body = html_output.encode("utf-8")
+        if self.cache_size:
+            with self._lock:
+                self.cache[key] = (body, warnings)
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return body, False, warnings
+
+    def find_slug(self, slug):
+        """--data-dir 中找出 slug 對應的 JSON：先找 <slug>.json，再比對各檔的 slug 欄位。
+        欄位索引在目錄 mtime 改變（新增、刪除、改名）時重建。
+        """
+        if self.data_dir is None or not re.fullmatch(r"[\w.-]+", slug) or slug.startswith("."):
+            return None
+        direct = self.data_dir / f"{slug}.json"
+        if direct.is_file():
+            return direct
+        mtime = self.data_dir.stat().st_mtime_ns
+        with self._lock:
+            indexed_mtime, index = self._slug_index
+        if indexed_mtime != mtime:
+            index = {}
+            for path in sorted(self.data_dir.glob("*.json")):
+                try:
+                    data = json.loads(path.read_bytes())
+                except (OSError, ValueError):
+                    continue
+                if isinstance(data, dict) and data.get("slug"):
+                    index.setdefault(str(data["slug"]), path)
+            with self._lock:
+                self._slug_index = (mtime, index)
+        return index.get(slug)
+
+    def health(self):
+        template, shared, output_hash = self.reload_if_changed()
+        with self._lock:
+            return {
+                "success": True,
+                "template": str(self.template_path),
+                "template_hash": template.hash[:16],
+                "output_hash": output_hash[:16],
+                "data_dir": str(self.data_dir) if self.data_dir else None,
+                "assets": self.assets,
+                "cache": {"entries": len(self.cache), "size": self.cache_size, **self.stats},
+                "uptime_seconds": round(time.time() - self.started, 1),
+            }
+
+
+def _make_handler(service):
+    from http.server import BaseHTTPRequestHandler
+
+    class RenderHandler(BaseHTTPRequestHandler):
+        server_version = "crisp-render"
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            if not service.quiet:
+                super().log_message(format, *args)
+
+        def _send(self, status, body=b"", content_type=None, headers=None, head=False):
+            self.send_response(status)
+            if content_type:
+                self.send_header("Content-Type", content_type)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body and not head:
+                self.wfile.write(body)
+
+        def _send_error(self, status, message):
+            body = json.dumps({"success": False, "error": message}, ensure_ascii=False)
+            self._send(status, body.encode("utf-8"), "application/json; charset=utf-8")
+
+        def _send_report(self, raw, head=False):
+            key = service.cache_key(raw)
+            # gzip 與未壓縮的回應位元組不同，各用不同的強 ETag；兩者皆由同一鍵導出，
+            # 客戶端持有其中任一份且鍵未變時都可回 304
+            etag, gzip_etag = f'"{key}"', f'"{key}-gzip"'
+            tags = {t.strip() for t in self.headers.get("If-None-Match", "").split(",")}
+            matched = etag if etag in tags else gzip_etag if gzip_etag in tags else None
+            if matched:
+                with service._lock:
+                    service.stats["not_modified"] += 1
+                self._send(304, headers={
+                    "ETag": matched, "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+                })
+                return
+            start_time = time.perf_counter()
+            try:
+                body, hit, warnings = service.render(raw, key)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            headers = {
+                "ETag": etag,
+                "Cache-Control": "no-cache",
+                "Vary": "Accept-Encoding",
+                "X-Render-Cache": "hit" if hit else "miss",
+                "Server-Timing": f"render;dur={(time.perf_counter() - start_time) * 1000:.1f}",
+            }
+            if warnings:
+                headers["X-Render-Warnings"] = json.dumps(warnings)  # ASCII，標頭需 latin-1
+            accepts = self.headers.get("Accept-Encoding", "")
+            if "gzip" in accepts and len(body) > 1024:
+                body = precompress_bytes(body, "gz")
+                headers["Content-Encoding"] = "gzip"
+                headers["ETag"] = gzip_etag
+            self._send(200, body, "text/html; charset=utf-8", headers, head)
+
+        def _route_get(self, head=False):
+            path = self.path.split("?", 1)[0]
+            try:
+                if path == "/health":
+                    body = json.dumps(service.health(), ensure_ascii=False).encode("utf-8")
+                    self._send(200, body, "application/json; charset=utf-8", head=head)
+                elif path.startswith("/report/"):
+                    from urllib.parse import unquote
+
+                    slug = unquote(path[len("/report/"):]).removesuffix(".html")
+                    source = service.find_slug(slug)
+                    if source is None:
+                        self._send_error(404, f"找不到報告：{slug}")
+                        return
+                    self._send_report(source.read_bytes(), head)
+                elif path.startswith(SERVE_ASSET_URL + "/"):
+                    _, shared, _ = service.reload_if_changed()
+                    content = shared.get(path[len(SERVE_ASSET_URL) + 1:])
+                    if content is None:
+                        self._send_error(404, f"找不到資產：{path}")
+                        return
+                    content_type = "text/css" if path.endswith(".css") else "text/javascript"
+                    self._send(
+                        200, content.encode("utf-8"), f"{content_type}; charset=utf-8",
+                        {"Cache-Control": "public, max-age=31536000, immutable"}, head,
+                    )
+                else:
+                    self._send_error(404, f"未知路徑：{path}")
+            except OSError as e:
+                self._send_error(500, f"{type(e).__name__}: {e}")
+
+        def do_GET(self):
+            self._route_get()
+
+        def do_HEAD(self):
+            self._route_get(head=True)
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0] != "/render":
+                self._send_error(404, f"未知路徑：{self.path}")
+                return
+            try:
+                length = int(self.headers.get("Content-Length", ""))
+            except ValueError:
+                self._send_error(411, "需要 Content-Length")
+                return
+            if length > SERVE_MAX_BODY:
+                self._send_error(413, f"請求本文超過 {SERVE_MAX_BODY // (1024 * 1024)} MB")
+                return
+            try:
+                self._send_report(self.rfile.read(length))
+            except OSError as e:
+                self._send_error(500, f"{type(e).__name__}: {e}")
+
+    return RenderHandler
+
+
+def serve(service, host=SERVE_HOST, port=SERVE_PORT):
+    """啟動服務直到 Ctrl-C；只接受本機位址"""
+    from http.server import ThreadingHTTPServer
+    import socket
+
+    if host not in _LOOPBACK_HOSTS:
+        raise ValueError(f"--serve 只聽本機位址（{', '.join(_LOOPBACK_HOSTS)}），不接受：{host}")
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        address_family = socket.AF_INET6 if ":" in host else socket.AF_INET
+
+    httpd = Server((host, port), _make_handler(service))
+    bound_host, bound_port = httpd.server_address[:2]
+    url_host = f"[{bound_host}]" if ":" in bound_host else bound_host
+    print(json.dumps({
+        "success": True,
+        "url": f"http://{url_host}:{bound_port}",
+        "template": str(service.template_path),
+        "data_dir": str(service.data_dir) if service.data_dir else None,
+    }, ensure_ascii=False), flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def _svg_sizes(svg_report):
+    """輸出 JSON 中的 SVG 最佳化摘要（問題另列於 warnings.svg）"""
+    return {k: v for k, v in svg_report.items() if k not in ("issues", "fallback")}
+
+
+def _with_timings(result, trace_path=None):
+    """--timings：於輸出 JSON 附上量測結果；指定 trace_path 時同時寫出 Chrome trace"""
+    if TIMINGS.enabled:
+        result["timings"] = TIMINGS.report()
+        if trace_path:
+            TIMINGS.write_trace(trace_path)
+            result["timings"]["trace_path"] = str(trace_path)
     return result
 
 
 def main():
     parser = argparse.ArgumentParser(description="CRISP 閱讀解構師：HTML 報告渲染")
-    parser.add_argument("input", help="分析結果 JSON 檔案路徑，或 - 從 stdin 讀取")
+    parser.add_argument("input", nargs="?", help="分析結果 JSON 檔案路徑，或 - 從 stdin 讀取")
     parser.add_argument("--output", "-o", help="輸出 HTML 路徑")
     parser.add_argument("--template", "-t", help="自訂模板路徑（預設使用內建模板）")
+    parser.add_argument(
+        "--batch", metavar="SOURCE",
+        help="批次渲染：目錄、glob 樣式，或 - 從 stdin 讀取 NDJSON",
+    )
+    parser.add_argument("--output-dir", "-O", help="批次輸出目錄（預設目前目錄）")
+    parser.add_argument("--workers", "-j", type=int, default=1, help="批次平行渲染的行程數")
+    parser.add_argument("--force", action="store_true", help="批次模式忽略記錄，全部重建")
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="於輸出 JSON 附上各階段耗時、CPU 時間、峰值記憶體與寫出位元組",
+    )
+    parser.add_argument(
+        "--trace", metavar="PATH", help="另寫出 Chrome trace 格式檔（chrome://tracing、Perfetto）；隱含 --timings"
+    )
+    parser.add_argument(
+        "--assets", choices=ASSET_MODES, default="inline",
+        help="inline：CSS / JS 內嵌於每份報告（預設，單檔可攜）；"
+        "shared：抽成以內容雜湊命名的共用檔，報告只引用",
+    )
+    parser.add_argument(
+        "--assets-dir", help="共用資產目錄（預設為報告所在目錄下的 assets/）"
+    )
+    parser.add_argument(
+        "--assets-url", help="報告引用共用資產的 URL 前綴（預設為相對於報告的路徑，如 /static/crisp）"
+    )
+    parser.add_argument("--minify", action="store_true", help="壓縮輸出的 HTML 與 CSS / JS")
+    parser.add_argument(
+        "--precompress", metavar="FORMATS",
+        help="另寫出預先壓縮檔：gz、br 或 gz,br（br 需安裝 brotli）",
+    )
+    parser.add_argument(
+        "--svg-precision", type=int, default=SVG_PRECISION, choices=range(0, 7), metavar="N",
+        help=f"概念關係圖座標保留的小數位數（0-6，預設 {SVG_PRECISION}）",
+    )
+    parser.add_argument(
+        "--no-svg-optimize", action="store_true", help="概念關係圖 SVG 原樣填入，不最佳化與驗證"
+    )
+    parser.add_argument(
+        "--serve", action="store_true",
+        help="常駐 HTTP 渲染服務（只聽本機）：POST /render 或 GET /report/<slug>",
+    )
+    parser.add_argument("--host", default=SERVE_HOST, help=f"服務位址（預設 {SERVE_HOST}，只接受本機）")
+    parser.add_argument("--port", type=int, default=SERVE_PORT, help=f"服務埠號（預設 {SERVE_PORT}，0 為自動）")
+    parser.add_argument("--data-dir", help="GET /report/<slug> 讀取分析 JSON 的目錄")
+    parser.add_argument(
+        "--cache-size", type=int, default=SERVE_CACHE_SIZE,
+        help=f"服務快取的報告份數（預設 {SERVE_CACHE_SIZE}，0 為不快取）",
+    )
+    parser.add_argument("--quiet", "-q", action="store_true", help="服務不輸出逐筆請求記錄")
     args = parser.parse_args()
+    TIMINGS.enabled = bool(args.timings or args.trace)
+    svg_precision = None if args.no_svg_optimize else args.svg_precision
+    try:
+        precompress, precompress_warning = check_precompress(
+            args.precompress.split(",") if args.precompress else []
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.serve:
+        template_path = Path(args.template) if args.template else TEMPLATE_PATH
+        error = None
+        if not template_path.is_file():
+            error = f"找不到模板：{template_path}"
+        elif args.data_dir and not Path(args.data_dir).is_dir():
+            error = f"找不到目錄：{args.data_dir}"
+        if error:
+            print(json.dumps({"success": False, "error": error}, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
+        service = RenderService(
+            template_path, args.data_dir, args.cache_size,
+            assets=args.assets, minify=args.minify, svg_precision=svg_precision, quiet=args.quiet,
+        )
+        try:
+            serve(service, args.host, args.port)
+        except (ValueError, OSError) as e:
+            print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.batch:
+        template_path = Path(args.template) if args.template else TEMPLATE_PATH
+        if not template_path.is_file():
+            print(
+                json.dumps({"success": False, "error": f"找不到模板：{template_path}"}),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        result = render_batch(
+            args.batch, args.output_dir or Path.cwd(), template_path, args.workers, args.force,
+            assets=args.assets, minify=args.minify, precompress=precompress,
+            assets_dir=args.assets_dir, asset_url=args.assets_url, svg_precision=svg_precision,
+        )
+        if precompress_warning:
+            result.setdefault("warnings", {})["precompress"] = precompress_warning
+        print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False, indent=2))
+        if not result["success"]:
+            sys.exit(1)
+        return
+    if not args.input:
+        parser.error("需要指定分析結果 JSON（或使用 --batch）")
 
     # 讀取 JSON
     if args.input == "-":
-        data = json.loads(sys.stdin.read())
+        with TIMINGS.stage("read:input"):
+            data = json.loads(sys.stdin.read())
     else:
         input_path = Path(args.input)
         if not input_path.is_file():
             print(json.dumps({"success": False, "error": f"找不到：{args.input}"}), file=sys.stderr)
             sys.exit(1)
-        data = json.loads(input_path.read_text(encoding="utf-8"))
+        with TIMINGS.stage("read:input"):
+            data = json.loads(input_path.read_text(encoding="utf-8"))
 
     # 讀取模板
     template_path = Path(args.template) if args.template else TEMPLATE_PATH
@@ -366,22 +1631,41 @@ def main():
             file=sys.stderr,
         )
         sys.exit(1)
-    template_text = template_path.read_text(encoding="utf-8")
-
-    # 渲染
-    html_output = render(data, template_text)
 
-    # 輸出
+    # 輸出路徑
     if args.output:
         output_path = Path(args.output)
-        output_path.write_text(html_output, encoding="utf-8")
-        print(json.dumps({"success": True, "output_path": str(output_path)}, ensure_ascii=False))
     else:
         # 自動命名
         slug = data.get("slug", "book")
         output_path = Path.cwd() / f"reading-report-{slug}.html"
-        output_path.write_text(html_output, encoding="utf-8")
-        print(json.dumps({"success": True, "output_path": str(output_path)}, ensure_ascii=False))
+    assets_dir = Path(args.assets_dir) if args.assets_dir else output_path.parent / "assets"
+    asset_url = args.assets_url or Path(os.path.relpath(assets_dir, output_path.parent)).as_posix()
+    template, shared, _ = load_output_template(
+        template_path, args.assets, args.minify, precompress, asset_url, svg_precision
+    )
+
+    # 渲染
+    svg_report = {}
+    html_output, warnings = render_with_warnings(data, template, svg_precision, svg_report)
+    if args.minify:
+        with TIMINGS.stage("render:minify"):
+            html_output = minify_html(html_output)
+
+    # 輸出
+    sizes = write_output(output_path, html_output, precompress)
+    result = {"success": True, "output_path": str(output_path)}
+    if args.assets != "inline" or args.minify or precompress:
+        result["bytes"] = sizes
+    if shared:
+        result["asset_files"] = write_assets(shared, assets_dir, precompress)
+    if svg_report:
+        result["svg"] = _svg_sizes(svg_report)
+    if warnings:
+        result["warnings"] = warnings
+    if precompress_warning:
+        result.setdefault("warnings", {})["precompress"] = precompress_warning
+    print(json.dumps(_with_timings(result, args.trace), ensure_ascii=False))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""
+逐階段效能量測（--timings / --trace），由 extract-text.py、render-report.py 共用，
+benchmark-suite.py 另用 peak_rss_mb()。各腳本以 importlib 載入本檔，不需安裝。
+
+各階段以 TIMINGS.stage(名稱) 包住；未啟用時只回傳 nullcontext，幾乎沒有額外成本。
+啟用時累計各階段的 wall / CPU 時間與呼叫端填入的計數（counters，如處理頁數、寫出位元組），
+並記錄 Chrome trace 事件（chrome://tracing 或 Perfetto 可開啟）。
+worker 行程內另起一份量測，完成後以 merge() 併回主行程。
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows：不回報峰值記憶體
+    resource = None
+
+
+def peak_rss_mb(who=None):
+    """峰值常駐記憶體（MB）；who 為 resource.RUSAGE_* 常數，預設本行程"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # Linux 為 KB，macOS 為 bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Timings:
+    """逐階段量測；stage() 產生的 dict 可由呼叫端填入 counters 所列的計數。
+    子類別以 counters 指定計數欄位，並覆寫 totals() 加入各工具的彙總欄位。"""
+
+    counters = ("pages", "bytes")
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.events = []
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def _new_counters(self, pages):
+        counters = dict.fromkeys(self.counters, 0)
+        if "pages" in counters:
+            counters["pages"] = pages
+        return counters
+
+    def stage(self, name, pages=0):
+        if not self.enabled:
+            # 每次各給一份計數 dict：呼叫端會以 += 累加，不可共用
+            return nullcontext(self._new_counters(pages))
+        return self._measure(name, pages)
+
+    @contextmanager
+    def _measure(self, name, pages):
+        counters = self._new_counters(pages)
+        started = time.time()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counters
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self.add(name, {"count": 1, "wall_seconds": wall, "cpu_seconds": cpu, **counters})
+            self.events.append({
+                "name": name, "cat": "stage", "ph": "X", "pid": os.getpid(), "tid": 0,
+                "ts": int(started * 1e6), "dur": int(wall * 1e6),
+                "args": {k: v for k, v in counters.items() if v},
+            })
+
+    def add(self, name, totals):
+        stage = self.stages.setdefault(
+            name, {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, **dict.fromkeys(self.counters, 0)}
+        )
+        for key, value in totals.items():
+            stage[key] += value
+
+    def merge(self, summary, events=()):
+        """併入另一份量測（worker 行程回傳的 summary() 與 trace 事件）"""
+        for name, totals in summary.items():
+            self.add(name, totals)
+        self.events.extend(events)
+
+    def summary(self):
+        return {
+            name: {k: round(v, 4) if isinstance(v, float) else v for k, v in stage.items()}
+            for name, stage in self.stages.items()
+        }
+
+    def totals(self, stages):
+        """report() 中各工具自訂的彙總欄位"""
+        return {}
+
+    def report(self):
+        """附加到輸出 JSON 的量測結果"""
+        stages = self.summary()
+        report = {
+            "wall_seconds": round(time.perf_counter() - self.wall_start, 3),
+            "cpu_seconds": round(time.process_time() - self.cpu_start, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            **self.totals(stages),
+            "bytes_written": sum(
+                stage["bytes"] for name, stage in stages.items() if name.startswith("write")
+            ),
+            "stages": stages,
+        }
+        if resource is not None:
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            if children.ru_utime or children.ru_stime:
+                report["children_cpu_seconds"] = round(children.ru_utime + children.ru_stime, 3)
+                report["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return report
+
+    def write_trace(self, path):
+        """寫出 Chrome trace 格式（JSON Object Format）"""
+        trace = {"traceEvents": self.events, "displayTimeUnit": "ms"}
+        Path(path).write_text(json.dumps(trace, ensure_ascii=False), encoding="utf-8")
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+收件資料夾監看：自動對放入的 PDF / EPUB 依序執行 info → 目錄 → 分塊提取，
+取代逐本手動執行 extract-text.py --info、--toc、--chunk-size。
+
+用法：
+  python watch-folder.py inbox/ --output-dir processed/                 # 常駐監看（Ctrl-C 停止）
+  python watch-folder.py inbox/ --output-dir processed/ --workers 4 --chunk-by toc:1
+  python watch-folder.py inbox/ --output-dir processed/ --once          # 處理完目前的檔案即結束（適合排程）
+
+檔案偵測：每 --interval 秒掃描一次收件資料夾（不含子目錄與 . 開頭的檔案）；
+大小與修改時間連續兩次掃描不變、且已 --settle 秒未變動時才視為寫入完成，複製中的檔案不會被處理。
+
+輸出：每本書一個子目錄 <output-dir>/<檔名>/，內含 info.json、toc.json 與 chunks/（含 .chunk-manifest.json）。
+
+狀態檔 <output-dir>/watch-status.json 同時是持久化佇列：記錄每本書的狀態（queued / running / done / failed）、
+各階段耗時與結果、錯誤訊息，每次狀態變化即以原子方式寫入。重新啟動時：
+  - 已完成的書（大小、修改時間或內容雜湊未變，且分塊選項相同）不會重做；
+  - 中斷時執行中的書從未完成的階段接續，分塊階段依 .chunk-manifest.json 只重做未完成的分塊；
+  - 失敗的書不自動重試（加 --retry-failed 重試），來源檔更新後則重新排入佇列；
+  - 排隊中或失敗的書若來源檔已自收件資料夾移除，即自狀態檔刪除（已完成的書保留紀錄）。
+
+排程：--workers 個行程平行處理，每本書同時只執行一個階段。info 與目錄階段成本低，優先執行；
+分塊階段依預估 token 數由小到大排程，並隨等待時間調降優先序（等越久越優先），大書不會無限期等待。
+預估超過 --large-book-tokens 的大書最多同時佔用 workers - 1 個行程，保留至少一個行程給小書。
+
+一個輸出目錄同時只應有一個 watch-folder 執行。
+
+輸出：NDJSON 事件至 stdout（queued / started / finished / failed / removed / stopped），結束時輸出統計
+"""
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import sys
+import time
+from pathlib import Path
+
+
+STATUS_FILE = "watch-status.json"
+STATUS_VERSION = 1
+WATCH_SUFFIXES = (".pdf", ".epub")
+STAGES = ("info", "toc", "chunk")
+DEFAULT_INTERVAL = 5.0       # 秒
+DEFAULT_SETTLE = 10.0        # 秒
+DEFAULT_MAX_TOKENS = 60000   # 與 gutenberg-library.py batch 相同
+LARGE_BOOK_TOKENS = 200000
+AGING_SECONDS = 300.0        # 排程老化：分塊成本除以 (1 + 等待秒數 / AGING_SECONDS)
+
+_spec = importlib.util.spec_from_file_location(
+    "extract_text", Path(__file__).resolve().parent / "extract-text.py"
+)
+extract_text = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(extract_text)
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+
+def _write_json(path, data):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ── 各階段（於 worker 行程執行，須為模組層級函式才能 pickle）──────────────
+
+def _worker_init():
+    # Ctrl-C 由主行程處理（先等執行中的階段完成），worker 不直接中斷；SIGTERM 維持預設，供強制結束
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def run_stage(stage, source, book_dir, options, gateway=None, fresh=False):
+    """執行單一階段並寫出結果檔，回傳摘要（success、seconds 與各階段的關鍵數字）。
+    fresh 時（來源檔已替換或分塊選項改變）先清空 chunks/，舊計畫的分塊不與新分塊並存。"""
+    start_time = time.perf_counter()
+    book_dir = Path(book_dir)
+    book_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        if stage == "info":
+            result = extract_text.get_pdf_info(source)
+            _write_json(book_dir / "info.json", result)
+            summary = {
+                key: result[key]
+                for key in ("page_count", "estimated_tokens", "suggested_chunks")
+                if key in result
+            }
+        elif stage == "toc":
+            result = extract_text.get_toc(source)
+            _write_json(book_dir / "toc.json", result)
+            summary = {"entries": len(result.get("toc") or [])}
+        else:
+            if fresh:
+                shutil.rmtree(book_dir / "chunks", ignore_errors=True)
+            # 每本書單一行程提取（平行度在書與書之間）；resume 讓中斷的分塊階段從未完成的分塊接續
+            result = extract_text.chunk_extract(
+                source, options["chunk_size"], str(book_dir / "chunks"),
+                gateway if source.lower().endswith(".pdf") else None,
+                max_tokens=options["max_tokens"], toc_level=options["toc_level"], use_cache=True,
+                profile=options["profile"], strip_boilerplate=options["strip_boilerplate"],
+                resume=True,
+            )
+            extract_text.cache_evict()  # 寫入快取時不淘汰，每本書提取完掃描一次
+            summary = {
+                "chunks": len(result.get("chunks") or []),
+                "resumed_chunks": result.get("resumed_chunks", 0),
+                "output_dir": str(book_dir / "chunks"),
+            }
+            if result.get("failed_chunks"):
+                summary["failed_chunks"] = result["failed_chunks"]
+                result.setdefault("error", f"{len(result['failed_chunks'])} 個分塊提取失敗")
+    except Exception as e:  # 單本書失敗不影響其他書
+        result, summary = {"success": False, "error": f"{type(e).__name__}: {e}"}, {}
+    summary["success"] = bool(result.get("success"))
+    if not summary["success"]:
+        summary["error"] = result.get("error") or "未知錯誤"
+    summary["seconds"] = round(time.perf_counter() - start_time, 3)
+    return summary
+
+
+# ── 佇列與排程 ──────────────────────────────────────────
+
+class WatchQueue:
+    """收件資料夾的持久化佇列：掃描、排程、接收階段結果並維護 watch-status.json。
+    狀態檔只由主行程寫入；worker 只回傳各階段摘要。"""
+
+    def __init__(
+        self, intake, output_dir, options, workers=1, settle=DEFAULT_SETTLE, retries=1,
+        large_book_tokens=LARGE_BOOK_TOKENS, retry_failed=False, gateway=None, emit=None,
+    ):
+        self.intake = Path(intake).resolve()
+        self.output_dir = Path(output_dir).resolve()
+        self.options = options
+        self.workers = max(1, workers)
+        self.settle = settle
+        self.retries = retries
+        self.large_book_tokens = large_book_tokens
+        self.gateway = gateway
+        self.emit = emit or (lambda event: None)
+        self.status_path = self.output_dir / STATUS_FILE
+        self.settling = {}      # 檔名 → ((大小, 修改時間), 首次看到此簽章的 monotonic 時間)
+        self.running = {}       # 檔名 → 階段
+        self.ready_since = {}   # 檔名 → 可執行下一階段的 monotonic 時間（排程老化用）
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.books = self._load(retry_failed)
+
+    def _load(self, retry_failed):
+        try:
+            status = json.loads(self.status_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if status.get("version") != STATUS_VERSION:
+            return {}
+        books = status.get("books", {})
+        now = time.monotonic()
+        for name, entry in books.items():
+            if entry["state"] == "running":  # 上次中斷：從未完成的階段接續，中斷的嘗試不計入重試次數
+                entry["state"] = "queued"
+                stage = entry.pop("stage", None)
+                if entry["attempts"].get(stage):
+                    entry["attempts"][stage] -= 1
+            if entry.get("options") != self.options:
+                entry["fresh_chunks"] = True  # 分塊選項改變：舊分塊不可沿用，重做時先清空
+                if entry["state"] == "done":
+                    entry["stages"].pop("chunk", None)  # 只重做分塊
+                    entry["state"] = "queued"
+            if retry_failed and entry["state"] == "failed":
+                entry["state"] = "queued"
+                entry["attempts"] = {}
+                entry.pop("error", None)
+            if entry["state"] == "queued":
+                entry["options"] = self.options
+                self.ready_since[name] = now
+        return books
+
+    def counts(self):
+        counts = {state: 0 for state in ("queued", "running", "done", "failed")}
+        for entry in self.books.values():
+            counts[entry["state"]] += 1
+        return counts
+
+    def save(self):
+        _write_json(self.status_path, {
+            "version": STATUS_VERSION,
+            "intake": str(self.intake),
+            "output_dir": str(self.output_dir),
+            "updated": _now(),
+            "counts": self.counts(),
+            "books": self.books,
+        })
+
+    def _book_dir(self, name):
+        path = Path(name)
+        taken = {entry["output_dir"] for other, entry in self.books.items() if other != name}
+        candidate = self.output_dir / path.stem
+        if str(candidate) in taken:  # 同名不同格式（book.pdf 與 book.epub）
+            candidate = self.output_dir / f"{path.stem}-{path.suffix.lstrip('.').lower()}"
+        return str(candidate)
+
+    # 偵測
+
+    def scan(self):
+        """掃描收件資料夾，把寫入完成的新檔案或已更新的檔案排入佇列；
+        來源檔已移除的排隊中或失敗的書自佇列刪除（不再重試到失敗）"""
+        now = time.monotonic()
+        seen = set()
+        changed = False
+        for path in sorted(self.intake.iterdir()):
+            name = path.name
+            if name.startswith(".") or path.suffix.lower() not in WATCH_SUFFIXES:
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.is_file():
+                continue
+            seen.add(name)
+            signature = (st.st_size, st.st_mtime_ns)
+            entry = self.books.get(name)
+            if st.st_size == 0 or entry and (entry["size"], entry["mtime_ns"]) == signature:
+                continue  # 剛建立尚未寫入，或已知且未變更
+            previous = self.settling.get(name)
+            if previous is None or previous[0] != signature:
+                self.settling[name] = (signature, now)
+                continue
+            # 連續兩次掃描相同，且檔案本身或觀察期已超過 settle 秒
+            idle = max(now - previous[1], time.time() - st.st_mtime_ns / 1e9)
+            if idle < self.settle:
+                continue
+            del self.settling[name]
+            changed |= self._enqueue(path, signature, entry)
+        for name in list(self.settling):
+            if name not in seen:
+                del self.settling[name]
+        for name, entry in list(self.books.items()):
+            if name not in seen and name not in self.running and entry["state"] in ("queued", "failed"):
+                del self.books[name]
+                self.ready_since.pop(name, None)
+                self.emit({"event": "removed", "book": name})
+                changed = True
+        if changed:
+            self.save()
+
+    def _enqueue(self, path, signature, entry):
+        name = path.name
+        try:
+            digest = extract_text.cache_file_hash(path)
+        except OSError:
+            return False
+        if entry and entry.get("sha256") == digest:
+            # 只是修改時間變了（如 touch）：沿用既有狀態
+            entry["size"], entry["mtime_ns"] = signature
+            return True
+        if name in self.running:  # 處理中途被替換：等目前階段結束後再排入
+            return False
+        self.books[name] = {
+            "source": str(path.resolve()),
+            "size": signature[0],
+            "mtime_ns": signature[1],
+            "sha256": digest,
+            "output_dir": self._book_dir(name),
+            "state": "queued",
+            "options": self.options,
+            "queued_at": _now(),
+            "stages": {},
+            "attempts": {},
+            "fresh_chunks": True,  # 新書或替換的來源檔：輸出目錄可能留有舊分塊
+        }
+        self.ready_since[name] = time.monotonic()
+        self.emit({"event": "queued", "book": name, "size": signature[0]})
+        return True
+
+    # 排程
+
+    def _next_stage(self, entry):
+        for stage in STAGES:
+            if not entry["stages"].get(stage, {}).get("success"):
+                return stage
+        return None
+
+    def _cost(self, entry, stage):
+        """排程成本：info / 目錄為 0（優先），分塊為預估 token 數"""
+        if stage != "chunk":
+            return 0
+        info = entry["stages"].get("info", {})
+        return info.get("estimated_tokens") or entry["size"] // 100
+
+    def _is_large(self, entry, stage):
+        return stage == "chunk" and self._cost(entry, stage) >= self.large_book_tokens
+
+    def next_job(self):
+        """挑選下一個要執行的 (檔名, 階段)；沒有可執行的工作時回傳 None"""
+        if len(self.running) >= self.workers:
+            return None
+        large_slots = max(1, self.workers - 1)
+        running_large = sum(
+            1 for name, stage in self.running.items() if self._is_large(self.books[name], stage)
+        )
+        now = time.monotonic()
+        best, best_priority = None, None
+        for name, entry in self.books.items():
+            if entry["state"] != "queued" or name in self.running:
+                continue
+            stage = self._next_stage(entry)
+            if stage is None:
+                continue
+            if self._is_large(entry, stage) and running_large >= large_slots:
+                continue
+            waited = now - self.ready_since.get(name, now)
+            priority = (self._cost(entry, stage) / (1 + waited / AGING_SECONDS), entry["queued_at"], name)
+            if best_priority is None or priority < best_priority:
+                best, best_priority = (name, stage), priority
+        return best
+
+    def start(self, name, stage):
+        entry = self.books[name]
+        self.running[name] = stage
+        entry["state"] = "running"
+        entry["stage"] = stage
+        entry.setdefault("started_at", _now())
+        entry["attempts"][stage] = entry["attempts"].get(stage, 0) + 1
+        # 只在第一次執行分塊時清空；之後的重試與中斷後的接續沿用新計畫已完成的分塊
+        fresh = stage == "chunk" and bool(entry.pop("fresh_chunks", False))
+        self.save()
+        self.emit({"event": "started", "book": name, "stage": stage})
+        return entry["source"], entry["output_dir"], fresh
+
+    def finish(self, name, stage, summary):
+        """記錄階段結果：成功則排入下一階段或完成，失敗則依 retries 重試或標記失敗"""
+        self.running.pop(name, None)
+        entry = self.books[name]
+        entry["stages"][stage] = summary
+        entry.pop("stage", None)
+        self.ready_since[name] = time.monotonic()
+        if summary["success"]:
+            entry.pop("error", None)
+            if self._next_stage(entry) is None:
+                entry["state"] = "done"
+                entry["finished_at"] = _now()
+                entry["seconds"] = round(sum(s.get("seconds", 0) for s in entry["stages"].values()), 3)
+                self.emit({"event": "finished", "book": name, "seconds": entry["seconds"]})
+            else:
+                entry["state"] = "queued"
+        elif entry["attempts"].get(stage, 0) <= self.retries:
+            entry["state"] = "queued"
+            entry["error"] = summary["error"]
+        else:
+            entry["state"] = "failed"
+            entry["error"] = summary["error"]
+            entry["finished_at"] = _now()
+            self.emit({"event": "failed", "book": name, "stage": stage, "error": summary["error"]})
+        self.save()
+
+    def idle(self):
+        """沒有執行中、排隊中或等待寫入完成的書"""
+        return (
+            not self.running and not self.settling
+            and not any(e["state"] == "queued" for e in self.books.values())
+        )
+
+
+def watch(watch_queue, interval=DEFAULT_INTERVAL, once=False):
+    """主迴圈：掃描 → 派工 → 等待結果。第一次 Ctrl-C / SIGTERM 停止派工並等執行中的階段完成，
+    第二次立即結束（執行中的書下次啟動時接續）。"""
+    stopping = []
+
+    def request_stop(signum, frame):
+        if stopping:
+            raise KeyboardInterrupt
+        stopping.append(signum)
+        watch_queue.emit({"event": "stopping", "running": sorted(watch_queue.running)})
+
+    results = queue.Queue()
+    pool = multiprocessing.Pool(watch_queue.workers, initializer=_worker_init)
+    previous_handlers = {
+        sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+        next_scan = 0.0
+        while True:
+            if not stopping and time.monotonic() >= next_scan:
+                watch_queue.scan()
+                next_scan = time.monotonic() + interval
+            while not stopping:
+                job = watch_queue.next_job()
+                if job is None:
+                    break
+                name, stage = job
+                source, book_dir, fresh = watch_queue.start(name, stage)
+                pool.apply_async(
+                    run_stage,
+                    (stage, source, book_dir, watch_queue.options, watch_queue.gateway, fresh),
+                    callback=lambda summary, job=job: results.put((*job, summary)),
+                    error_callback=lambda e, job=job: results.put(
+                        (*job, {"success": False, "error": f"{type(e).__name__}: {e}", "seconds": 0})
+                    ),
+                )
+            if stopping and not watch_queue.running or once and watch_queue.idle():
+                break
+            try:
+                name, stage, summary = results.get(timeout=max(0.1, next_scan - time.monotonic()))
+            except queue.Empty:
+                continue
+            watch_queue.finish(name, stage, summary)
+            while True:  # 一次處理所有已完成的結果
+                try:
+                    watch_queue.finish(*results.get_nowait())
+                except queue.Empty:
+                    break
+        pool.close()
+        pool.join()
+    except KeyboardInterrupt:
+        pool.terminate()
+        watch_queue.save()
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    return watch_queue.counts()
+
+
+def _fail(message):
+    print(json.dumps({"success": False, "error": message}, ensure_ascii=False), file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRISP 閱讀解構師：收件資料夾監看與批次提取")
+    parser.add_argument("intake", help="收件資料夾（放入 PDF / EPUB）")
+    parser.add_argument("--output-dir", "-O", required=True, help="輸出目錄（每本書一個子目錄與 watch-status.json）")
+    parser.add_argument("--workers", "-j", type=int, default=1, help="平行處理的行程數（預設 1）")
+    parser.add_argument(
+        "--interval", type=float, default=DEFAULT_INTERVAL, help=f"掃描間隔秒數（預設 {DEFAULT_INTERVAL:g}）"
+    )
+    parser.add_argument(
+        "--settle", type=float, default=DEFAULT_SETTLE,
+        help=f"檔案需靜止多少秒才視為寫入完成（預設 {DEFAULT_SETTLE:g}）",
+    )
+    parser.add_argument("--once", action="store_true", help="處理完目前的檔案即結束，不常駐")
+    parser.add_argument("--retries", type=int, default=1, help="各階段失敗時的重試次數（預設 1）")
+    parser.add_argument("--retry-failed", action="store_true", help="重試狀態檔中先前失敗的書")
+    parser.add_argument("--chunk-size", type=int, help="分塊頁數")
+    parser.add_argument(
+        "--max-tokens-per-chunk", type=int,
+        help=f"每塊 token 預算（未指定 --chunk-size 時預設 {DEFAULT_MAX_TOKENS}）",
+    )
+    parser.add_argument("--chunk-by", help="依目錄章節分塊，如 toc 或 toc:2")
+    parser.add_argument(
+        "--profile", choices=("faithful", "balanced", "fast"), default="faithful",
+        help="PDF 轉換模式（同 extract-text.py --profile）",
+    )
+    parser.add_argument("--strip-boilerplate", action="store_true", help="去除每頁重複的書眉、頁碼、頁尾")
+    parser.add_argument(
+        "--large-book-tokens", type=int, default=LARGE_BOOK_TOKENS,
+        help=f"預估超過此 token 數的書視為大書，最多佔用 workers - 1 個行程（預設 {LARGE_BOOK_TOKENS}）",
+    )
+    parser.add_argument("--quiet", "-q", action="store_true", help="不輸出事件，只輸出結束時的統計")
+    args = parser.parse_args()
+
+    intake = Path(args.intake)
+    if not intake.is_dir():
+        _fail(f"找不到收件資料夾：{intake}")
+    toc_level = None
+    if args.chunk_by:
+        mode, _, level = args.chunk_by.partition(":")
+        if mode != "toc" or (level and not level.isdigit()):
+            parser.error("--chunk-by 格式為 toc 或 toc:<層級>")
+        toc_level = int(level or 1)
+
+    # 與 extract-text.py 相同：gateway 只用於 faithful 模式的 PDF 分塊
+    gateway = extract_text.find_gateway() if args.profile == "faithful" else None
+    # token 預算優先於 --chunk-size，預設值只在未指定 --chunk-size 時套用
+    max_tokens = args.max_tokens_per_chunk
+    if max_tokens is None and not args.chunk_size:
+        max_tokens = DEFAULT_MAX_TOKENS
+    options = {
+        "chunk_size": args.chunk_size,
+        "max_tokens": max_tokens,
+        "toc_level": toc_level,
+        "profile": args.profile,
+        "strip_boilerplate": args.strip_boilerplate,
+    }
+
+    def emit(event):
+        if not args.quiet:
+            print(json.dumps({"time": _now(), **event}, ensure_ascii=False), flush=True)
+
+    start_time = time.perf_counter()
+    try:
+        watch_queue = WatchQueue(
+            intake, args.output_dir, options, args.workers, args.settle, args.retries,
+            args.large_book_tokens, args.retry_failed, gateway, emit,
+        )
+        counts = watch(watch_queue, args.interval, args.once)
+    except OSError as e:
+        _fail(f"{type(e).__name__}: {e}")
+    print(json.dumps({
+        "event": "stopped",
+        "success": not counts.get("failed"),
+        "counts": counts,
+        "status": str(watch_queue.status_path),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()